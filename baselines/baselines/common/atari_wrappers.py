@@ -4,14 +4,19 @@ from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
 from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
 import numpy as np
 import os
+import re
 os.environ.setdefault('PATH', '')
 from collections import deque, Counter
 import gym
 from gym import spaces
 from gym.wrappers import TimeLimit
 from gym.envs.atari import AtariEnv
-import cv2
-cv2.ocl.setUseOpenCL(False)
+try:
+    import cv2
+    cv2.ocl.setUseOpenCL(False)
+except ImportError:
+    # Only WarpFrame needs OpenCV; Toybox84 envs downsample natively
+    cv2 = None
 
 
 # Hot patch atari env so we can get the score
@@ -195,7 +200,7 @@ class MaxAndSkipEnv(gym.Wrapper):
         """Return only every `skip`-th frame"""
         gym.Wrapper.__init__(self, env)
         # most recent raw observations (for max pooling across time steps)
-        self._obs_buffer = np.zeros((2,)+env.observation_space.shape, dtype=np.uint8)
+        self._obs_buffer = np.zeros((2,)+env.observation_space.shape, dtype=env.observation_space.dtype)
         self._skip       = skip
 
     def step(self, action):
@@ -315,23 +320,35 @@ class LazyFrames(object):
         return self._force()[i]
 
 def get_complement(env_id):
-    if 'Toybox' in env_id:
-        return env_id.replace('Toybox', '')
-    else:
-        game_name, suffix = env_id.split('No')
-        return game_name + 'ToyboxNo' + suffix
+    """Maps a Toybox id to the ALE id of the same game, or an ALE id to the Toybox one.
+
+    Both ids are NoFrameskip, since make_wrapper only skips frames for ALE envs itself. The 
+    Toybox84 and ToyboxFeatures ids have no ALE counterpart with the same observations.
+    """
+    match = re.match(r'^([A-Za-z]+?)(Toybox)?NoFrameskip-v4$', env_id)
+    if match is None or 'Toybox' in match.group(1):
+        raise ValueError('Only Toybox and ALE NoFrameskip ids with full frames have a complement: %s' % env_id)
+    game_name, toybox = match.group(1, 2)
+    if toybox:
+        return game_name + 'NoFrameskip-v4'
+    return game_name + 'ToyboxNoFrameskip-v4'
 
 def make_wrapper(env_id):
     if 'Toybox' in env_id:
         env = TimeLimit(gym.make(env_id))
     else:
         env= gym.make(env_id)
-    assert 'NoFrameskip' in env.spec.id
+    # Toybox envs other than NoFrameskip skip and max-pool frames themselves
+    native_skip = isinstance(env.unwrapped, ToyboxBaseEnv) and env.unwrapped.frameskip != 1
+    assert native_skip or 'NoFrameskip' in env.spec.id
     env = NoopResetEnv(env, noop_max=30)
     # TODO: skip was previously set to 4. This makes debugging hard. Setting it to 0 
     # causes the MaxAndSkipEnv to not step at all, so we need to set it to at least 1.
     # We can see how badly this impacts our training later.
-    env = MaxAndSkipEnv(env, skip=4)
+    # For Toybox84 ids this pools frames that are already downsampled, whereas ALE and the 
+    # Toybox84Deterministic ids pool first and then downsample
+    if not native_skip:
+        env = MaxAndSkipEnv(env, skip=4)
     return env
 
 
@@ -350,7 +367,9 @@ def wrap_deepmind(env, episode_life=True, clip_rewards=True, frame_stack=False,
         env = EpisodicLifeEnv(env)
     if 'FIRE' in env.unwrapped.get_action_meanings():
         env = FireResetEnv(env)
-    env = WarpFrame(env)
+    # Toybox84 envs already observe 84x84 grayscale frames, and feature vectors are not frames
+    if len(env.observation_space.shape) == 3 and env.observation_space.shape != (84, 84, 1):
+        env = WarpFrame(env)
     if scale:
         env = ScaledFloatFrame(env)
     if clip_rewards:
@@ -28,6 +28,17 @@ class DummyVecEnv(VecEnv):
         self.buf_infos = [{} for _ in range(self.num_envs)]
         self.actions = None
 
+        # Unwrapped envs that can render observations into a given array (e.g., Toybox's) 
+        # write straight into their row of buf_obs; env index -> row
+        self.obs_rows = {}
+        if self.keys == [None]:
+            for e, env in enumerate(self.envs):
+                if env is env.unwrapped and hasattr(env, 'set_obs_buffer'):
+                    try:
+                        self.obs_rows[e] = env.set_obs_buffer(self.buf_obs[None][e])
+                    except ValueError:
+                        pass
+
     def step_async(self, actions):
         listify = True
         try:
@@ -64,7 +75,8 @@ class DummyVecEnv(VecEnv):
     def _save_obs(self, e, obs):
         for k in self.keys:
             if k is None:
-                self.buf_obs[k][e] = obs
+                if obs is not self.obs_rows.get(e):
+                    self.buf_obs[k][e] = obs
             else:
                 self.buf_obs[k][e] = obs[k]
 
@@ -123,6 +123,10 @@ def build_env(args, extra_args):
             frame_stack_size = 4
             weights = extra_args['weights'] if 'weights' in extra_args else None
             env = VecFrameStack(make_vec_env(env_id, env_type, nenv, seed, weights=weights), frame_stack_size)
+    elif env_type == 'features':
+        # Toybox feature vectors (e.g., BreakoutToyboxFeaturesDeterministic-v4) skip frames 
+        # themselves, and are not images, so they get none of the Atari wrappers
+        env = make_vec_env(env_id, env_type, nenv, seed)
     return env
 
 
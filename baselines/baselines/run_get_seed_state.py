@@ -1,4 +1,5 @@
 import toybox
+from toybox.archive import StateArchive
 from toybox.envs.atari.base import ToyboxBaseEnv
 from toybox.envs.atari.amidar import AmidarEnv
 from toybox.envs.atari.breakout import BreakoutEnv
@@ -13,7 +14,6 @@ import gym
 from collections import defaultdict
 import tensorflow as tf
 import numpy as np
-import json
 
 from baselines.common.vec_env.vec_frame_stack import VecFrameStack
 from baselines.common.cmd_util import common_arg_parser, parse_unknown_args, make_vec_env
@@ -211,14 +211,12 @@ def parse_cmdline_kwargs(args):
 
     return {k: parse(v) for k,v in parse_unknown_args(args).items()}
 
-def save_seed_json(predicate, seed_state, model_path): 
+def save_seed_archive(predicate, toybox, model_path, tick, archive_path=osp.join('seed_states', 'seed_states.tbx')):
+    # one archive for every predicate and model, instead of a JSON file each
+    with StateArchive(archive_path, 'a') as archive:
+        i = archive.append(toybox, tick=tick, predicate=predicate, model=str(osp.basename(model_path)))
     print("Found seed for", predicate+".")
-    print("Exported to JSON.")
-
-     # save seed to openai/seed_states/json
-    new_f = predicate + '_'+str(osp.basename(model_path))+'.json'
-    with open(osp.join('seed_states', 'json', new_f), 'w') as outfile:
-        json.dump(seed_state, outfile)    
+    print("Appended to", archive_path, "as state", i)
 
 
 def main():
@@ -244,6 +242,7 @@ def main():
         turtle = atari_wrappers.get_turtle(env)
         found_seed = {}
         seed_state = None
+        tick = 0
 
         if not isinstance(turtle, ToyboxBaseEnv): 
             raise ValueError("Not a ToyboxBaseEnv; cannot export state to JSON", turtle)
@@ -256,6 +255,7 @@ def main():
             actions = model.step(obs)[0]
             num_lives = turtle.ale.lives()
             obs, _, done, info = env.step(actions)
+            tick += 1
             done = num_lives == 1 and done 
 
             if isinstance(turtle, AmidarEnv): 
@@ -265,14 +265,15 @@ def main():
                 # find single brick remaining seed
                 if turtle.toybox.rstate.breakout_bricks_remaining() == 1:
                     found_seed['breakout_bricks_remaining'] = True
-                    save_seed_json('breakout_bricks_remaining', turtle.toybox.to_json(), extra_args['load_path'])
+                    save_seed_archive('breakout_bricks_remaining', turtle.toybox, extra_args['load_path'], tick)
 
                 if turtle.toybox.rstate.breakout_channel_count() and not found_seed['breakout_channel_count'] == 1: 
                     found_seed['breakout_channel_count'] = True
-                    save_seed_json('breakout_channel_count', turtle.toybox.to_json(), extra_args['load_path'])
+                    save_seed_archive('breakout_channel_count', turtle.toybox, extra_args['load_path'], tick)
 
             if done:
                 obs = env.reset()
+                tick = 0
                 print("Game ended before predicate met. New game.")
 
         env.close()
@@ -2,8 +2,25 @@
 
 set -eu
 
+# validate every decode, so that schema drift fails the tests
+export TOYBOX_STRICT_DECODE=1
+
 ./start_python scripts/utils/test_games.py
-./start_python toybox/interventions/amidar.py
-./start_python toybox/interventions/breakout.py
-./start_python toybox/interventions/space_invaders.py
 
+# the interventions run strict, and as in production, where already-validated simulator JSON is trusted
+for strict in 1 0; do
+  TOYBOX_STRICT_DECODE=$strict ./start_python toybox/interventions/amidar.py
+  TOYBOX_STRICT_DECODE=$strict ./start_python toybox/interventions/breakout.py
+  TOYBOX_STRICT_DECODE=$strict ./start_python toybox/interventions/space_invaders.py
+  TOYBOX_STRICT_DECODE=$strict ./start_python toybox/interventions/base.py
+done
+
+./start_python toybox/interventions/codegen.py
+./start_python toybox/codec.py
+./start_python toybox/checkpoints.py
+./start_python toybox/rollouts.py
+./start_python toybox/archive.py
+./start_python toybox/testing/statebank.py
+./start_python toybox/frames.py
+./start_python toybox/features.py
+./start_python toybox/envs/atari/base.py
@@ -0,0 +1,64 @@
+from toybox import Toybox, codec
+from toybox.interventions import codegen
+import time
+import numpy as np
+from scipy.stats import sem
+
+
+# Default states decoded per second
+def loads_test(game, Nrounds):
+    state, _ = codegen.load_defaults(game)
+    data = codec.dumps_bytes(state)
+    startTime = time.time()
+    for _ in range(Nrounds):
+        codec.loads(data)
+    endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# Default states encoded per second
+def dumps_test(game, Nrounds):
+    state, _ = codegen.load_defaults(game)
+    startTime = time.time()
+    for _ in range(Nrounds):
+        codec.dumps(state)
+    endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# States fetched from the simulator per second, as a dict or as raw bytes
+def fetch_test(game, Nrounds, raw):
+    fetch = codec.state_bytes if raw else codec.state_json
+    with Toybox(game) as tb:
+        startTime = time.time()
+        for _ in range(Nrounds):
+            fetch(tb)
+        endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+def main(Nrounds, Nrepeats):
+    backends = []
+    for name in ['json', 'ujson', 'orjson']:
+        try:
+            backends.append(codec.set_backend(name))
+        except ImportError:
+            print('%s not installed' % name)
+    for game in ['amidar', 'breakout', 'gridworld', 'space_invaders']:
+        print('%s-default-state-bytes:\n\t %d' % (game, len(codec.dumps_bytes(codegen.load_defaults(game)[0]))))
+        for name in backends:
+            codec.set_backend(name)
+            loads = [loads_test(game, Nrounds) for _ in range(Nrepeats)]
+            dumps = [dumps_test(game, Nrounds) for _ in range(Nrepeats)]
+            print('%s-%s-loads/sec:\n\t %3.4f\n\t %3.4f' % (game, name, np.average(loads), sem(loads)))
+            print('%s-%s-dumps/sec:\n\t %3.4f\n\t %3.4f' % (game, name, np.average(dumps), sem(dumps)))
+            if game == 'gridworld': continue
+            fetches = [fetch_test(game, Nrounds, False) for _ in range(Nrepeats)]
+            print('%s-%s-state-fetches/sec:\n\t %3.4f\n\t %3.4f' % (game, name, np.average(fetches), sem(fetches)))
+        if game == 'gridworld': continue
+        fetches = [fetch_test(game, Nrounds, True) for _ in range(Nrepeats)]
+        print('%s-raw-state-fetches/sec:\n\t %3.4f\n\t %3.4f\n' % (game, np.average(fetches), sem(fetches)))
+    codec.set_backend()
+
+if __name__ == '__main__':
+    main(1000, 5)
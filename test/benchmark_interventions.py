@@ -0,0 +1,168 @@
+from toybox import Toybox
+from toybox.interventions.amidar import Amidar, AmidarIntervention
+from toybox.interventions.breakout import Breakout, BreakoutIntervention
+from toybox.interventions.space_invaders import SpaceInvaders, SpaceInvadersIntervention
+import time
+import tracemalloc
+import numpy as np
+from scipy.stats import sem
+
+
+class NullIntervention(object):
+    """Stands in for the context manager, so we can time decode without the FFI."""
+    def __init__(self):
+        self.dirty_state = False
+
+
+def get_game_clz(game_name):
+    return {
+        'amidar' : Amidar,
+        'breakout' : Breakout,
+        'space_invaders' : SpaceInvaders
+    }[game_name]
+
+
+def get_intervention_clz(game_name):
+    return {
+        'amidar' : AmidarIntervention,
+        'breakout' : BreakoutIntervention,
+        'space_invaders' : SpaceInvadersIntervention
+    }[game_name]
+
+
+# Decodes per second over a state pulled once from the simulator
+def decode_test(game, Nrounds):
+    clz = get_game_clz(game)
+    with Toybox(game) as tb:
+        state = tb.to_state_json()
+    intervention = NullIntervention()
+    startTime = time.time()
+    for _ in range(Nrounds):
+        clz.decode(intervention, state, clz)
+    endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# Bytes held by one fully decoded state
+def memory_test(game):
+    clz = get_game_clz(game)
+    with Toybox(game) as tb:
+        state = tb.to_state_json()
+    intervention = NullIntervention()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = clz.decode(intervention, state, clz)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+# Attribute assignments per second on an already-decoded game
+def mutate_test(game, Nrounds):
+    clz = get_game_clz(game)
+    with Toybox(game) as tb:
+        state = tb.to_state_json()
+    intervention = NullIntervention()
+    obj = clz.decode(intervention, state, clz)
+    startTime = time.time()
+    for i in range(Nrounds):
+        obj.score = i
+    endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# Amidar final states scored (decoded and painted tiles counted) per second
+def score_test(Nrounds, vectorized):
+    with Toybox('amidar') as tb:
+        state = tb.to_state_json()
+    intervention = NullIntervention()
+    startTime = time.time()
+    for _ in range(Nrounds):
+        game = Amidar.decode(intervention, state, Amidar)
+        if vectorized:
+            painted = game.board.tiles.tag_count('Painted')
+        else:
+            painted = sum([sum([int(tile.tag == 'Painted') for tile in row]) for row in game.board.tiles])
+    endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# Interventions per second that only touch a scalar field, e.g. at tick 0
+def scalar_intervention_test(game, Nrounds, lazy):
+    clz = get_intervention_clz(game)
+    with Toybox(game) as tb:
+        startTime = time.time()
+        for i in range(Nrounds):
+            with clz(tb, lazy=lazy) as intervention:
+                intervention.game.lives = 1 + i % 2
+        endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+def flip_one(game, intervention):
+    if game == 'amidar':
+        tile = intervention.game.board.tiles[0][0]
+        tile.tag = 'Painted' if tile.tag != 'Painted' else 'Unpainted'
+    elif game == 'breakout':
+        brick = intervention.game.bricks[0]
+        brick.alive = not brick.alive
+    elif game == 'space_invaders':
+        intervention.game.shields[0].x += 1
+
+
+# Encode time (ms) and bytes written for commits that change a single element
+def commit_test(game, Nrounds):
+    clz = get_intervention_clz(game)
+    times, sizes = [], []
+    with Toybox(game) as tb:
+        for _ in range(Nrounds):
+            with clz(tb) as intervention:
+                flip_one(game, intervention)
+            times.append(intervention.commit_stats['encode_time'] * 1000)
+            sizes.append(intervention.commit_stats['bytes'])
+    return np.average(times), np.average(sizes)
+
+
+# Breakout channel counts per second, as evaluated by a per-tick predicate
+def channel_test(Nrounds):
+    with Toybox('breakout') as tb:
+        with BreakoutIntervention(tb) as intervention:
+            startTime = time.time()
+            for _ in range(Nrounds):
+                intervention.channel_count()
+            endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+# JSON fetches per second, as the lower bound for entering an intervention
+def fetch_test(game, Nrounds):
+    with Toybox(game) as tb:
+        startTime = time.time()
+        for _ in range(Nrounds):
+            tb.to_state_json()
+        endTime = time.time()
+    return Nrounds / (endTime - startTime)
+
+
+def main(Nrounds, Nmutations, Nrepeats):
+    for vectorized in [False, True]:
+        scores = [score_test(Nrounds, vectorized) for _ in range(Nrepeats)]
+        print('amidar-%s-scored-states/sec:\n\t %3.4f\n\t %3.4f\n' % ('vectorized' if vectorized else 'per-tile', np.average(scores), sem(scores)))
+    channels = [channel_test(Nrounds * 10) for _ in range(Nrepeats)]
+    print('breakout-channel-counts/sec:\n\t %3.4f\n\t %3.4f\n' % (np.average(channels), sem(channels)))
+    for game in ['amidar', 'breakout', 'space_invaders']:
+        decodes = [decode_test(game, Nrounds) for _ in range(Nrepeats)]
+        mutations = [mutate_test(game, Nmutations) for _ in range(Nrepeats)]
+        print('%s-decodes/sec:\n\t %3.4f\n\t %3.4f' % (game, np.average(decodes), sem(decodes)))
+        print('%s-mutations/sec:\n\t %3.4f\n\t %3.4f' % (game, np.average(mutations), sem(mutations)))
+        print('%s-KB-per-decoded-state:\n\t %3.1f' % (game, memory_test(game) / 1024))
+        for lazy in [False, True]:
+            rates = [scalar_intervention_test(game, Nrounds, lazy) for _ in range(Nrepeats)]
+            print('%s-%s-interventions/sec:\n\t %3.4f\n\t %3.4f' % (game, 'lazy' if lazy else 'eager', np.average(rates), sem(rates)))
+        commits = [commit_test(game, Nrounds) for _ in range(Nrepeats)]
+        print('%s-single-element-commit (encode ms, bytes):\n\t %3.4f\n\t %d' % (game, np.average([c[0] for c in commits]), commits[0][1]))
+        fetches = [fetch_test(game, Nrounds) for _ in range(Nrepeats)]
+        print('%s-state-fetches/sec:\n\t %3.4f\n\t %3.4f\n' % (game, np.average(fetches), sem(fetches)))
+
+if __name__ == '__main__':
+    main(20, 10000, 5)
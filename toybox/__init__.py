@@ -5,23 +5,25 @@ try:
     from gym.envs.registration import register
 
     # Updated to use v4 to be analogous with the    ALE versioning
-    register(
-        id='BreakoutToyboxNoFrameskip-v4',
-        entry_point='toybox.envs.atari:BreakoutEnv',
-        nondeterministic=True
-    )
+    # Like ALE's v4 environments, NoFrameskip applies each action for one tick, Deterministic 
+    # for four, and the plain ids for two to four. Toybox max-pools the last two frames.
+    # The Toybox84 ids observe 84x84 grayscale frames, so they need no WarpFrame; the 
+    # ToyboxFeatures ids observe float32 feature vectors (see toybox.features), and are 
+    # registered from toybox.envs.features, so that baselines gives them their own env type.
+    def _register(game, env, nondeterministic):
+        variants = [('', 'atari', {}), ('84', 'atari', {'obs_size' : (84, 84)}), ('Features', 'features', {'obs_type' : 'features'})]
+        for variant, module, obs_kwargs in variants:
+            for suffix, frameskip in [('NoFrameskip', 1), ('Deterministic', 4), ('', (2, 5))]:
+                register(
+                    id='%sToybox%s%s-v4' % (game, variant, suffix),
+                    entry_point='toybox.envs.%s:%s' % (module, env),
+                    kwargs=dict(obs_kwargs, frameskip=frameskip),
+                    nondeterministic=nondeterministic
+                )
 
-    register(
-        id='AmidarToyboxNoFrameskip-v4',
-        entry_point='toybox.envs.atari:AmidarEnv',
-        nondeterministic=False
-    )
-
-    register(
-        id='SpaceInvadersToyboxNoFrameskip-v4',
-        entry_point='toybox.envs.atari:SpaceInvadersEnv',
-        nondeterministic=False
-    )
+    _register('Breakout', 'BreakoutEnv', True)
+    _register('Amidar', 'AmidarEnv', False)
+    _register('SpaceInvaders', 'SpaceInvadersEnv', False)
 
     print("Registered Toybox environments with gym.")
 
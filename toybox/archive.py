@@ -0,0 +1,288 @@
+from toybox import codec
+from ctoybox import Toybox
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+""" An append-only, compressed archive of Toybox states, for building and sharing large start-state banks.
+
+An archive is two files:
+
+  <path>      'TBXARC1\\n', then one record per state: a little-endian (uint32 meta length,
+              uint32 data length) header, the metadata as UTF-8 JSON, and the zlib-compressed
+              state JSON.
+  <path>.idx  one fixed-width entry per record (see index_dtype), so that the numeric metadata
+              can be filtered with NumPy without touching the records.
+
+Readers memory-map both files. The index can be rebuilt from the records (see rebuild_index); 
+opening an archive to append also repairs it, after a crash between or during writes."""
+
+magic = b'TBXARC1\n'
+header = struct.Struct('<II')
+# -1 marks unknown values
+index_dtype = np.dtype([('offset', '<u8'), ('seed', '<i8'), ('score', '<i8'), ('tick', '<i8')])
+
+
+class StateArchive(object):
+  """
+  >>> with StateArchive('bank.tbx', 'a') as archive:
+  ...   archive.append(tb, seed=17, tick=200, predicate='one_brick_left')
+  >>> with StateArchive('bank.tbx') as archive:
+  ...   archive.restore(tb, np.argmax(archive.index['score']))
+  """
+
+  def __init__(self, path, mode='r', level=6):
+    """
+    Parameters
+    ---
+    path : str
+    mode : str
+      'r' to read; 'a' to append to (creating, if needed) the archive
+    level : int
+      zlib compression level for appended states
+    """
+    assert mode in ['r', 'a'], 'Unknown mode: %s' % mode
+    self.path = path
+    self.mode = mode
+    self.level = level
+    if mode == 'a' and not os.path.exists(path):
+      with open(path, 'wb') as f: f.write(magic)
+      open(path + '.idx', 'wb').close()
+    self.data = open(path, 'rb' if mode == 'r' else 'r+b')
+    if self.data.read(len(magic)) != magic:
+      raise ValueError('%s is not a Toybox state archive' % path)
+    self.index_file = open(path + '.idx', 'rb' if mode == 'r' else 'r+b')
+    self.data_map = None
+    self.index_map = None
+    self.pending = []
+    if mode == 'a':
+      self.repair()
+    self.remap()
+
+  def repair(self):
+    """Makes the index cover exactly the whole records, and drops a torn final record, so appends follow the last whole one."""
+    size = os.fstat(self.data.fileno()).st_size
+    data = mmap.mmap(self.data.fileno(), size, access=mmap.ACCESS_READ)
+    nentries = os.fstat(self.index_file.fileno()).st_size // index_dtype.itemsize
+    self.index_file.seek(0)
+    index = np.frombuffer(self.index_file.read(nentries * index_dtype.itemsize), dtype=index_dtype)
+    # keep the index entries whose records are whole, then index the records after them
+    end, kept = len(magic), 0
+    for offset in index['offset']:
+      offset = int(offset)
+      if offset != end or _record_end(data, offset) is None: break
+      end, kept = _record_end(data, offset), kept + 1
+    entries = []
+    for offset, record_end, meta in _records(data, end):
+      entries.append((offset, meta['seed'], meta['score'], meta['tick']))
+      end = record_end
+    data.close()
+    self.data.truncate(end)
+    self.data.seek(end)
+    self.index_file.truncate(kept * index_dtype.itemsize)
+    self.index_file.seek(kept * index_dtype.itemsize)
+    self.index_file.write(np.array(entries, dtype=index_dtype).tobytes())
+    self.index_file.flush()
+
+  def remap(self):
+    """Maps the files as they are on disk."""
+    size = os.fstat(self.data.fileno()).st_size
+    self.data_map = mmap.mmap(self.data.fileno(), size, access=mmap.ACCESS_READ)
+    nentries = os.fstat(self.index_file.fileno()).st_size // index_dtype.itemsize
+    if nentries:
+      self.index_map = np.memmap(self.index_file, dtype=index_dtype, mode='r', shape=(nentries,))
+    else:
+      self.index_map = np.zeros(0, dtype=index_dtype)
+
+  @property
+  def index(self):
+    """Structured array of (offset, seed, score, tick), one entry per state."""
+    self.flush()
+    return self.index_map
+
+  def __len__(self): return len(self.index_map) + len(self.pending)
+
+  def __enter__(self): return self
+
+  def __exit__(self, exc_type, exc_value, traceback): self.close()
+
+  def append(self, state, game=None, seed=-1, score=-1, tick=-1, **meta):
+    """Appends a state, returning its position in the archive.
+
+    state is a Toybox (whose game and score are recorded, unless given), a dict, a JSON str,
+    or UTF-8 JSON bytes. Extra keyword arguments (e.g., predicate='channel') are stored with
+    the record; all metadata must be JSON-serializable."""
+    assert self.mode == 'a', 'Archive is open for reading'
+    if isinstance(state, Toybox):
+      game = game or state.game_name
+      score = score if score != -1 else state.get_score()
+      state = codec.state_bytes(state)
+    elif isinstance(state, dict):
+      state = codec.dumps_bytes(state)
+    elif isinstance(state, str):
+      state = state.encode('utf-8')
+    meta = dict(meta, game=game, seed=seed, score=score, tick=tick)
+    meta = codec.dumps_bytes(meta)
+    data = zlib.compress(state, self.level)
+    offset = self.data.tell()
+    self.data.write(header.pack(len(meta), len(data)))
+    self.data.write(meta)
+    self.data.write(data)
+    self.pending.append((offset, seed, score, tick))
+    return len(self) - 1
+
+  def flush(self):
+    if not self.pending: return
+    # The records go to disk before the index entries that point at them
+    self.data.flush()
+    self.index_file.write(np.array(self.pending, dtype=index_dtype).tobytes())
+    self.pending = []
+    self.index_file.flush()
+    self.remap()
+
+  def record(self, i):
+    # (metadata bytes, compressed state) of the ith record
+    if i >= len(self.index_map): self.flush()
+    offset = int(self.index_map[i]['offset'])
+    meta_len, data_len = header.unpack_from(self.data_map, offset)
+    start = offset + header.size
+    return self.data_map[start:start + meta_len], self.data_map[start + meta_len:start + meta_len + data_len]
+
+  def metadata(self, i):
+    """The metadata stored with the ith state (game, seed, score, tick, and any extras)."""
+    return codec.loads(self.record(i)[0])
+
+  def state_bytes(self, i):
+    return zlib.decompress(self.record(i)[1])
+
+  def state_json(self, i):
+    return codec.loads(self.state_bytes(i))
+
+  def __getitem__(self, i):
+    return self.state_json(range(len(self))[i])
+
+  def restore(self, tb, i):
+    """Replaces the state of tb with the ith state."""
+    game = self.metadata(i)['game']
+    if game is not None and game != tb.game_name:
+      raise ValueError('State %d is a %s state; cannot restore it into %s' % (i, game, tb.game_name))
+    codec.write_state(tb, self.state_bytes(i))
+
+  def find(self, **meta):
+    """Positions of the states whose metadata matches every keyword argument, e.g., find(predicate='channel')."""
+    return [i for i in range(len(self)) if all([m.get(k) == v for m in [self.metadata(i)] for k, v in meta.items()])]
+
+  def close(self):
+    if self.mode == 'a': self.flush()
+    # Release the maps before closing the files they map
+    self.index_map = None
+    if self.data_map is not None: self.data_map.close()
+    self.data.close()
+    self.index_file.close()
+
+
+def _record_end(data, offset):
+  # End of the record at offset, or None if it is cut short
+  if offset + header.size > len(data): return None
+  meta_len, data_len = header.unpack_from(data, offset)
+  end = offset + header.size + meta_len + data_len
+  return end if end <= len(data) else None
+
+def _records(data, offset):
+  # (offset, end, metadata) of each whole record from offset on; a truncated final record is dropped
+  end = _record_end(data, offset)
+  while end is not None:
+    meta_len = header.unpack_from(data, offset)[0]
+    yield offset, end, codec.loads(data[offset + header.size:offset + header.size + meta_len])
+    offset, end = end, _record_end(data, end)
+
+
+def rebuild_index(path):
+  """Rewrites <path>.idx from the records in <path>, e.g., after a crash between writes; returns the number of states."""
+  entries = []
+  with open(path, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    for offset, end, meta in _records(data, len(magic)):
+      entries.append((offset, meta['seed'], meta['score'], meta['tick']))
+    data.close()
+  with open(path + '.idx', 'wb') as f:
+    f.write(np.array(entries, dtype=index_dtype).tobytes())
+  return len(entries)
+
+
+if __name__ == "__main__":
+  import tempfile
+  import time
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'bank.tbx')
+    states = []
+    with Toybox('breakout') as tb:
+      actions = tb.get_legal_action_set()
+      with StateArchive(path, 'a') as archive:
+        for tick in range(50):
+          tb.apply_ale_action(actions[tick % len(actions)])
+          states.append(tb.to_state_json())
+          assert archive.append(tb, seed=0, tick=tick, predicate='even' if tick % 2 == 0 else 'odd') == tick
+        # records can be read back before they are flushed
+        assert archive.state_json(49) == states[49]
+      assert os.path.getsize(path) < len(codec.dumps_bytes(states)) / 5
+
+      # reopening for append continues the archive
+      with StateArchive(path, 'a') as archive:
+        archive.append(states[0], game='breakout', tick=0, predicate='copy')
+        assert len(archive) == 51
+
+      with StateArchive(path) as archive:
+        assert len(archive) == 51
+        assert archive[10] == states[10] and archive[-1] == states[0]
+        assert list(archive.index['tick'][:50]) == list(range(50))
+        meta = archive.metadata(3)
+        assert meta['game'] == 'breakout' and meta['predicate'] == 'odd' and meta['score'] == states[3]['score']
+        assert archive.find(predicate='copy') == [50]
+        assert len(archive.find(predicate='even')) == 25
+        # restoring matches writing the original state (breakout's ball positions do not round-trip exactly)
+        tb.write_state_json(states[20])
+        expected = tb.to_state_json()
+        archive.restore(tb, 20)
+        assert tb.to_state_json() == expected
+        with Toybox('amidar') as other:
+          try:
+            archive.restore(other, 20)
+            assert False, 'states can only be restored into the same game'
+          except ValueError: pass
+
+      # the index can be recovered from the records alone, ignoring a torn final write
+      expected = np.array(np.memmap(path + '.idx', dtype=index_dtype, mode='r'))
+      with open(path, 'ab') as f: f.write(header.pack(10, 1000) + b'partial')
+      os.remove(path + '.idx')
+      assert rebuild_index(path) == 51
+      assert (np.memmap(path + '.idx', dtype=index_dtype, mode='r') == expected).all()
+
+      # appending repairs the archive first: a torn final record is dropped, and records 
+      # missing from the index (or entries torn from it) are indexed again
+      with open(path, 'ab') as f: f.write(header.pack(10, 1000) + b'partial')
+      with open(path + '.idx', 'r+b') as f: f.truncate(48 * index_dtype.itemsize + 5)
+      with StateArchive(path, 'a') as archive:
+        assert len(archive) == 51
+        archive.append(states[1], tick=1, predicate='repaired')
+      with StateArchive(path) as archive:
+        assert archive[51] == states[1] and archive.find(predicate='repaired') == [51]
+        index = np.array(archive.index)
+      assert rebuild_index(path) == 52
+      assert (np.memmap(path + '.idx', dtype=index_dtype, mode='r') == index).all()
+
+      # random access into a larger archive
+      with StateArchive(path, 'a') as archive:
+        start = time.time()
+        for _ in range(2000): archive.append(tb)
+        write_time = time.time() - start
+      assert rebuild_index(path) == 2052
+      with StateArchive(path) as archive:
+        order = np.random.RandomState(0).permutation(len(archive))[:2000]
+        start = time.time()
+        for i in order: archive.state_bytes(int(i))
+        read_time = time.time() - start
+        print('%d states, %.0f bytes each: %.0f appends/sec, %.0f random reads/sec' % (
+          len(archive), os.path.getsize(path) / len(archive), 2000 / write_time, 2000 / read_time))
@@ -0,0 +1,141 @@
+from toybox import codec
+from collections import OrderedDict
+import itertools
+import zlib
+""" A bounded in-memory store of Toybox states, for branching rollouts and repeated starts.
+
+States are kept as the simulator's raw JSON bytes (optionally zlib-compressed), so saving and
+restoring never builds a Python dict."""
+
+class StateCheckpointPool(object):
+  """Snapshots of Toybox states, keyed by handle, with least-recently-used eviction.
+
+  >>> pool = StateCheckpointPool(capacity=16)
+  >>> start = pool.save(tb)
+  >>> ... # play
+  >>> pool.restore(tb, start)
+  """
+
+  def __init__(self, capacity=128, max_bytes=None, compress=True, level=1):
+    """
+    Parameters
+    ---
+    capacity : int
+      The maximum number of checkpoints held
+    max_bytes : int
+      If provided, the maximum number of (stored) bytes held
+    compress : bool
+      Whether to zlib-compress checkpoints; states are repetitive JSON, so they compress well
+    level : int
+      zlib compression level; low levels are much faster and compress almost as well
+    """
+    assert capacity > 0
+    self.capacity = capacity
+    self.max_bytes = max_bytes
+    self.compress = compress
+    self.level = level
+    # key -> (game_name, compressed, data); ordered from least to most recently used
+    self.checkpoints = OrderedDict()
+    self.nbytes = 0
+    self.evictions = 0
+    self.handles = itertools.count()
+
+  def __len__(self): return len(self.checkpoints)
+
+  def __contains__(self, key): return key in self.checkpoints
+
+  def save(self, tb, key=None):
+    """Snapshots the current state of tb, under key if provided. Returns the checkpoint's key."""
+    if key is None:
+      key = next(self.handles)
+    data = codec.state_bytes(tb)
+    if self.compress:
+      data = zlib.compress(data, self.level)
+    self.discard(key)
+    self.checkpoints[key] = (tb.game_name, self.compress, data)
+    self.nbytes += len(data)
+    self.evict()
+    return key
+
+  def data(self, key):
+    """Returns the checkpoint's state as UTF-8 JSON bytes, and marks it as recently used."""
+    game_name, compressed, data = self.checkpoints[key]
+    self.checkpoints.move_to_end(key)
+    return zlib.decompress(data) if compressed else data
+
+  def restore(self, tb, key):
+    """Replaces the state of tb with the checkpoint. Raises KeyError if it was evicted or never saved."""
+    game_name = self.checkpoints[key][0]
+    if game_name != tb.game_name:
+      raise ValueError('Checkpoint %s is a %s state; cannot restore it into %s' % (key, game_name, tb.game_name))
+    codec.write_state(tb, self.data(key))
+
+  def state_json(self, key):
+    """Returns the checkpoint's state as a dict, e.g., to inspect or intervene on it."""
+    return codec.loads(self.data(key))
+
+  def discard(self, key):
+    if key in self.checkpoints:
+      self.nbytes -= len(self.checkpoints.pop(key)[2])
+
+  def clear(self):
+    self.checkpoints.clear()
+    self.nbytes = 0
+
+  def evict(self):
+    # Always keep the checkpoint that was just saved
+    while len(self.checkpoints) > 1 and (len(self.checkpoints) > self.capacity or \
+        (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+      key, (_, _, data) = self.checkpoints.popitem(last=False)
+      self.nbytes -= len(data)
+      self.evictions += 1
+
+  def stats(self):
+    return {'checkpoints' : len(self.checkpoints), 'bytes' : self.nbytes, 'evictions' : self.evictions}
+
+
+if __name__ == "__main__":
+  from ctoybox import Toybox
+
+  for game in ['amidar', 'breakout', 'space_invaders']:
+    with Toybox(game) as tb:
+      actions = tb.get_legal_action_set()
+      for compress in [True, False]:
+        pool = StateCheckpointPool(capacity=3, compress=compress)
+        start = pool.save(tb)
+        expected = tb.to_state_json()
+        for i in range(20): tb.apply_ale_action(actions[i % len(actions)])
+        later = pool.save(tb)
+        assert pool.state_json(start) == expected
+
+        # restoring twice from the same checkpoint replays identically
+        pool.restore(tb, start)
+        for i in range(20): tb.apply_ale_action(actions[i % len(actions)])
+        assert pool.state_json(later)['score'] == tb.to_state_json()['score']
+        pool.restore(tb, start)
+        assert tb.to_state_json()['score'] == expected['score']
+
+        # least recently used checkpoints are evicted first
+        pool.save(tb, key='a')
+        pool.restore(tb, start)
+        pool.save(tb, key='b')
+        assert start in pool and later not in pool and len(pool) == 3
+        try:
+          pool.restore(tb, later)
+          assert False, 'evicted checkpoints cannot be restored'
+        except KeyError: pass
+        assert pool.stats()['evictions'] == 1
+        pool.discard('a')
+        assert pool.nbytes == sum([len(c[2]) for c in pool.checkpoints.values()])
+
+      # checkpoints are bounded by size, too
+      pool = StateCheckpointPool(max_bytes=1)
+      pool.save(tb)
+      pool.save(tb)
+      assert len(pool) == 1
+
+    with Toybox('breakout' if game != 'breakout' else 'amidar') as other:
+      try:
+        pool.restore(other, list(pool.checkpoints.keys())[0])
+        assert False, 'checkpoints can only be restored into the same game'
+      except ValueError: pass
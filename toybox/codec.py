@@ -0,0 +1,219 @@
+from ctoybox.ffi import ffi, lib
+from ctoybox import State
+import json
+""" Serialization of Toybox states and configs.
+
+Uses orjson or ujson, when one is installed, and the standard library's json otherwise. The
+*_bytes functions return the simulator's UTF-8 JSON without building a dict, for callers that
+only store or forward a state."""
+
+class StdlibBackend(object):
+  name = 'json'
+
+  def loads(self, data): return json.loads(data)
+
+  def dumps(self, obj): return json.dumps(obj)
+
+  def dumps_bytes(self, obj): return json.dumps(obj).encode('utf-8')
+
+
+class OrjsonBackend(object):
+  name = 'orjson'
+
+  def __init__(self):
+    import orjson
+    self.orjson = orjson
+
+  def loads(self, data): return self.orjson.loads(data)
+
+  def dumps(self, obj): return self.dumps_bytes(obj).decode('utf-8')
+
+  def dumps_bytes(self, obj):
+    try:
+      return self.orjson.dumps(obj)
+    except TypeError:
+      # e.g., integers wider than 64 bits
+      return json.dumps(obj).encode('utf-8')
+
+
+class UjsonBackend(object):
+  name = 'ujson'
+
+  def __init__(self):
+    import ujson
+    self.ujson = ujson
+
+  def loads(self, data): return self.ujson.loads(data)
+
+  def dumps(self, obj): return self.ujson.dumps(obj)
+
+  def dumps_bytes(self, obj): return self.ujson.dumps(obj).encode('utf-8')
+
+
+backends = { 'orjson' : OrjsonBackend, 'ujson' : UjsonBackend, 'json' : StdlibBackend }
+
+def set_backend(name=None):
+  """Selects the named backend, or the fastest one installed if name is None. Returns its name."""
+  global backend
+  names = [name] if name else ['orjson', 'ujson', 'json']
+  for candidate in names:
+    try:
+      backend = backends[candidate]()
+      return backend.name
+    except ImportError:
+      if name: raise
+
+backend = None
+set_backend()
+
+
+def loads(data):
+  """Decodes JSON from a str or UTF-8 bytes."""
+  return backend.loads(data)
+
+def dumps(obj):
+  """Encodes obj as a JSON str."""
+  return backend.dumps(obj)
+
+def dumps_bytes(obj):
+  """Encodes obj as UTF-8 JSON bytes."""
+  return backend.dumps_bytes(obj)
+
+
+def _rust_bytes(result):
+  # Copies a Rust string and frees it; unlike ctoybox.ffi.rust_str, does not decode it.
+  try:
+    return ffi.string(ffi.cast("char *", result))
+  finally:
+    lib.free_str(result)
+
+def state_bytes(tb):
+  """The current state of tb, as the simulator's UTF-8 JSON."""
+  return _rust_bytes(lib.state_to_json(tb.rstate.get_state()))
+
+def config_bytes(tb):
+  """The config of tb, as the simulator's UTF-8 JSON."""
+  return _rust_bytes(lib.simulator_to_json(tb.rsimulator.get_simulator()))
+
+def state_json(tb):
+  """Equivalent to tb.to_state_json()."""
+  return loads(state_bytes(tb))
+
+def config_json(tb):
+  """Equivalent to tb.config_to_json()."""
+  return loads(config_bytes(tb))
+
+class StateSnapshot(object):
+  """A Toybox state, held by the simulator and serialized only when asked for.
+
+  >>> snapshot = StateSnapshot(tb)
+  >>> tb.new_game()             # new_game and write_state replace tb's state, so the snapshot is intact
+  >>> snapshot.json()['score']
+
+  A snapshot shares its state with tb until tb's state is replaced; call freeze before tb acts again.
+  Pickled snapshots carry the state's JSON."""
+
+  def __init__(self, tb):
+    self.game_name = tb.game_name
+    self.state = tb.rstate
+    self.data = None
+
+  def freeze(self):
+    """Serializes the state now, so that it no longer depends on the simulator."""
+    if self.data is None:
+      self.data = _rust_bytes(lib.state_to_json(self.state.get_state()))
+      self.state = None
+    return self
+
+  def bytes(self):
+    return self.freeze().data
+
+  def json(self):
+    return loads(self.bytes())
+
+  def __getstate__(self):
+    return {'game_name' : self.game_name, 'state' : None, 'data' : self.bytes()}
+
+def canonical(state):
+  """Sorts the parts of a state dict that the simulator serializes in arbitrary order (Amidar's junction 
+  sets), in place, so that equal states compare and hash equal. Returns the state."""
+  board = state.get('board')
+  if isinstance(board, dict):
+    for key in ['junctions', 'chase_junctions']:
+      if key in board:
+        board[key] = sorted(board[key])
+  return state
+
+def write_state(tb, state):
+  """Equivalent to tb.write_state_json(state); state may be a dict, a JSON str, or UTF-8 JSON bytes."""
+  if isinstance(state, dict):
+    state = dumps_bytes(state)
+  elif isinstance(state, str):
+    state = state.encode('utf-8')
+  sim = tb.rsimulator
+  old_state = tb.rstate
+  tb.rstate = State(sim, state=lib.state_from_json(sim.get_simulator(), state))
+  del old_state
+
+def write_config(tb, config, new_game=True):
+  """Equivalent to tb.write_config_json(config) (which also starts a new game); config may be a dict, str or bytes.
+
+  With new_game=False the state is left alone, and the config, including its random seed, is 
+  exactly the one written, as when restoring it together with a state."""
+  if isinstance(config, dict):
+    config = dumps(config)
+  elif isinstance(config, bytes):
+    config = config.decode('utf-8')
+  if new_game:
+    tb.write_config_json(config)
+  else:
+    tb.rsimulator.from_json(config)
+
+
+if __name__ == "__main__":
+  from ctoybox import Toybox
+  import pickle
+
+  for name in ['json', 'orjson', 'ujson']:
+    try:
+      set_backend(name)
+    except ImportError:
+      print('skipping %s; not installed' % name)
+      continue
+    for game in ['amidar', 'breakout', 'space_invaders']:
+      with Toybox(game) as tb:
+        state = tb.to_state_json()
+        assert state_json(tb) == state
+        assert loads(state_bytes(tb)) == state
+        assert loads(dumps(state)) == state and loads(dumps_bytes(state)) == state
+        assert config_json(tb) == tb.config_to_json()
+
+        # states written as dicts, strs or bytes load like write_state_json
+        tb.write_state_json(state)
+        expected = canonical(tb.to_state_json())
+        for encoded in [state, dumps(state), dumps_bytes(state)]:
+          tb.apply_ale_action(tb.get_legal_action_set()[0])
+          write_state(tb, encoded)
+          assert canonical(tb.to_state_json()) == expected
+
+        # snapshots serialize lazily, and survive the state being replaced
+        snapshot = StateSnapshot(tb)
+        expected = tb.to_state_json()
+        tb.new_game()
+        assert snapshot.data is None and snapshot.json() == expected
+        snapshot = StateSnapshot(tb)
+        tb.new_game()
+        assert pickle.loads(pickle.dumps(snapshot)).json() == snapshot.json()
+        assert snapshot.state is None
+
+        config = tb.config_to_json()
+        config['start_lives'] = config['start_lives'] + 1
+        write_config(tb, dumps_bytes(config))
+        assert tb.config_to_json()['start_lives'] == config['start_lives']
+
+        # without a new game, the config is written as is, and the state kept
+        config['start_lives'] = config['start_lives'] + 1
+        state = state_bytes(tb)
+        write_config(tb, config, new_game=False)
+        assert config_json(tb) == config and state_bytes(tb) == state
+  set_backend()
@@ -6,6 +6,10 @@ try:
 except ImportError:
     np_random = seeding.np_random
 from toybox.envs.atari.constants import ACTION_MEANING, ACTION_LOOKUP
+from toybox import codec
+from toybox.frames import AreaResize
+from toybox.features import feature_schema
+from ctoybox.ffi import ffi, lib
 from gym.envs.atari import AtariEnv
 from gym import utils
 
@@ -38,11 +42,28 @@ class MockALE():
 class ToyboxBaseEnv(AtariEnv, ABC):
     metadata = {'render.modes': ['human']}
     
-    def __init__(self, toybox, game, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False, actions=None):
+    def __init__(self, toybox, game, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False, actions=None, max_pool=True, obs_size=None, obs_type='image', capture_final_state=False):
+        """
+        frameskip is the number of ticks each action is repeated for: an int, or a (low, high) range 
+        that a count is drawn from, uniformly, every step. When max_pool is set, the observation is 
+        the pixelwise max of the last two frames (as in baselines' MaxAndSkipEnv); only those two 
+        frames are rendered. obs_size, e.g., (84, 84), downsamples grayscale observations to 
+        (height, width, 1) by area averaging, like baselines' WarpFrame; pooling happens first, on 
+        full-size frames, as in ALE's pipeline. With frameskip=1 (the NoFrameskip ids) the env does not 
+        pool, so baselines' MaxAndSkipEnv pools the downsampled frames instead, which can differ from 
+        downsampling the pooled frame by a gray level or a thin object. obs_type='features' observes 
+        the game's objects as a flat float32 vector instead of pixels (see toybox.features). 
+        capture_final_state makes reset keep the last state in cached_state, and step report a 
+        finished game's state in info['cached_state'], as codec.StateSnapshots, which only 
+        serialize the state if it is read.
+        """
         assert(toybox.rstate)
         self.toybox = toybox
+        self.frameskip = frameskip
+        self.max_pool = max_pool
         # This is a workaround for issues with Gym wrappers
         # resetting state prematurely
+        self.capture_final_state = capture_final_state
         self.cached_state = None
         self.score = self.toybox.get_score()
         self.viewer = None
@@ -57,21 +78,49 @@ class ToyboxBaseEnv(AtariEnv, ABC):
             actions = toybox.get_legal_action_set()
         assert(actions is not None)
         self._action_set = actions
-        self._obs_type = 'image'
+        assert obs_type in ['image', 'features'], 'Unknown observation type: %s' % obs_type
+        self._obs_type = obs_type
         self._rgba = 1 if grayscale else 4 if alpha else 3
         self._pixel_high = 255
 
         self._height = self.toybox.get_height()
         self._width = self.toybox.get_width()
         self._dim = (self._height, self._width, self._rgba) # * len(self.toybox.get_state())) 
+
+        # The last two frames of a step are rendered straight into these buffers
+        channels = 1 if self.toybox.grayscale else 4
+        self._frames = np.zeros((2, self._height, self._width, channels), dtype=np.uint8)
+        self._resize = None
+        self._obs_shape = self._frames.shape[1:]
+        if obs_size is not None:
+            assert self.toybox.grayscale, 'Downsampled observations are grayscale'
+            self._resize = AreaResize((self._height, self._width), obs_size)
+            self._dim = self._obs_shape = tuple(obs_size) + (1,)
+        self._obs_dtype = np.uint8
+        self._features = None
+        if obs_type == 'features':
+            self._features = feature_schema(self.toybox)
+            self._obs_shape = (self._features.size,)
+            self._obs_dtype = np.float32
+        self._frame_ptrs = [ffi.cast('uint8_t *', frame.ctypes.data) for frame in self._frames]
+        # Observations are written here, when set; see set_obs_buffer
+        self._obs_buffer = None
+        self._obs_ptr = None
         
         self.reward_range = (0, float('inf'))
         self.action_space = spaces.Discrete(len(self._action_set))
-        self.observation_space = spaces.Box(
-            low=0, 
-            high=self._pixel_high, 
-            shape=self._dim, 
-            dtype='uint8')
+        if self._features is not None:
+            self.observation_space = spaces.Box(
+                low=-np.inf,
+                high=np.inf,
+                shape=self._obs_shape,
+                dtype=np.float32)
+        else:
+            self.observation_space = spaces.Box(
+                low=0, 
+                high=self._pixel_high, 
+                shape=self._dim, 
+                dtype='uint8')
     
     def seed(self, seed=None):
         """
@@ -100,6 +149,52 @@ class ToyboxBaseEnv(AtariEnv, ABC):
     def _get_obs(self):
         return self.toybox.get_state()
 
+    def _render_into(self, out, ptr):
+        # Renders the current frame into out, a C-contiguous uint8 array, without allocating
+        lib.render_current_frame(ptr, out.size, self.toybox.grayscale, 
+            self.toybox.rsimulator.get_simulator(), self.toybox.rstate.get_state())
+        return out
+
+    def _render(self, i):
+        return self._render_into(self._frames[i], self._frame_ptrs[i])
+
+    def _observe(self, pooled):
+        # Writes the current observation once: into the observation buffer, if set, or a new array
+        out, ptr = self._obs_buffer, self._obs_ptr
+        if self._features is not None:
+            return self._features(self.toybox, out=out)
+        if self._resize is not None:
+            frame = np.maximum(self._frames[0], self._render(1), out=self._frames[0]) if pooled else self._render(1)
+            return self._resize(frame, out=out)
+        if out is None:
+            out = np.empty(self._frames.shape[1:], dtype=np.uint8)
+            ptr = None if pooled else ffi.cast('uint8_t *', out.ctypes.data)
+        if pooled:
+            return np.maximum(self._frames[0], self._render(1), out=out)
+        return self._render_into(out, ptr)
+
+    def set_obs_buffer(self, buffer=True):
+        """Makes step and reset write each observation into one buffer, and return it, rather than a new array.
+
+        buffer is a C-contiguous array with the shape and dtype of an observation (e.g., a row of a batch of 
+        observations), or True for a buffer owned by the env; None restores the default. Every 
+        step overwrites the buffer, so callers that keep an observation must copy it. Returns the buffer."""
+        if buffer is None or buffer is False:
+            self._obs_buffer = self._obs_ptr = None
+            return None
+        if buffer is True:
+            buffer = np.zeros(self._obs_shape, dtype=self._obs_dtype)
+        if buffer.shape != self._obs_shape or buffer.dtype != self._obs_dtype or not buffer.flags['C_CONTIGUOUS']:
+            raise ValueError('Observation buffers must be C-contiguous %s arrays of shape %s' % (np.dtype(self._obs_dtype).name, self._obs_shape))
+        self._obs_buffer = buffer
+        self._obs_ptr = ffi.cast('uint8_t *', buffer.ctypes.data)
+        return buffer
+
+    def _num_ticks(self):
+        if isinstance(self.frameskip, int):
+            return self.frameskip
+        return self.np_random.randint(self.frameskip[0], self.frameskip[1])
+
     def step(self, action_index):
         obs = None
         reward = None
@@ -111,14 +206,22 @@ class ToyboxBaseEnv(AtariEnv, ABC):
         assert(action_index < len(self._action_set))
         assert(type(self._action_set)== list)
     
-        self.toybox.apply_ale_action(self._action_set[action_index])
+        action = self._action_set[action_index]
+        if self.cached_state is not None and self.cached_state.state is self.toybox.rstate:
+            # Stepping past a game over: the snapshot shares the state we are about to change
+            self.cached_state.freeze()
+        ticks = max(self._num_ticks(), 1)
+        for tick in range(ticks):
+            self.toybox.apply_ale_action(action)
+            if self.ale.game_over():
+                break
+            if self.max_pool and self._features is None and tick == ticks - 2:
+                self._render(0)
 
-        if self.ale.game_over():
-            print('GAME OVER')
-            info['cached_state'] = self.toybox.to_state_json()
+        if self.capture_final_state and self.ale.game_over():
+            self.cached_state = info['cached_state'] = codec.StateSnapshot(self.toybox)
 
-        obs = self._get_obs()
-        
+        obs = self._observe(self.max_pool and ticks > 1 and tick == ticks - 1)
         
         # Compute the reward from the current score and reset the current score.
         score = self.toybox.get_score()
@@ -137,10 +240,11 @@ class ToyboxBaseEnv(AtariEnv, ABC):
         return obs, reward, done, info
 
     def reset(self):
-        self.cached_state = self.toybox.to_state_json()
+        # new_game replaces the state, so the snapshot needs no copy
+        self.cached_state = codec.StateSnapshot(self.toybox) if self.capture_final_state else None
         self.toybox.new_game()
         self.score = self.toybox.get_score()
-        obs = self._get_obs()
+        obs = self._observe(False)
         return obs
 
     def render(self, mode='human', close=False):
@@ -159,3 +263,54 @@ class ToyboxBaseEnv(AtariEnv, ABC):
             self.viewer.close()
         del self.toybox
         self.toybox = None
+
+
+if __name__ == "__main__":
+    from toybox.envs.atari.amidar import AmidarEnv
+    from toybox.envs.atari.breakout import BreakoutEnv
+    from toybox.envs.atari.space_invaders import SpaceInvadersEnv
+
+    def sync(env, other):
+        # Copies the config and state of env into other
+        codec.write_config(other.toybox, codec.config_bytes(env.toybox), new_game=False)
+        codec.write_state(other.toybox, codec.state_bytes(env.toybox))
+        other.score = env.score
+
+    # Stepping with frameskip=4 matches four frameskip=1 steps in lockstep: the rewards add up, 
+    # and the observation is the pixelwise max of the last two frames (downsampled after pooling, 
+    # with obs_size), or the final frame if the game ended early. Observation buffers change nothing.
+    for clz in [BreakoutEnv, SpaceInvadersEnv, AmidarEnv]:
+        for obs_size, buffered in [(None, False), (None, True), ((84, 84), False), ((84, 84), True)]:
+            skip = clz(frameskip=4, obs_size=obs_size)
+            single = clz(frameskip=1)
+            if buffered:
+                skip.set_obs_buffer()
+            resize = AreaResize(single._obs_shape[:2], obs_size) if obs_size is not None else None
+            rng = np.random.RandomState(0)
+            skip.seed(0)
+            skip.reset()
+            sync(skip, single)
+            pooled = 0
+            for step in range(300):
+                action = rng.randint(skip.action_space.n)
+                obs, reward, done, _ = skip.step(action)
+                frames, total = [], 0
+                for tick in range(4):
+                    frame, r, single_done, _ = single.step(action)
+                    frames.append(frame.copy())
+                    total += r
+                    if single_done: break
+                expected = np.maximum(frames[2], frames[3]) if len(frames) == 4 else frames[-1]
+                pooled += len(frames) == 4 and (frames[2] != frames[3]).any()
+                if resize is not None:
+                    expected = resize(expected)
+                assert obs.shape == expected.shape and (obs == expected).all(), (clz.__name__, obs_size, step)
+                assert (reward, done) == (total, single_done), (clz.__name__, obs_size, step)
+                if done:
+                    skip.reset()
+                    sync(skip, single)
+            # the last two frames did differ, so pooling was exercised
+            assert pooled > 0, clz.__name__
+            skip.close()
+            single.close()
+    print('frameskip and max-pooling match stepping one tick at a time')
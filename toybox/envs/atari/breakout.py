@@ -4,9 +4,12 @@ from toybox.envs.atari.constants import *
 
 
 class BreakoutEnv(ToyboxBaseEnv):
-    def __init__(self, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False): 
-        super().__init__(Toybox('breakout', grayscale), 
+    def __init__(self, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False, obs_size=None, obs_type='image', capture_final_state=False): 
+        super().__init__(Toybox('breakout', grayscale), 'breakout',
             frameskip, repeat_action_probability,
             grayscale=grayscale, 
-            alpha=alpha)
+            alpha=alpha,
+            obs_size=obs_size,
+            obs_type=obs_type,
+            capture_final_state=capture_final_state)
 
@@ -6,8 +6,8 @@ import json
 
 
 class GridWorldEnv(ToyboxBaseEnv):
-    def __init__(self, frameskip=(0, 0), repeat_action_probability=0., grayscale=True, alpha=False): 
-        super().__init__(Toybox('gridworld', grayscale), 
+    def __init__(self, frameskip=1, repeat_action_probability=0., grayscale=True, alpha=False): 
+        super().__init__(Toybox('gridworld', grayscale), 'gridworld',
             frameskip, repeat_action_probability,
             grayscale=grayscale, 
             alpha=alpha)
@@ -4,13 +4,16 @@ from toybox.envs.atari.constants import *
 
 class SpaceInvadersEnv(ToyboxBaseEnv):
 
-    def __init__(self, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False):
+    def __init__(self, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False, obs_size=None, obs_type='image', capture_final_state=False):
       tb = Toybox('space_invaders', grayscale)
-      super().__init__(tb, 
+      super().__init__(tb, 'space_invaders',
         frameskip,
         repeat_action_probability,
         grayscale=grayscale,
-        alpha=alpha)
+        alpha=alpha,
+        obs_size=obs_size,
+        obs_type=obs_type,
+        capture_final_state=capture_final_state)
 
     def _action_to_input(self):
       pass      
@@ -0,0 +1,4 @@
+# The Atari envs, observing feature vectors (obs_type='features'; see toybox.features).
+# They are registered from this module so that baselines, which names env types after 
+# entry point modules, treats them as 'features' envs: no frame wrappers, and an mlp.
+from toybox.envs.atari import BreakoutEnv, AmidarEnv, SpaceInvadersEnv
@@ -0,0 +1,375 @@
+from toybox import codec
+from ctoybox import Toybox
+from abc import ABC, abstractmethod
+import re
+import numpy as np
+""" Feature-vector observations: the objects of a game state as a flat float32 array, for non-pixel agents.
+
+Each game has a fixed schema (see names), sized from a starting state: e.g., a Breakout schema
+has one entry per brick. Features are read straight from the simulator's JSON bytes with
+compiled patterns, so a step never builds a Python dict; from_state is the equivalent on a
+decoded state, and the tests check that the two agree. Positions and velocities are in
+simulator units.
+
+The patterns depend on the order in which the simulator writes keys, and on some keys (e.g., 
+alive in Breakout) belonging to one kind of object. Each schema lists those assumptions (see 
+layout and owned_keys), and checks them against the state it is sized from."""
+
+NUM = rb'(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)'
+
+def _pattern(template):
+  return re.compile(template.replace(b'N', NUM))
+
+def _flags(matches):
+  # [b't', b'f', ...] from a (t|f) group -> bool array
+  return np.frombuffer(b''.join(matches), dtype=np.uint8) == ord('t')
+
+def _key_paths(obj, key, path=()):
+  # Paths (tuples of dict keys; list positions are left out) of the dicts in obj that have key
+  if isinstance(obj, dict):
+    if key in obj: yield path
+    for k, v in obj.items():
+      yield from _key_paths(v, key, path + (k,))
+  elif isinstance(obj, list):
+    for v in obj:
+      yield from _key_paths(v, key, path)
+
+
+class Features(ABC):
+  """
+  >>> features = feature_schema(tb)
+  >>> x = features(tb)          # float32 array of features.size
+  >>> x[features.index('ball_x')]
+  """
+  game_name = None
+  # (path, keys): the keys of the object at path (dict keys; list elements are checked in 
+  # turn) must appear in this order
+  layout = []
+  # key -> the path of the only objects that have it
+  owned_keys = {}
+
+  def __init__(self, names):
+    self.names = names
+    self.size = len(names)
+    self._index = dict([(name, i) for i, name in enumerate(names)])
+
+  def index(self, name):
+    return self._index[name]
+
+  def __call__(self, state, out=None):
+    """Writes the features of state (a Toybox, or its UTF-8 JSON) into out, if given, or a new array."""
+    if isinstance(state, Toybox):
+      state = codec.state_bytes(state)
+    if out is None:
+      out = np.empty(self.size, dtype=np.float32)
+    self.parse(state, out)
+    return out
+
+  @abstractmethod
+  def parse(self, data, out): pass
+
+  @abstractmethod
+  def from_state(self, state):
+    """The features of a decoded state dict."""
+    pass
+
+  def check_layout(self, state):
+    """Raises ValueError if the state's keys are not written the way the patterns expect."""
+    for path, keys in self.layout:
+      objs = [state]
+      for key in path:
+        objs = [obj[key] for obj in objs]
+        objs = [elt for obj in objs for elt in (obj if isinstance(obj, list) else [obj]) if elt is not None]
+      for obj in objs:
+        if [key for key in obj.keys() if key in keys] != keys:
+          raise ValueError('The %s feature schema expects the keys %s at %s in that order; the state has %s' % (
+            self.game_name, keys, '.'.join(path) or 'the top level', list(obj.keys())))
+    for key, owner in self.owned_keys.items():
+      for path in _key_paths(state, key):
+        if path != owner:
+          raise ValueError('The %s feature schema expects only %s to have %s; %s does' % (
+            self.game_name, '.'.join(owner), key, '.'.join(path) or 'the state'))
+
+  def search(self, pattern, data, pos=0):
+    match = pattern.search(data, pos)
+    if match is None:
+      raise ValueError('State does not match the %s feature schema' % self.game_name)
+    return match
+
+  def check(self, what, n, expected):
+    if n != expected:
+      raise ValueError('The %s feature schema has %d %s; the state has %d' % (self.game_name, expected, what, n))
+
+
+class BreakoutFeatures(Features):
+  game_name = 'breakout'
+  scalars = ['lives', 'ball', 'ball_x', 'ball_y', 'ball_vx', 'ball_vy', 'paddle_x', 'paddle_y', 'paddle_vx', 'paddle_width']
+
+  lives = _pattern(rb'"lives":N')
+  ball = _pattern(rb'"balls":\[(?:\{"position":\{"x":N,"y":N\},"velocity":\{"x":N,"y":N\})?')
+  paddle = _pattern(rb'"paddle":\{"position":\{"x":N,"y":N\},"velocity":\{"x":N,"y":N\}\},"paddle_width":N')
+  alive = re.compile(rb'"alive":(t|f)')
+
+  layout = [((), ['lives', 'balls', 'paddle', 'paddle_width', 'bricks']), (('balls',), ['position', 'velocity']), 
+            (('paddle',), ['position', 'velocity']), (('balls', 'position'), ['x', 'y']), (('balls', 'velocity'), ['x', 'y']), 
+            (('paddle', 'position'), ['x', 'y']), (('paddle', 'velocity'), ['x', 'y'])]
+  owned_keys = {'alive' : ('bricks',)}
+
+  def __init__(self, state):
+    self.check_layout(state)
+    self.num_bricks = len(state['bricks'])
+    super().__init__(self.scalars + ['brick_%d' % i for i in range(self.num_bricks)])
+
+  def parse(self, data, out):
+    out[0] = float(self.search(self.lives, data).group(1))
+    ball = self.search(self.ball, data)
+    if ball.group(1) is None:
+      out[1:6] = 0
+    else:
+      out[1] = 1
+      out[2:6] = [float(v) for v in ball.groups()]
+    paddle = self.search(self.paddle, data, ball.end())
+    out[6] = float(paddle.group(1))
+    out[7] = float(paddle.group(2))
+    out[8] = float(paddle.group(3))
+    out[9] = float(paddle.group(5))
+    # bricks are the only objects that are alive (see owned_keys)
+    alive = _flags(self.alive.findall(data, paddle.end()))
+    self.check('bricks', len(alive), self.num_bricks)
+    out[10:] = alive
+
+  def from_state(self, state):
+    out = np.zeros(self.size, dtype=np.float32)
+    out[0] = state['lives']
+    if state['balls']:
+      ball = state['balls'][0]
+      out[1:6] = [1, ball['position']['x'], ball['position']['y'], ball['velocity']['x'], ball['velocity']['y']]
+    paddle = state['paddle']
+    out[6:10] = [paddle['position']['x'], paddle['position']['y'], paddle['velocity']['x'], state['paddle_width']]
+    self.check('bricks', len(state['bricks']), self.num_bricks)
+    out[10:] = [brick['alive'] for brick in state['bricks']]
+    return out
+
+
+class AmidarFeatures(Features):
+  game_name = 'amidar'
+  scalars = ['lives', 'jumps', 'chase_timer', 'player_x', 'player_y']
+
+  counters = _pattern(rb'"lives":N,"level":N,"jumps":N,"chase_timer":N')
+  position = _pattern(rb'"position":\{"x":N,"y":N\}')
+  painted = re.compile(rb'"painted":(t|f)')
+
+  layout = [((), ['lives', 'level', 'jumps', 'chase_timer', 'player', 'enemies', 'board']), (('board',), ['tiles', 'boxes']),
+            (('player', 'position'), ['x', 'y']), (('enemies', 'position'), ['x', 'y'])]
+  # the player and enemies have positions, and come before the board
+  owned_keys = {'painted' : ('board', 'boxes')}
+
+  def __init__(self, state):
+    self.check_layout(state)
+    positions = set(_key_paths(state, 'position'))
+    if not positions <= set([('player',), ('enemies',)]):
+      raise ValueError('The amidar feature schema expects only the player and enemies to have positions')
+    self.num_enemies = len(state['enemies'])
+    self.board_shape = (state['board']['height'], state['board']['width'])
+    self.num_tiles = self.board_shape[0] * self.board_shape[1]
+    self.num_boxes = len(state['board']['boxes'])
+    n = self.num_enemies
+    names = self.scalars + ['enemy_%d_x' % i for i in range(n)] + ['enemy_%d_y' % i for i in range(n)]
+    names += ['tile_%d_%d' % (ty, tx) for ty in range(self.board_shape[0]) for tx in range(self.board_shape[1])]
+    names += ['box_%d' % i for i in range(self.num_boxes)]
+    super().__init__(names)
+
+  def parse(self, data, out):
+    n = self.num_enemies
+    counters = self.search(self.counters, data)
+    out[0] = float(counters.group(1))
+    out[1] = float(counters.group(3))
+    out[2] = float(counters.group(4))
+    board = data.find(b'"board":', counters.end())
+    # the player's position, then each enemy's
+    positions = np.array(self.position.findall(data, counters.end(), board), dtype=np.float32)
+    self.check('enemies', len(positions) - 1, n)
+    out[3:5] = positions[0]
+    out[5:5 + n] = positions[1:, 0]
+    out[5 + n:5 + 2 * n] = positions[1:, 1]
+
+    # Tiles are serialized as their tags, whose first letters differ: Empty, Unpainted, Painted, ChaseMarker
+    # (the tile tags are checked when the schema is made; see feature_schema)
+    start = data.find(b'"tiles":', board)
+    end = data.find(b']],', start)
+    tiles = np.frombuffer(data, dtype=np.uint8, count=end - start, offset=start)
+    tags = tiles[1:][(tiles[:-1] == ord('"')) & (tiles[1:] >= ord('A')) & (tiles[1:] <= ord('Z'))]
+    self.check('tiles', len(tags), self.num_tiles)
+    offset = 5 + 2 * n
+    out[offset:offset + self.num_tiles] = tags == ord('P')
+    painted = _flags(self.painted.findall(data, end))
+    self.check('boxes', len(painted), self.num_boxes)
+    out[offset + self.num_tiles:] = painted
+
+  def from_state(self, state):
+    n = self.num_enemies
+    out = np.zeros(self.size, dtype=np.float32)
+    self.check('enemies', len(state['enemies']), n)
+    out[0:5] = [state['lives'], state['jumps'], state['chase_timer'], state['player']['position']['x'], state['player']['position']['y']]
+    out[5:5 + n] = [enemy['position']['x'] for enemy in state['enemies']]
+    out[5 + n:5 + 2 * n] = [enemy['position']['y'] for enemy in state['enemies']]
+    offset = 5 + 2 * n
+    tiles = [tile == 'Painted' for row in state['board']['tiles'] for tile in row]
+    self.check('tiles', len(tiles), self.num_tiles)
+    out[offset:offset + self.num_tiles] = tiles
+    self.check('boxes', len(state['board']['boxes']), self.num_boxes)
+    out[offset + self.num_tiles:] = [box['painted'] for box in state['board']['boxes']]
+    return out
+
+
+class SpaceInvadersFeatures(Features):
+  game_name = 'space_invaders'
+  scalars = ['lives', 'ship_x', 'ship_y', 'ship_alive', 'laser', 'laser_x', 'laser_y', 'ufo_x', 'ufo_y']
+
+  lives = _pattern(rb'"lives":N')
+  ship = _pattern(rb'"ship":\{"x":N,"y":N,.*?"alive":(t|f)')
+  ship_laser = _pattern(rb'"ship_laser":(?:null|\{"x":N,"y":N)')
+  enemy = _pattern(rb'\{"x":N,"y":N,"row":\d+,"col":\d+,"id":\d+,"alive":(t|f)')
+  enemy_laser = _pattern(rb'\{"x":N,"y":N,"w"')
+  ufo = _pattern(rb'"ufo":\{"x":N,"y":N')
+
+  layout = [((), ['lives', 'ship', 'ship_laser', 'shields', 'enemies', 'enemy_lasers', 'ufo']), 
+            (('ship',), ['x', 'y', 'alive']), (('ship_laser',), ['x', 'y', 'w']), 
+            (('enemies',), ['x', 'y', 'row', 'col', 'id', 'alive']), (('enemy_lasers',), ['x', 'y', 'w']), (('ufo',), ['x', 'y'])]
+
+  def __init__(self, state, max_enemy_lasers=4):
+    """Enemy lasers fill max_enemy_lasers slots, in the order they were fired; any beyond are left out."""
+    self.check_layout(state)
+    self.num_enemies = len(state['enemies'])
+    self.max_enemy_lasers = max_enemy_lasers
+    n, m = self.num_enemies, max_enemy_lasers
+    names = self.scalars + ['enemy_%d_alive' % i for i in range(n)] + ['enemy_%d_x' % i for i in range(n)] + ['enemy_%d_y' % i for i in range(n)]
+    names += ['enemy_laser_%d' % i for i in range(m)] + ['enemy_laser_%d_x' % i for i in range(m)] + ['enemy_laser_%d_y' % i for i in range(m)]
+    super().__init__(names)
+
+  def parse(self, data, out):
+    n, m = self.num_enemies, self.max_enemy_lasers
+    out[0] = float(self.search(self.lives, data).group(1))
+    ship = self.search(self.ship, data)
+    out[1] = float(ship.group(1))
+    out[2] = float(ship.group(2))
+    out[3] = ship.group(3) == b't'
+    laser = self.search(self.ship_laser, data, ship.end())
+    if laser.group(1) is None:
+      out[4:7] = 0
+    else:
+      out[4:7] = [1, float(laser.group(1)), float(laser.group(2))]
+
+    # Skip the shields' sprites, which are most of the state
+    start = data.find(b'"enemies":[', laser.end())
+    lasers = data.find(b'"enemy_lasers":[', start)
+    enemies = self.enemy.findall(data, start, lasers)
+    self.check('enemies', len(enemies), n)
+    offset = 9
+    out[offset:offset + n] = _flags([enemy[2] for enemy in enemies])
+    out[offset + n:offset + 3 * n].reshape(2, n).T[...] = [enemy[:2] for enemy in enemies]
+
+    ufo = self.search(self.ufo, data, lasers)
+    out[7] = float(ufo.group(1))
+    out[8] = float(ufo.group(2))
+    offset += 3 * n
+    out[offset:] = 0
+    enemy_lasers = self.enemy_laser.findall(data, lasers, ufo.start())[:m]
+    if enemy_lasers:
+      k = len(enemy_lasers)
+      out[offset:offset + k] = 1
+      out[offset + m:offset + 3 * m].reshape(2, m)[:, :k].T[...] = enemy_lasers
+
+  def from_state(self, state):
+    n, m = self.num_enemies, self.max_enemy_lasers
+    out = np.zeros(self.size, dtype=np.float32)
+    ship, laser, ufo = state['ship'], state['ship_laser'], state['ufo']
+    out[0:4] = [state['lives'], ship['x'], ship['y'], ship['alive']]
+    if laser:
+      out[4:7] = [1, laser['x'], laser['y']]
+    out[7:9] = [ufo['x'], ufo['y']]
+    self.check('enemies', len(state['enemies']), n)
+    offset = 9
+    for i, enemy in enumerate(state['enemies']):
+      out[offset + i], out[offset + n + i], out[offset + 2 * n + i] = enemy['alive'], enemy['x'], enemy['y']
+    offset += 3 * n
+    for i, laser in enumerate(state['enemy_lasers'][:m]):
+      out[offset + i], out[offset + m + i], out[offset + 2 * m + i] = 1, laser['x'], laser['y']
+    return out
+
+
+schemas = { 'breakout' : BreakoutFeatures, 'amidar' : AmidarFeatures, 'space_invaders' : SpaceInvadersFeatures }
+
+def feature_schema(tb, **kwargs):
+  """The feature schema for the game tb is playing, sized from its current state.
+
+  Raises ValueError if the simulator's JSON is not laid out as the schema expects."""
+  if tb.game_name not in schemas:
+    raise ValueError('No feature schema for %s' % tb.game_name)
+  data = codec.state_bytes(tb)
+  state = codec.loads(data)
+  schema = schemas[tb.game_name](state, **kwargs)
+  if not (schema(data) == schema.from_state(state)).all():
+    raise ValueError('The %s feature schema does not read the simulator\'s JSON correctly' % tb.game_name)
+  return schema
+
+
+if __name__ == "__main__":
+  import time
+
+  for game in ['amidar', 'breakout', 'space_invaders']:
+    with Toybox(game) as tb:
+      features = feature_schema(tb)
+      assert len(features.names) == len(set(features.names)) == features.size
+      rng = np.random.RandomState(0)
+      actions = tb.get_legal_action_set()
+      out = np.zeros(features.size, dtype=np.float32)
+      seen = np.zeros(features.size, dtype=bool)
+      for i in range(3000):
+        if tb.game_over(): tb.new_game()
+        tb.apply_ale_action(actions[rng.randint(len(actions))])
+        # reading the JSON bytes agrees with reading the decoded state
+        expected = features.from_state(tb.to_state_json())
+        assert features(tb, out=out) is out
+        assert (out == expected).all(), [features.names[j] for j in np.flatnonzero(out != expected)]
+        seen |= out != 0
+      print('%s: %d features, %d of which were nonzero' % (game, features.size, seen.sum()))
+
+      n = 2000
+      start = time.time()
+      for _ in range(n): features(tb, out=out)
+      fast = (time.time() - start) / n
+      start = time.time()
+      for _ in range(n): features.from_state(codec.state_json(tb))
+      slow = (time.time() - start) / n
+      print('%s: %.0fus per state from JSON bytes, %.0fus from a decoded state' % (game, fast * 1e6, slow * 1e6))
+
+      # a state that does not fit the schema is rejected
+      state = tb.to_state_json()
+      key = {'amidar' : 'enemies', 'breakout' : 'bricks', 'space_invaders' : 'enemies'}[game]
+      state[key] = state[key][1:]
+      tb.write_state_json(state)
+      try:
+        features(tb)
+        assert False, 'schemas have a fixed size'
+      except ValueError: pass
+
+  with Toybox('space_invaders') as tb:
+    features = feature_schema(tb)
+    assert features.index('ship_x') == 1 and features(tb)[features.index('lives')] == tb.get_lives()
+
+  # schemas check the key order and ownership they rely on
+  with Toybox('breakout') as tb:
+    state = tb.to_state_json()
+    BreakoutFeatures(state)
+    paddle = state['paddle']
+    for bad in [dict(state, paddle={'velocity' : paddle['velocity'], 'position' : paddle['position']}),
+                dict(state, paddle=dict(paddle, alive=True))]:
+      try:
+        BreakoutFeatures(bad)
+        assert False, 'schemas reject layouts their patterns cannot read'
+      except ValueError: pass
+  try:
+    Features(['x'])
+    assert False, 'Features is abstract'
+  except TypeError: pass
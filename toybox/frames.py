@@ -0,0 +1,119 @@
+import numpy as np
+""" Frame processing for observations, without OpenCV.
+
+AreaResize downsamples frames like cv2.resize(frame, size, interpolation=cv2.INTER_AREA): every
+output pixel is the mean of the input pixels it covers, weighted by how much of each it covers.
+The weights are precomputed as two matrices, so a resize is two small matrix products."""
+
+def area_weights(n_in, n_out):
+  """(n_out, n_in) matrix whose rows average the input samples covered by each output sample."""
+  assert n_out <= n_in, 'AreaResize only downsamples'
+  scale = n_in / n_out
+  weights = np.zeros((n_out, n_in), dtype=np.float64)
+  for i in range(n_out):
+    start, end = i * scale, (i + 1) * scale
+    for j in range(int(np.floor(start)), min(int(np.ceil(end)), n_in)):
+      weights[i, j] = min(end, j + 1) - max(start, j)
+  return weights / scale
+
+
+class AreaResize(object):
+  """
+  >>> resize = AreaResize((250, 160), (84, 84))
+  >>> small = resize(frame)    # (84, 84, 1) uint8, from a (250, 160, 1) grayscale frame
+  """
+
+  def __init__(self, in_shape, out_shape):
+    """
+    Parameters
+    ---
+    in_shape : (int, int)
+      Height and width of the input frames
+    out_shape : (int, int)
+      Height and width of the output frames; each at most the input's
+    """
+    self.in_shape = tuple(in_shape)
+    self.out_shape = tuple(out_shape)
+    self.rows = area_weights(self.in_shape[0], self.out_shape[0]).astype(np.float32)
+    self.cols = area_weights(self.in_shape[1], self.out_shape[1]).T.astype(np.float32)
+    # Scratch space for the input as floats, the intermediate product and the unrounded result
+    self.input = np.empty(self.in_shape, dtype=np.float32)
+    self.scratch = np.empty((self.out_shape[0], self.in_shape[1]), dtype=np.float32)
+    self.result = np.empty(self.out_shape, dtype=np.float32)
+
+  def __call__(self, frame, out=None):
+    """Resizes a single-channel (h, w) or (h, w, 1) uint8 frame into out, if given, or a new (h', w', 1) array."""
+    if out is None:
+      out = np.empty(self.out_shape + (1,), dtype=np.uint8)
+    self.input[...] = frame.reshape(self.in_shape)
+    np.matmul(self.rows, self.input, out=self.scratch)
+    np.matmul(self.scratch, self.cols, out=self.result)
+    # Round halves up, as cv2's INTER_AREA does for uint8 at integer ratios
+    np.add(self.result, 0.5, out=self.result)
+    np.floor(self.result, out=self.result)
+    out.reshape(self.out_shape)[...] = self.result
+    return out
+
+
+if __name__ == "__main__":
+  from ctoybox import Toybox
+  import time
+
+  def reference(frame, out_shape):
+    # Direct area averaging, one output pixel at a time
+    h, w = frame.shape
+    sy, sx = h / out_shape[0], w / out_shape[1]
+    out = np.zeros(out_shape)
+    for i in range(out_shape[0]):
+      for j in range(out_shape[1]):
+        total = 0.0
+        for y in range(int(i * sy), min(int(np.ceil((i + 1) * sy)), h)):
+          wy = min((i + 1) * sy, y + 1) - max(i * sy, y)
+          for x in range(int(j * sx), min(int(np.ceil((j + 1) * sx)), w)):
+            wx = min((j + 1) * sx, x + 1) - max(j * sx, x)
+            total += wy * wx * frame[y, x]
+        out[i, j] = total / (sy * sx)
+    return out
+
+  # Fidelity against fixed references, so it is checked without cv2 too. Each row of the first 
+  # is the output of cv2.resize(src, (2, 1), interpolation=cv2.INTER_AREA) for a 1x3 src: output 
+  # pixels cover one and a half inputs, and round to nearest. At integer ratios INTER_AREA is 
+  # the block mean, rounded half up: (sum + 2) >> 2 for 2x2 blocks.
+  fixed = [([0, 100, 200], [33, 167]), ([255, 0, 255], [170, 170]), ([10, 20, 31], [13, 27])]
+  row = AreaResize((1, 3), (1, 2))
+  for src, expected in fixed:
+    assert row(np.array([src], dtype=np.uint8))[0, :, 0].tolist() == expected, (src, expected)
+  blocks = np.random.RandomState(0).randint(0, 256, size=(168, 168)).astype(np.uint8)
+  expected = (blocks.reshape(84, 2, 84, 2).astype(int).sum(axis=(1, 3)) + 2) >> 2
+  assert (AreaResize((168, 168), (84, 84))(blocks)[:, :, 0] == expected).all()
+
+  try:
+    import cv2
+  except ImportError:
+    cv2 = None
+    print('skipping comparison with cv2.resize; not installed')
+
+  for game in ['amidar', 'breakout', 'space_invaders']:
+    with Toybox(game) as tb:
+      actions = tb.get_legal_action_set()
+      for i in range(50): tb.apply_ale_action(actions[i % len(actions)])
+      frame = tb.get_state()
+      resize = AreaResize(frame.shape[:2], (84, 84))
+      small = resize(frame)
+      assert small.shape == (84, 84, 1) and small.dtype == np.uint8
+
+      # matches area averaging to within rounding
+      assert np.abs(small[:, :, 0] - reference(frame[:, :, 0].astype(float), (84, 84))).max() <= 0.5 + 1e-3
+      if cv2 is not None:
+        expected = cv2.resize(frame[:, :, 0], (84, 84), interpolation=cv2.INTER_AREA)
+        assert np.abs(small[:, :, 0].astype(int) - expected).max() <= 1
+
+      # constant frames stay constant, and a caller's buffer is filled in place
+      out = np.zeros((84, 84, 1), dtype=np.uint8)
+      assert resize(np.full(frame.shape, 200, dtype=np.uint8), out=out) is out
+      assert (out == 200).all()
+
+      n = 2000
+      start = time.time()
+      for _ in range(n): resize(frame, out=out)
+      print('%s: %dx%d -> 84x84 at %.0f frames/sec' % ((game,) + frame.shape[:2] + (n / (time.time() - start),)))
@@ -2,7 +2,10 @@ from toybox.interventions.base import *
 from toybox.interventions.core import * 
 
 import json
+import numbers
 import random
+import weakref
+import numpy as np
 """An API for interventions on Amidar."""
 
 # Someday all of these objects will be auto-generated by the Rust. 
@@ -17,7 +20,7 @@ class Amidar(Game):
     score=None, player=None, lives=None, rand=None, level=None,
     enemies=None, jumps=None, jump_timer=None, chase_timer=None, board=None):
     super().__init__(intervention, score, lives, rand, level)
-    self.enemies = EnemyCollection.decode(intervention, enemies, EnemyCollection)
+    self.enemies = Lazy.decode(intervention, enemies, EnemyCollection)
     self.jumps = jumps
     self.jump_timer = jump_timer
     self.chase_timer = chase_timer
@@ -86,7 +89,7 @@ class MovementAI(BaseMixin):
     def encode(self):
       args = {}
       for k, v in self.__dict__.items():
-        if k not in self.immutable_fields and v is not None and k != 'protocol' :
+        if k not in self.immutable_fields and v is not None and k != 'protocol' and not k.startswith('_'):
           args[k] = v.encode() if isinstance(v, BaseMixin) else v
       return { self.protocol: args }
 
@@ -138,21 +141,54 @@ class Board(BaseMixin):
       self.height = height
       self.chase_junctions = chase_junctions
       self.junctions = junctions
-      self.boxes = BoxCollection.decode(intervention, boxes,  BoxCollection)
-      self.tiles = TileCollection.decode(intervention, tiles, TileCollection)
+      self.boxes = Lazy.decode(intervention, boxes, BoxCollection)
+      self.tiles = Lazy.decode(intervention, tiles, TileCollection)
   
 
 class TileCollection(Collection):
     # Convenience class to deal with the fact that the tiles blob is
-    # an array of arrays, which messes up how our recursive decode calls
+    # an array of arrays, which messes up how our recursive decode calls.
+    # The board is stored as a grid of tag codes (indices into Tile.tags), 
+    # indexed [ty, tx], so that whole-board queries and edits are vectorized. 
+    # Tile objects are views onto the grid, built the first time they are needed.
 
-    immutable_fields = Collection.immutable_fields + ['tiles']
+    immutable_fields = Collection.immutable_fields + ['tiles', 'tags', 'source_tags', 'rows']
 
     def __init__(self, intervention, tiles):
       self.intervention = intervention
-      self.coll = []
-      for row in tiles:
-        self.coll.append([Tile.decode(intervention, tile, Tile) for tile in row])
+      codes = Tile.codes
+      self.tags = np.array([[codes[tile] for tile in row] for row in tiles], dtype=np.uint8)
+      # Edits go through set_tags, so that they are committed
+      self.tags.flags.writeable = False
+      self.source_tags = self.tags.copy()
+      self.rows = None
+
+    @property
+    def coll(self):
+      if self.rows is None:
+        rows = []
+        for ty in range(self.tags.shape[0]):
+          rows.append([Tile(self.intervention, grid=self, tx=tx, ty=ty) for tx in range(self.tags.shape[1])])
+          for tile in rows[-1]: self.adopt(tile)
+        # Building views is not a mutation, so bypass dirty tracking.
+        self.__dict__['rows'] = rows
+      return self.rows
+
+    def mask(self, *tags):
+      """Boolean grid that is True wherever the tile has one of the input tags."""
+      return np.isin(self.tags, [Tile.codes[tag] for tag in tags])
+
+    def tag_count(self, tag):
+      """Number of tiles with the input tag."""
+      return int(np.count_nonzero(self.tags == Tile.codes[tag]))
+
+    def set_tags(self, tag, where):
+      """Sets the tag of every tile selected by where: a boolean mask, a (ty, tx) index, or a region of slices."""
+      assert tag in Tile.tags, 'Unrecognized tile tag: %s' % tag
+      self.tags.flags.writeable = True
+      self.tags[where] = Tile.codes[tag]
+      self.tags.flags.writeable = False
+      self.mark_dirty()
 
     def remove(self):
       raise ValueError('Cannot remove tiles from the board.')
@@ -167,12 +203,18 @@ class TileCollection(Collection):
       return TileCollection(intervention, tiles)
 
     def encode(self):
-      return [[t.encode() for t in row] for row in self.coll]
+      # Rows without a modified tile are re-emitted as they were read.
+      names = Tile.tags
+      sources = self._source or [None] * len(self.tags)
+      changed = (self.tags != self.source_tags).any(axis=1)
+      return [src if src is not None and not row_changed else [names[code] for code in row] 
+        for row, row_changed, src in zip(self.tags.tolist(), changed, sources)]
 
 class WorldPoint(BaseMixin):
 
     expected_keys = ['x', 'y']
     immutable_fields = ['intervention']
+    __slots__ = ('intervention', 'x', 'y')
   
     def __init__(self, intervention, x=None, y=None):
       assert type(x) is int
@@ -180,11 +222,15 @@ class WorldPoint(BaseMixin):
       self.y = y
       self.intervention = intervention
 
+    def encode(self):
+      return {'x' : self.x, 'y' : self.y}
+
 class BoxCollection(Collection):
 
     def __init__(self, intervention, boxes):
       self.intervention = intervention
       self.coll = [Box(intervention, **boxdat) for boxdat in boxes]
+      for box in self.coll: self.adopt(box)
 
     def decode(intervention, boxes, clz):
         return BoxCollection(intervention, boxes)
@@ -211,14 +257,34 @@ class Tile(BaseMixin):
     Painted = 'Painted'
     ChaseMarker = 'ChaseMarker'
     tags = [Empty, Unpainted, Painted, ChaseMarker]
+    codes = { tag : code for (code, tag) in enumerate(tags) }
     
     expected_keys = []
-    immutable_fields = ['intervention']
+    immutable_fields = ['intervention', 'grid', 'tx', 'ty']
+    __slots__ = ('intervention', 'grid', 'tx', 'ty', 'code')
 
-    def __init__(self, intervention, name):
-      assert name in Tile.tags, '%s not a valid tile tag' % name
+    def __init__(self, intervention, name=None, grid=None, tx=None, ty=None):
+      # Tiles on the board are views onto their TileCollection's tag grid;
+      # free-standing tiles hold their own tag code.
       self.intervention = intervention
-      self.tag = name
+      # A back-reference: the grid contains the tile, not the other way around.
+      object.__setattr__(self, 'grid', grid)
+      self.tx = tx
+      self.ty = ty
+      if grid is None:
+        assert name in Tile.tags, '%s not a valid tile tag' % name
+        self.code = Tile.codes[name]
+
+    @property
+    def tag(self):
+      if self.grid is None: return Tile.tags[self.code]
+      return Tile.tags[self.grid.tags[self.ty, self.tx]]
+
+    @tag.setter
+    def tag(self, name):
+      assert name in Tile.tags, '%s not a valid tile tag' % name
+      if self.grid is None: object.__setattr__(self, 'code', Tile.codes[name])
+      else: self.grid.set_tags(name, (self.ty, self.tx))
 
     def __eq__(self, other):
       return hasattr(other, 'tag') and self.tag == other.tag
@@ -235,15 +301,164 @@ class TilePoint(BaseMixin):
 
     expected_keys = ['tx', 'ty']
     immutable_fields = ['intervention']
+    __slots__ = ('intervention', 'tx', 'ty')
 
     def __init__(self, intervention, tx, ty):
         self.intervention = intervention
         self.tx = tx
         self.ty = ty
 
+    def encode(self):
+        return {'tx' : self.tx, 'ty' : self.ty}
+
     def __str__(self):
         return 'TilePoint {tx: %d, ty: %d}' % (self.tx, self.ty)
 
+class TileTransform(object):
+    """Converts between tile and world coordinates without a round trip through the simulator.
+
+    Tiles are axis-aligned rectangles of size (width, height) world units with tile (0, 0) at origin.
+    Conversions accept Python or NumPy integers, or NumPy arrays of coordinates. Transforms are derived 
+    from the simulator once per board layout and cached; a layout whose transform cannot be derived maps 
+    to None, and the intervention then falls back to querying the simulator."""
+
+    # board layout (tuple of config rows) -> TileTransform or None
+    cache = {}
+
+    def __init__(self, width, height, x0=0, y0=0):
+        self.width = width
+        self.height = height
+        self.x0 = x0
+        self.y0 = y0
+
+    def tile_to_world(self, tx, ty):
+        return self.x0 + tx * self.width, self.y0 + ty * self.height
+
+    def world_to_tile(self, x, y):
+        # Matches the simulator, which divides with truncation and then steps 
+        # negative coordinates one tile further from the origin.
+        def axis(v, size):
+            if isinstance(v, numbers.Integral):
+                v = int(v)
+                return -(-v // size) - 1 if v < 0 else v // size
+            return np.where(v < 0, -(-v // size) - 1, v // size)
+        return axis(x - self.x0, self.width), axis(y - self.y0, self.height)
+
+    def derive(toybox, tiles_wide, tiles_high):
+        """Fits a transform to the simulator's tile_to_world, and checks it against both of its queries."""
+        def to_world(tx, ty): return tuple(toybox.query_state_json('tile_to_world', {'tx' : tx, 'ty' : ty}))
+        def to_tile(x, y): return tuple(toybox.query_state_json('world_to_tile', {'x' : x, 'y' : y}))
+        x0, y0 = to_world(0, 0)
+        x1, y1 = to_world(1, 1)
+        transform = TileTransform(x1 - x0, y1 - y0, x0, y0)
+        if transform.width <= 0 or transform.height <= 0: return None
+        corners = [(0, 0), (1, 1), (tiles_wide - 1, tiles_high - 1), (-1, -1)]
+        for tx, ty in corners:
+            x, y = transform.tile_to_world(tx, ty)
+            if to_world(tx, ty) != (x, y): return None
+            for wx, wy in [(x, y), (x + transform.width - 1, y + transform.height - 1), (x - 1, y - 1)]:
+                if to_tile(wx, wy) != transform.world_to_tile(wx, wy): return None
+        return transform
+
+    def lookup(toybox, layout, tiles_wide, tiles_high):
+        """Returns the cached transform for the board layout, deriving it on first use."""
+        if layout not in TileTransform.cache:
+            TileTransform.cache[layout] = TileTransform.derive(toybox, tiles_wide, tiles_high)
+        return TileTransform.cache[layout]
+
+
+class BoardGraph(object):
+    """The walkable track of a board, as a graph of 4-connected tiles, with cached BFS distances.
+
+    Tiles are numbered in row-major order. Junctions are tiles where three or four tracks meet; the 
+    segments are the runs of track between them. Built once per set of walkable tiles and cached."""
+
+    # (height, width, walkable bytes) -> BoardGraph
+    cache = {}
+
+    # Direction -> (dtx, dty)
+    steps = [(Direction.Up, (0, -1)), (Direction.Down, (0, 1)), (Direction.Left, (-1, 0)), (Direction.Right, (1, 0))]
+
+    def __init__(self, walkable):
+        """walkable is a boolean grid, indexed [ty, tx]."""
+        self.walkable = np.array(walkable, dtype=bool)
+        self.walkable.setflags(write=False)
+        self.height, self.width = self.walkable.shape
+        # neighbors[i, d] is the tile one step in direction d from tile i, or -1
+        index = np.arange(self.walkable.size).reshape(self.walkable.shape)
+        padded = np.pad(np.where(self.walkable, index, -1), 1, constant_values=-1)
+        self.neighbors = np.stack([padded[1 + dty:1 + dty + self.height, 1 + dtx:1 + dtx + self.width].ravel()
+            for _, (dtx, dty) in BoardGraph.steps], axis=1)
+        self.neighbors[~self.walkable.ravel()] = -1
+        self.degree = (self.neighbors >= 0).sum(axis=1).reshape(self.walkable.shape)
+        # source tiles -> distance grid
+        self.distances = {}
+
+    def lookup(walkable):
+        """Returns the cached graph for the walkable tiles, building it on first use."""
+        key = walkable.shape + (np.packbits(walkable).tobytes(),)
+        graph = BoardGraph.cache.get(key)
+        if graph is None:
+            graph = BoardGraph.cache[key] = BoardGraph(walkable)
+        return graph
+
+    def junctions(self):
+        """Boolean grid of the tiles where three or more tracks meet."""
+        return self.walkable & (self.degree >= 3)
+
+    def segments(self):
+        """Lists the runs of track between junctions, each as an array of (tx, ty) from one end to the other."""
+        junctions = self.junctions().ravel()
+        seen = set()
+        segments = []
+        for start in np.flatnonzero(junctions):
+            for d in range(4):
+                step = self.neighbors[start, d]
+                if step < 0 or (start, step) in seen: continue
+                path, prev = [start, step], start
+                while not junctions[path[-1]]:
+                    nexts = [n for n in self.neighbors[path[-1]] if n >= 0 and n != prev]
+                    if not nexts: break
+                    prev = path[-1]
+                    path.append(nexts[0])
+                seen.add((path[-1], path[-2]))
+                segments.append(np.stack([np.array(path) % self.width, np.array(path) // self.width], axis=1))
+        return segments
+
+    def directions(self, tx, ty):
+        """The directions in which the track continues from tile (tx, ty)."""
+        row = self.neighbors[ty * self.width + tx]
+        return [direction for (direction, _), n in zip(BoardGraph.steps, row) if n >= 0]
+
+    def distance_grid(self, sources):
+        """BFS distance, in steps along the track, from each tile to the nearest source (tx, ty).
+
+        Unreachable and unwalkable tiles are infinitely far. Grids are cached, and read-only."""
+        sources = tuple(sorted(set([(int(tx), int(ty)) for tx, ty in sources])))
+        dist = self.distances.get(sources)
+        if dist is not None: return dist
+        dist = np.full(self.walkable.size, np.inf)
+        frontier = np.array([ty * self.width + tx for tx, ty in sources
+            if 0 <= tx < self.width and 0 <= ty < self.height and self.walkable[ty, tx]], dtype=int)
+        step = 0
+        while len(frontier):
+            dist[frontier] = step
+            step += 1
+            nexts = self.neighbors[frontier].ravel()
+            nexts = np.unique(nexts[nexts >= 0])
+            frontier = nexts[np.isinf(dist[nexts])]
+        dist = dist.reshape(self.walkable.shape)
+        dist.setflags(write=False)
+        if len(self.distances) >= 256:
+            self.distances.clear()
+        self.distances[sources] = dist
+        return dist
+
+    def distance(self, a, b):
+        """Steps along the track between tiles a and b, each an (tx, ty)."""
+        return self.distance_grid([a])[b[1], b[0]]
+
+
 class AmidarIntervention(Intervention):
 
     # Refactor notes (EMT 12/30/2019)
@@ -265,36 +480,49 @@ class AmidarIntervention(Intervention):
     regular = 'regular'
     modes = [jump, chase, regular]
 
-    def __init__(self, tb, game_name='amidar'):
+    # Toybox -> generator for random placements; see placement_rng
+    placement_rngs = weakref.WeakKeyDictionary()
+
+    def __init__(self, tb, game_name='amidar', lazy=False):
       # check that the simulation in tb matches the game name.
-      Intervention.__init__(self, tb, game_name, Amidar)
+      Intervention.__init__(self, tb, game_name, Amidar, lazy=lazy)
 
-    def get_random_tile(self, pred=lambda tile: True): 
+    def get_random_tile(self, pred=lambda tile: True, mask=None): 
       """Returns a random tile object, filtered by the input predicate.
       
       Arguments
       ====
       pred:
-        boolean function that takes an individual tile as a first argument
-        and the rest of the board as the second argument (for making global
-        decisions, e.g. only returning the tile if it is some minimum distance
-        away from other agents)
+        boolean function that takes an individual tile as its argument; 
+        the tile's board position is available as tile.tx, tile.ty
+      mask:
+        optional boolean grid over the board (e.g., from tile_mask); only
+        the tiles it selects are considered
       """
       # formerly get_random_tile_id
-      while True:
-        i = random.randint(0, self.game.board.height - 1)
-        j = random.randint(0, self.game.board.width - 1)
-        tile = self.game.board.tiles[i][j]
-        if pred(tile):
-            return tile
+      tp = self.get_random_tilepoint(pred, mask)
+      return self.get_tile_by_pos(tp.tx, tp.ty)
+
+    def get_random_tilepoint(self, pred=lambda tile: True, mask=None):
+      """Returns the TilePoint of a random tile that satisfies the predicate. See get_random_tile.
+
+      Tiles are tried in an order drawn from placement_rng."""
+      tiles = self.game.board.tiles
+      if mask is None:
+        mask = np.ones(tiles.tags.shape, dtype=bool)
+      tys, txs = np.nonzero(mask)
+      for i in self.placement_rng().permutation(len(tys)):
+        tx, ty = int(txs[i]), int(tys[i])
+        if pred(tiles[ty][tx]):
+          return TilePoint(self, tx=tx, ty=ty)
+      raise ValueError('No tiles that satisfy the input predicate found.')
 
     def get_random_track_position(self):
       """Utility function to get a random track tile."""
       # formerly get_random_position
-      # grab random tile
-      rand_tile = self.get_random_tile(lambda tile, board: tile.tag != 'Empty')  
-      # convert random tile to x,y location 
-      return rand_tile.to_world()
+      # grab random tile and convert it to an x,y location 
+      tp = self.get_random_tilepoint(mask=~self.tile_mask(Tile.Empty))
+      return self.tilepoint_to_worldpoint(tp)
 
     def get_regular_mode(self):
       """Predicate that tells us whether the agent is in 'regular' mode (i.e., not jumping, nor chasing enemies.)"""
@@ -391,87 +619,171 @@ class AmidarIntervention(Intervention):
 
     def is_tile_walkable(self, tile):
       # formerly check_tile_position(self, tdict)
-      return tile.tag != Tile.empty
+      return tile.tag != Tile.Empty
 
     def set_tile_tag(self, tile, tag):
+      """Sets the tag of a tile, or of every tile selected by a boolean mask or a region of (ty, tx) slices."""
       assert tag in Tile.tags, 'Unrecognized tile tag: %s' % tag
-      tile.tag = tag
+      if isinstance(tile, Tile):
+        tile.tag = tag
+      else:
+        self.game.board.tiles.set_tags(tag, tile)
 
     def get_tile_by_pos(self, tx, ty):
       return self.game.board.tiles[ty][tx]
 
-    def filter_tiles(self, pred=lambda t: True):
-      lst = []
-      for row in self.game.board.tiles:
-        for tile in row:
-          if pred(tile): lst.append(tile)
-      return lst
+    def tile_mask(self, *tags):
+      """Boolean grid, indexed [ty, tx], that is True wherever a tile has one of the input tags."""
+      return self.game.board.tiles.mask(*tags)
+
+    def num_painted_tiles(self):
+      return self.game.board.tiles.tag_count(Tile.Painted)
+
+    def num_unpainted_tiles(self):
+      return self.game.board.tiles.tag_count(Tile.Unpainted)
+
+    def filter_tiles(self, pred=lambda t: True, mask=None):
+      """Returns the tiles that satisfy the predicate. 
+      
+      If a boolean mask over the board is provided (e.g., from tile_mask), the predicate 
+      is only evaluated on the tiles that the mask selects."""
+      tiles = self.game.board.tiles
+      if mask is None:
+        candidates = (tile for row in tiles for tile in row)
+      else:
+        candidates = (tiles[ty][tx] for ty, tx in zip(*np.nonzero(mask)))
+      return [tile for tile in candidates if pred(tile)]
+
+    def filter_tilepoints(self, pred=lambda t: True, mask=None):
+      """Returns the TilePoints of the tiles that satisfy the predicate. See filter_tiles."""
+      return [TilePoint(self, tx=tile.tx, ty=tile.ty) for tile in self.filter_tiles(pred, mask)]
 
     def tile_to_tilepoint(self, tile):
-      ty, tx = 0, 0
-      for y, row in enumerate(self.game.board.tiles):
-        for x, t in enumerate(row):
-          if t is tile: return TilePoint(self, tx=x, ty=y)
-      raise ValueError('Tile %s not found in tiles' % tile)
+      """Returns the board position of a tile. Constant time, since board tiles carry their coordinates."""
+      if isinstance(tile, TilePoint): return tile
+      if tile.grid is None:
+        raise ValueError('Tile %s not found in tiles' % tile)
+      return TilePoint(self, tx=tile.tx, ty=tile.ty)
+
+    def tile_transform(self):
+      """Returns the TileTransform for the current board layout, or None if it could not be derived."""
+      board = self.game.board
+      return TileTransform.lookup(self.toybox, tuple(self.config['board']), board.width, board.height)
 
     def tilepoint_to_worldpoint(self, tp):
-      return WorldPoint(self, 
-        *self.toybox.query_state_json('tile_to_world', tp.encode()))
+      transform = self.tile_transform()
+      if transform is None:
+        return WorldPoint(self, 
+          *self.toybox.query_state_json('tile_to_world', tp.encode()))
+      return WorldPoint(self, *transform.tile_to_world(tp.tx, tp.ty))
 
     def tile_to_worldpoint(self, tile):
       tp = self.tile_to_tilepoint(tile)
       return self.tilepoint_to_worldpoint(tp)   
 
     def worldpoint_to_tilepoint(self, wp):
-     return TilePoint(self, 
-       *self.toybox.query_state_json('world_to_tile', wp.encode()))   
-
-    def set_player_random_start(self, min_enemy_distance=5):
-      def within_min_manhattan(t):
-        tp = self.tile_to_tilepoint(t)
-        for e in enemies:
-          etp = self.worldpoint_to_tilepoint(e.position)
-          delta_x = abs(etp.tx - tp.tx)
-          delta_y = abs(etp.ty - tp.ty)
-          if delta_x + delta_y < min_enemy_distance:
-            return False
-        return True
-          
-      pos = self.get_random_tile(pred=within_min_manhattan)
-      self.game.player.position = self.tile_to_worldpoint(pos)
-
-    def get_random_dir_for_tile(self, tiles):
-        assert tile.tag != "Empty"
-        selected = False
-        dirs = ["Up", "Down", "Left", "Right"]
-
-        d = None
-        while not selected: 
-            next_tid = {}
-            next_tid['tx'] = tile.tx
-            next_tid['ty'] = tile.ty
-
-            if d is not None: 
-                dirs.remove(d)
-                if not dirs: 
-                    d = None
+      transform = self.tile_transform()
+      if transform is None:
+        return TilePoint(self, 
+          *self.toybox.query_state_json('world_to_tile', wp.encode()))   
+      return TilePoint(self, *transform.world_to_tile(wp.x, wp.y))
+
+    def tiles_to_world(self, txs, tys):
+      """Converts arrays of tile coordinates to arrays of world coordinates."""
+      transform = self.tile_transform()
+      if transform is None:
+        points = [self.toybox.query_state_json('tile_to_world', {'tx' : int(tx), 'ty' : int(ty)}) for tx, ty in zip(txs, tys)]
+        return tuple(np.array(points, dtype=int).reshape(-1, 2).T)
+      return transform.tile_to_world(np.asarray(txs), np.asarray(tys))
+
+    def world_to_tiles(self, xs, ys):
+      """Converts arrays of world coordinates to arrays of tile coordinates."""
+      transform = self.tile_transform()
+      if transform is None:
+        points = [self.toybox.query_state_json('world_to_tile', {'x' : int(x), 'y' : int(y)}) for x, y in zip(xs, ys)]
+        return tuple(np.array(points, dtype=int).reshape(-1, 2).T)
+      return transform.world_to_tile(np.asarray(xs), np.asarray(ys))
+
+    def placement_rng(self):
+      """Returns the NumPy generator that random placements on this Toybox draw from.
+
+      There is one per Toybox, and it advances across interventions, so successive scenarios 
+      differ; it is seeded from the game's random state on first use, or by seed_placements."""
+      rng = AmidarIntervention.placement_rngs.get(self.toybox)
+      if rng is None:
+        rng = self.seed_placements()
+      return rng
+
+    def seed_placements(self, seed=None):
+      """Restarts this Toybox's placement generator from seed (anything np.random.default_rng takes), 
+      or from the game's random state; returns the generator."""
+      if seed is None:
+        seed = list(self.game.rand['state'])
+      rng = AmidarIntervention.placement_rngs[self.toybox] = np.random.default_rng(seed)
+      return rng
+
+    def board_graph(self):
+      """Returns the BoardGraph of the current board's walkable tiles."""
+      return BoardGraph.lookup(~self.tile_mask(Tile.Empty))
+
+    def valid_directions(self, tile):
+      """The directions in which the track continues from a Tile or TilePoint."""
+      tp = self.tile_to_tilepoint(tile)
+      return self.board_graph().directions(tp.tx, tp.ty)
 
-            d = random.choice(dirs)
-            if d == "Up":
-                next_tid['ty'] = next_tid['ty'] - 1
-            elif d == "Down": 
-                next_tid['ty'] = next_tid['ty'] + 1
-            elif d == "Left": 
-                next_tid['tx'] = next_tid['tx'] - 1
-            elif d == "Right":
-                next_tid['tx'] = next_tid['tx'] + 1
+    def distance_grid(self, points, metric='manhattan'):
+      """Returns the distance, in tiles, from each tile of the board to the nearest of the input TilePoints.
+      
+      metric is 'manhattan', 'chebyshev', or 'graph' (steps along the track, from the board graph; 
+      infinite for tiles the track does not reach). With no points, every distance is infinite."""
+      assert metric in ['manhattan', 'chebyshev', 'graph'], 'Unknown metric: %s' % metric
+      if metric == 'graph':
+        return self.board_graph().distance_grid([(tp.tx, tp.ty) for tp in points])
+      board = self.game.board
+      tys, txs = np.indices((board.height, board.width))
+      dist = np.full((board.height, board.width), np.inf)
+      for tp in points:
+        dx, dy = np.abs(txs - tp.tx), np.abs(tys - tp.ty)
+        dist = np.minimum(dist, dx + dy if metric == 'manhattan' else np.maximum(dx, dy))
+      return dist
+
+    def placement_mask(self, min_enemy_distance=0, min_player_distance=0, max_player_distance=None, metric='manhattan'):
+      """Boolean grid, indexed [ty, tx], of the walkable tiles that satisfy the distance constraints.
+
+      Distances are in tiles, under the given metric (see distance_grid)."""
+      mask = ~self.tile_mask(Tile.Empty)
+      if min_enemy_distance > 0:
+        enemies = [self.worldpoint_to_tilepoint(e.position) for e in self.game.enemies]
+        mask &= self.distance_grid(enemies, metric) >= min_enemy_distance
+      if min_player_distance > 0 or max_player_distance is not None:
+        player = self.distance_grid([self.worldpoint_to_tilepoint(self.game.player.position)], metric)
+        mask &= player >= min_player_distance
+        if max_player_distance is not None:
+          mask &= player <= max_player_distance
+      return mask
+
+    def random_placement(self, mask=None, **constraints):
+      """Returns the TilePoint of a tile drawn uniformly from the mask, or from placement_mask(**constraints).
+      
+      Draws come from placement_rng, so the same seed yields the same sequence of placements."""
+      if mask is None:
+        mask = self.placement_mask(**constraints)
+      tys, txs = np.nonzero(mask)
+      if len(tys) == 0:
+        raise ValueError('No tiles satisfy the placement constraints.')
+      i = self.placement_rng().integers(len(tys))
+      return TilePoint(self, tx=int(txs[i]), ty=int(tys[i]))
 
-            if d is not None: 
-                selected = not selected and self.is_tile_walkable(Tile.decode(self, next_tid, Tile))
+    def set_player_random_start(self, min_enemy_distance=5):
+      tp = self.random_placement(min_enemy_distance=min_enemy_distance)
+      self.game.player.position = self.tilepoint_to_worldpoint(tp)
 
-        if d is None:
-            raise Exception("No valid direction from this tile:\t\tTile tx:"+str(tid['tx'])+", ty"+str(tid['ty']))
-        return d
+    def get_random_dir_for_tile(self, tile):
+      """Returns a random direction in which the track continues from a Tile or TilePoint."""
+      dirs = self.valid_directions(tile)
+      if not dirs:
+        raise ValueError('No valid direction from tile %s' % self.tile_to_tilepoint(tile))
+      return dirs[self.placement_rng().integers(len(dirs))]
 
 
 
@@ -492,6 +804,8 @@ if __name__ == "__main__":
       tile = intervention.get_tile_by_pos(tx=0, ty=0)
       intervention.set_tile_tag(tile, Tile.Painted)
       assert intervention.dirty_state
+    # only the tile and the objects containing it were re-encoded
+    assert intervention.commit_stats['encoded'] < 5
 
     with AmidarIntervention(tb) as intervention:
       assert intervention.get_tile_by_pos(0, 0).tag == Tile.Painted
@@ -621,4 +935,161 @@ if __name__ == "__main__":
       intervention.set_player_random_start()
       assert intervention.dirty_state
       wp = intervention.game.player.position
-      assert wp.x != initial_start.x or wp.y != initial_start.y
\ No newline at end of file
+      assert wp.x != initial_start.x or wp.y != initial_start.y
+    # lazy interventions only decode the parts of the board that are used
+    with AmidarIntervention(tb, lazy=True) as intervention:
+      intervention.game.lives = 2
+      assert intervention.game.board.tiles.value is None
+      assert intervention.dirty_state
+    with AmidarIntervention(tb, lazy=True) as intervention:
+      assert intervention.game.lives == 2
+      assert intervention.get_tile_by_pos(0, 0).tag == Tile.ChaseMarker
+      assert len(intervention.game.enemies) == 5
+      assert not intervention.dirty_state
+
+    # paint the unpainted tiles in the top rows of the board in one go
+    with AmidarIntervention(tb) as intervention:
+      painted = intervention.num_painted_tiles()
+      mask = intervention.tile_mask(Tile.Unpainted)
+      mask[5:, :] = False
+      intervention.set_tile_tag(mask, Tile.Painted)
+      assert intervention.num_painted_tiles() == painted + mask.sum()
+    with AmidarIntervention(tb) as intervention:
+      assert intervention.num_painted_tiles() == painted + mask.sum()
+      assert all([t.tag == Tile.Painted for t in intervention.filter_tiles(mask=mask)])
+      intervention.set_tile_tag((slice(0, 5), slice(None)), Tile.Unpainted)
+      assert intervention.tile_mask(Tile.Painted)[:5].sum() == 0
+
+    # board tiles know their own position, and random tiles can be drawn as positions
+    with AmidarIntervention(tb) as intervention:
+      tile = intervention.get_tile_by_pos(tx=3, ty=7)
+      tp = intervention.tile_to_tilepoint(tile)
+      assert (tp.tx, tp.ty) == (3, 7)
+      try:
+        intervention.tile_to_tilepoint(Tile(intervention, Tile.Painted))
+        assert False, 'a free-standing tile has no board position'
+      except ValueError: pass
+      walkable = ~intervention.tile_mask(Tile.Empty)
+      tp = intervention.get_random_tilepoint(lambda t: t.tx < 10, mask=walkable)
+      assert tp.tx < 10 and walkable[tp.ty, tp.tx]
+      tile = intervention.get_random_tile(lambda t: t.tag == Tile.Empty)
+      assert tile.tag == Tile.Empty
+      tps = intervention.filter_tilepoints(lambda t: t.ty == 0, mask=walkable)
+      assert len(tps) == walkable[0].sum() and all([tp.ty == 0 for tp in tps])
+      try:
+        intervention.get_random_tilepoint(lambda t: False)
+        assert False, 'no tile satisfies the predicate'
+      except ValueError: pass
+      wp = intervention.get_random_track_position()
+      assert intervention.is_tile_walkable(intervention.get_tile_by_pos(**intervention.worldpoint_to_tilepoint(wp).encode()))
+      assert not intervention.dirty_state
+
+    # random tiles are reproducible from a seed, and successive interventions draw different ones
+    draws = []
+    for _ in range(3):
+      with AmidarIntervention(tb) as intervention:
+        if not draws: intervention.seed_placements(7)
+        draws.append([intervention.get_random_tilepoint(lambda t: t.tag != Tile.Empty).encode() for _ in range(5)])
+    with AmidarIntervention(tb) as intervention:
+      intervention.seed_placements(7)
+      assert draws[0] == [intervention.get_random_tilepoint(lambda t: t.tag != Tile.Empty).encode() for _ in range(5)]
+    assert draws[0] != draws[1] != draws[2] and len(set([(tp['tx'], tp['ty']) for tp in draws[0]])) > 1
+
+    # the local coordinate transform agrees with the simulator on every tile
+    with AmidarIntervention(tb) as intervention:
+      transform = intervention.tile_transform()
+      assert transform is not None
+      board = intervention.game.board
+      tys, txs = np.mgrid[0:board.height, 0:board.width]
+      xs, ys = intervention.tiles_to_world(txs.ravel(), tys.ravel())
+      for tx, ty, x, y in zip(txs.ravel(), tys.ravel(), xs, ys):
+        tp = TilePoint(intervention, int(tx), int(ty))
+        assert [x, y] == tb.query_state_json('tile_to_world', tp.encode())
+        wp = intervention.tilepoint_to_worldpoint(tp)
+        assert (wp.x, wp.y) == (x, y)
+        for dx, dy in [(0, 0), (transform.width - 1, transform.height - 1), (-1, -1)]:
+          wp = WorldPoint(intervention, int(x + dx), int(y + dy))
+          tp = intervention.worldpoint_to_tilepoint(wp)
+          assert [tp.tx, tp.ty] == tb.query_state_json('world_to_tile', wp.encode())
+      txs_post, tys_post = intervention.world_to_tiles(xs, ys)
+      assert (txs_post == txs.ravel()).all() and (tys_post == tys.ravel()).all()
+      # NumPy integers convert like Python ints, to Python ints
+      tile = transform.world_to_tile(xs[5], np.int32(-1))
+      assert tile == transform.world_to_tile(int(xs[5]), -1) and all([type(v) is int for v in tile])
+      # unknown layouts fall back to the simulator
+      layout = tuple(intervention.config['board'])
+      TileTransform.cache[layout] = None
+      wp = intervention.tilepoint_to_worldpoint(TilePoint(intervention, 3, 7))
+      assert (wp.x, wp.y) == tuple(transform.tile_to_world(3, 7))
+      assert [list(a) for a in intervention.world_to_tiles([wp.x], [wp.y])] == [[3], [7]]
+      del TileTransform.cache[layout]
+      assert intervention.tile_transform() is not None
+      assert not intervention.dirty_state
+
+    # placements are drawn from the tiles that satisfy the constraints, reproducibly
+    with AmidarIntervention(tb) as intervention:
+      mask = intervention.placement_mask(min_enemy_distance=5, max_player_distance=10)
+      player = intervention.worldpoint_to_tilepoint(intervention.game.player.position)
+      enemies = [intervention.worldpoint_to_tilepoint(e.position) for e in intervention.game.enemies]
+      for ty, tx in zip(*np.nonzero(mask)):
+        assert intervention.is_tile_walkable(intervention.get_tile_by_pos(tx, ty))
+        assert abs(tx - player.tx) + abs(ty - player.ty) <= 10
+        assert all([abs(tx - e.tx) + abs(ty - e.ty) >= 5 for e in enemies])
+      intervention.seed_placements(3)
+      draws = [intervention.random_placement(mask) for _ in range(5)]
+      assert all([mask[tp.ty, tp.tx] for tp in draws])
+      tp = intervention.random_placement(min_player_distance=3, max_player_distance=3, metric='chebyshev')
+      assert max(abs(tp.tx - player.tx), abs(tp.ty - player.ty)) == 3
+      try:
+        intervention.random_placement(min_player_distance=1000)
+        assert False, 'no tile is that far from the player'
+      except ValueError: pass
+      assert not intervention.dirty_state
+    with AmidarIntervention(tb) as intervention:
+      intervention.seed_placements(3)
+      assert [tp.encode() for tp in draws] == [intervention.random_placement(mask).encode() for _ in range(5)]
+    # the generator outlives interventions: play and new games do not restart it
+    with AmidarIntervention(tb) as intervention:
+      later = [intervention.random_placement(mask).encode() for _ in range(5)]
+    tb.apply_ale_action(tb.get_legal_action_set()[0])
+    tb.new_game()
+    with AmidarIntervention(tb) as intervention:
+      assert later != [intervention.random_placement(mask).encode() for _ in range(5)] != [tp.encode() for tp in draws]
+
+    # graph distances follow the track, agree with a plain BFS, and are never shorter than Manhattan distances
+    with AmidarIntervention(tb) as intervention:
+      graph = intervention.board_graph()
+      assert graph is intervention.board_graph()
+      walkable = ~intervention.tile_mask(Tile.Empty)
+      player = intervention.worldpoint_to_tilepoint(intervention.game.player.position)
+      dist = intervention.distance_grid([player], metric='graph')
+      expected = {(player.tx, player.ty) : 0}
+      queue = [(player.tx, player.ty)]
+      for tx, ty in queue:
+        for d in intervention.valid_directions(TilePoint(intervention, tx, ty)):
+          dtx, dty = dict(BoardGraph.steps)[d]
+          if (tx + dtx, ty + dty) not in expected:
+            assert walkable[ty + dty, tx + dtx]
+            expected[(tx + dtx, ty + dty)] = expected[(tx, ty)] + 1
+            queue.append((tx + dtx, ty + dty))
+      assert len(expected) == np.isfinite(dist).sum()
+      assert all([dist[ty, tx] == d for (tx, ty), d in expected.items()])
+      assert (dist >= intervention.distance_grid([player])).all()
+      assert graph.distance((player.tx, player.ty), (player.tx, player.ty)) == 0
+
+      # every track tile between junctions is on exactly one segment
+      junctions = graph.junctions()
+      segments = graph.segments()
+      assert junctions.any() and segments
+      inner = [tuple(p) for segment in segments for p in segment[1:-1]]
+      assert len(inner) == len(set(inner))
+      assert not any([junctions[ty, tx] for tx, ty in inner])
+      for segment in segments:
+        steps = np.abs(np.diff(segment, axis=0)).sum(axis=1)
+        assert (steps == 1).all()
+
+      tp = intervention.random_placement(min_player_distance=20, metric='graph')
+      assert dist[tp.ty, tp.tx] >= 20
+      assert intervention.get_random_dir_for_tile(tp) in intervention.valid_directions(tp)
+      assert intervention.valid_directions(intervention.get_tile_by_pos(**player.encode()))
+      assert not intervention.dirty_state
@@ -1,11 +1,98 @@
 from abc import ABC, abstractmethod
-import inspect
 from ctoybox import Toybox
+from toybox import codec
+import functools
 import json
+import os
+import time
+import types
 """ Contains the base class for interventions. 
 
 To make interventions for a new game, subclass Intervention."""
 
+# Class attributes that hold per-instance fields, rather than constants.
+_field_descriptors = (property, types.MemberDescriptorType)
+
+# ids of the BaseMixin objects whose __init__ is currently running. 
+# Assignments to these objects are initialization, not mutation.
+_constructing = set()
+
+# Class -> frozenset of its expected keys, built on first decode.
+_key_sets = {}
+
+# When strict, every decode validates its keys, even of JSON that came straight from the 
+# simulator. Set TOYBOX_STRICT_DECODE=1 (or call set_strict) to catch schema drift in tests.
+_strict = os.environ.get('TOYBOX_STRICT_DECODE', '0') not in ('', '0')
+
+# True while decoding JSON that came straight from the simulator, in a game whose classes 
+# have already been validated against it; see Intervention.__enter__.
+_trusted = False
+
+# True while Intervention.__exit__ encodes the state it is about to write; only then do clean 
+# objects hand out the JSON they were decoded from, rather than a copy of it.
+_committing = False
+
+def set_strict(strict=True):
+  """Toggles strict decoding; returns the previous setting."""
+  global _strict
+  previous = _strict
+  _strict = strict
+  return previous
+
+# How many objects were rebuilt vs. re-emitted from their source JSON since the last commit.
+_encode_counts = {'encoded' : 0, 'reused' : 0}
+
+def _constructor(init):
+  """Wraps __init__ so that the object is flagged as under construction while it runs."""
+  @functools.wraps(init)
+  def __init__(self, *args, **kwargs):
+    key = id(self)
+    # super().__init__ calls re-enter here; only the outermost call clears the flag
+    if key in _constructing:
+      return init(self, *args, **kwargs)
+    object.__setattr__(self, '_source', None)
+    object.__setattr__(self, '_parent', None)
+    object.__setattr__(self, '_dirty', False)
+    _constructing.add(key)
+    try:
+      init(self, *args, **kwargs)
+    finally:
+      _constructing.discard(key)
+  return __init__
+
+def _decoder(decode):
+  """Wraps decode so that the object remembers the JSON it was built from."""
+  @functools.wraps(decode)
+  def decode_(intervention, obj, clz):
+    inst = decode(intervention, obj, clz)
+    if isinstance(inst, BaseMixin) and inst._source is None:
+      object.__setattr__(inst, '_source', obj)
+    return inst
+  return decode_
+
+def _copy_json(obj):
+  """Copies JSON data made of dicts, lists and scalars."""
+  if isinstance(obj, dict):
+    return {k : _copy_json(v) for k, v in obj.items()}
+  if isinstance(obj, list):
+    return [_copy_json(v) for v in obj]
+  return obj
+
+def _encoder(encode):
+  """Wraps encode so that objects that have not changed since decoding re-emit their source JSON.
+
+  The source is only handed out as is while committing; other callers get a copy, since the 
+  source is also what the next commit writes."""
+  @functools.wraps(encode)
+  def encode_(self):
+    if not self._dirty and self._source is not None:
+      _encode_counts['reused'] += 1
+      return self._source if _committing else _copy_json(self._source)
+    _encode_counts['encoded'] += 1
+    return encode(self)
+  return encode_
+
+
 class BaseMixin(ABC):
   """Base class for game objects. Registers mutation so JSON can be pushed via context manager."""
 
@@ -19,23 +106,48 @@ class BaseMixin(ABC):
   @abstractmethod
   def immutable_fields(clz): pass
 
+  # Bookkeeping for delta commits: the JSON this object was decoded from, the object 
+  # that holds it, and whether it has been mutated since decoding. Subclasses that 
+  # declare their own __slots__ carry no per-instance __dict__.
+  __slots__ = ('_source', '_parent', '_dirty')
+
+  def __init_subclass__(clz, **kwargs):
+    super().__init_subclass__(**kwargs)
+    if '__init__' in clz.__dict__:
+      clz.__init__ = _constructor(clz.__dict__['__init__'])
+    if 'decode' in clz.__dict__:
+      clz.decode = _decoder(clz.__dict__['decode'])
+    if 'encode' in clz.__dict__:
+      clz.encode = _encoder(clz.__dict__['encode'])
+
   def __init__(self, *args, **kwargs):
     self.intervention = None
 
   def __setattr__(self, name, value):
-    stack = [frame.function for frame in inspect.stack()]
-    calling_fn = stack[1]
-    existing_attrs = self.__dict__.keys()
-    adding_new = name not in existing_attrs
-    super().__setattr__(name, value)
     # Prohibit adding fields outside object instantiation/initialization
-    if calling_fn == '__init__': return 
-    assert 'intervention' in existing_attrs
-    if name in self.immutable_fields: # and not :
+    mutating = id(self) not in _constructing
+    if mutating and name in self.immutable_fields:
       raise AttributeError('Trying mutate immutable field %s' % name)
-    if adding_new:
-      raise AttributeError("Cannot add new field %s to %s from %s" % (name, self.__class__.__name__, calling_fn))
+    if mutating and name not in getattr(self, '__dict__', ()) \
+        and not isinstance(getattr(type(self), name, None), _field_descriptors):
+      raise AttributeError("Cannot add new field %s to %s" % (name, self.__class__.__name__))
+    super().__setattr__(name, value)
+    if isinstance(value, BaseMixin):
+      self.adopt(value)
+    if mutating:
+      self.mark_dirty()
+
+  def adopt(self, child):
+    """Records that child is stored inside this object, so that its mutations dirty this object."""
+    object.__setattr__(child, '_parent', self)
+
+  def mark_dirty(self):
+    """Flags this object, and every object containing it, to be re-encoded on commit."""
     self.intervention.dirty_state = True
+    obj = self
+    while obj is not None and not obj._dirty:
+      object.__setattr__(obj, '_dirty', True)
+      obj = obj._parent
     
   
   def decode(intervention, obj, clz):
@@ -56,68 +168,249 @@ class BaseMixin(ABC):
     ---
     BaseMixin
       A subclass of BaseMixin corresponding to a game or game element. 
-    
-    """
-    actual_keys = set(obj.keys()) 
-    expected_keys = set(clz.expected_keys)
-    target_name = clz.__name__
-
-    intersection = actual_keys.intersection(expected_keys)
-    not_enough = len(expected_keys) > len(intersection)
-    too_many = len(actual_keys) > len(intersection)
-
-    if not_enough:
-      raise ValueError("Missing keys (%s); maybe input is not a %s object?" % (
-        str(expected_keys.difference(actual_keys)), target_name))
 
-    elif too_many:
-      raise ValueError("Input object contains too many keys (%s); has the specification for %s changed?" % (
-        str(actual_keys), target_name))
-
-    else: return clz(intervention, **obj)        
+    Keys are checked against the class's expected_keys, except when decoding trusted 
+    simulator JSON outside strict mode (see set_strict).
+    """
+    if not _trusted or _strict:
+      key_set = _key_sets.get(clz)
+      if key_set is None:
+        key_set = _key_sets[clz] = frozenset(clz.expected_keys)
+      if obj.keys() != key_set:
+        actual_keys = set(obj.keys())
+        if not key_set <= actual_keys:
+          raise ValueError("Missing keys (%s); maybe input is not a %s object?" % (
+            str(set(key_set.difference(actual_keys))), clz.__name__))
+        raise ValueError("Input object contains too many keys (%s); has the specification for %s changed?" % (
+          str(actual_keys), clz.__name__))
+    return clz(intervention, **obj)
 
 
   def encode(self):
     dat = {}
     for name, val in self.__dict__.items():
       if name not in self.expected_keys:
-        if name != 'intervention' and __debug__:
+        if name != 'intervention' and not name.startswith('_') and __debug__:
           print('skipping %s in %s; not in expected keys' % (name, type(self).__name__))
         continue
       dat[name] = val.encode() if isinstance(val, BaseMixin) else val
     return dat
-        
+
+BaseMixin.__init__ = _constructor(BaseMixin.__init__)
+BaseMixin.decode = _decoder(BaseMixin.decode)
+BaseMixin.encode = _encoder(BaseMixin.encode)
+
+
+class Lazy(BaseMixin):
+  """Stand-in for a large subtree of the game (e.g., the board tiles) that is only decoded on first use.
+  
+  Attribute access, indexing and iteration are forwarded to the decoded object. Like any other 
+  unmodified object, a subtree that was never touched encodes to the JSON it was read from."""
+
+  expected_keys = []
+  immutable_fields = ['intervention', 'obj', 'clz', 'value', 'trusted']
+
+  def __init__(self, intervention, obj, clz):
+    self.intervention = intervention
+    self.obj = obj
+    self.clz = clz
+    self.value = None
+    # The subtree is as trusted as the JSON it was cut from
+    self.trusted = _trusted
+
+  def force(self):
+    """Decodes the subtree, if that has not happened yet, and returns it."""
+    if self.value is None:
+      global _trusted
+      trusted = _trusted
+      _trusted = self.trusted
+      try:
+        value = self.clz.decode(self.intervention, self.obj, self.clz)
+      finally:
+        _trusted = trusted
+      # Decoding is not a mutation, so bypass dirty tracking.
+      self.adopt(value)
+      self.__dict__['value'] = value
+    return self.value
+
+  def __getattr__(self, name):
+    # Only called when regular lookup fails, i.e., for attributes of the subtree.
+    if name.startswith('__'): raise AttributeError(name)
+    return getattr(self.force(), name)
+
+  def __setattr__(self, name, value):
+    if name in self.__dict__ or id(self) in _constructing:
+      super().__setattr__(name, value)
+    else:
+      setattr(self.force(), name, value)
+
+  def __iter__(self): return self.force().__iter__()
+
+  def __getitem__(self, key): return self.force().__getitem__(key)
+
+  def __len__(self): return self.force().__len__()
+
+  def decode(intervention, obj, clz):
+    """Decodes obj as an instance of clz, deferring the work if the intervention is lazy."""
+    if getattr(intervention, 'lazy', False):
+      return Lazy(intervention, obj, clz)
+    return clz.decode(intervention, obj, clz)
+
+  def encode(self):
+    return self.value.encode()
+
+
+class InterventionProfiler(object):
+  """Wall time, bytes and object counts of interventions, summed per intervention class.
+
+  Phases are enter (fetch and decode the state), body (the with block) and exit (encode and 
+  write the state or config, including new_game). Off unless installed, with 
+  Intervention.profiler = InterventionProfiler(); uninstalled, it costs one attribute check."""
+
+  fields = ['count', 'enter_time', 'body_time', 'exit_time', 'bytes_read', 'bytes_written', 
+            'encoded', 'reused', 'state_commits', 'config_commits']
+
+  def __init__(self):
+    # intervention class name -> field -> total
+    self.totals = {}
+
+  def record(self, name, **values):
+    totals = self.totals.get(name)
+    if totals is None:
+      totals = self.totals[name] = dict.fromkeys(self.fields, 0)
+    for field, value in values.items():
+      totals[field] += value
+
+  def reset(self):
+    self.totals = {}
+
+  def logkvs(self, logger=None, prefix='interventions'):
+    """Reports the totals as key-values, e.g., interventions/BreakoutIntervention/exit_time.
+
+    logger defaults to baselines.logger; the values are written on its next dumpkvs()."""
+    if logger is None:
+      from baselines import logger
+    for name, totals in sorted(self.totals.items()):
+      for field in self.fields:
+        logger.logkv('%s/%s/%s' % (prefix, name, field), totals[field])
+
+
 class Intervention(ABC):
 
-  def __init__(self, tb, game_name, clz):
+  # How many times an intervention has fetched the config from the simulator
+  config_fetches = 0
+
+  # Game classes that have decoded simulator JSON with full validation. Later states 
+  # from the same simulator have the same schema, so their keys are not re-checked.
+  validated = set()
+
+  # An InterventionProfiler, when profiling
+  profiler = None
+
+  def __init__(self, tb, game_name, clz, lazy=False):
     self.toybox = tb
-    self.config = None
+    # When lazy, large subtrees of the game are decoded on first access.
+    self.lazy = lazy
+    # The config is only fetched if it is used; see the config property.
+    self.active = False
+    self._config = None
     self.dirty_config = False
     self.dirty_state = False
+    # Size and cost of the most recent state commit
+    self.commit_stats = None
+    # Timings of the current with block, when profiling
+    self.profile = None
     self.game_name = game_name
     assert tb.game_name == game_name
     self.clz = clz
     self.game = None
 
+  @property
+  def config(self):
+    """The game config, fetched from the simulator on first use inside the with block.
+
+    Configs change outside interventions (set_seed, write_config_json, and in some games every 
+    new_game), so each intervention fetches its own. Changes to it are only written back if 
+    they set dirty_config."""
+    if self._config is None and self.active:
+      self._config = codec.config_json(self.toybox)
+      Intervention.config_fetches += 1
+    return self._config
+
+  @config.setter
+  def config(self, config):
+    self._config = config
+
   def __enter__(self):
     # grab the JSON to be manipulated
     #self.state = self.toybox.to_state_json()
-    self.config = self.toybox.config_to_json()
-    self.game = self.clz.decode(self, self.toybox.to_state_json(), self.clz)
+    profiling = Intervention.profiler is not None
+    if profiling:
+      start = time.perf_counter()
+    self.active = True
+    global _trusted
+    data = codec.state_bytes(self.toybox)
+    state = codec.loads(data)
+    _trusted = self.clz in Intervention.validated
+    try:
+      self.game = self.clz.decode(self, state, self.clz)
+    finally:
+      _trusted = False
+    # Lazy subtrees may not have been checked yet
+    if not self.lazy:
+      Intervention.validated.add(self.clz)
 
+    if profiling:
+      now = time.perf_counter()
+      self.profile = {'enter_time' : now - start, 'bytes_read' : len(data), 'body_start' : now}
     return self
 
   def __exit__(self, exec_type, exc_value, traceback):
     # commit the JSON
+    profile = self.profile
+    if profile is not None:
+      start = time.perf_counter()
+      profile['body_time'] = start - profile.pop('body_start')
     
     if self.dirty_config:
-      self.toybox.write_config_json(self.config)
+      config = codec.dumps(self.config)
+      codec.write_config(self.toybox, config)
       self.toybox.new_game()
+      if profile is not None:
+        profile.update(config_commits=1, bytes_written=len(config))
 
     elif self.dirty_state:
-      self.toybox.write_state_json(self.game.encode())
+      # Only the mutated objects and their ancestors are rebuilt; everything else 
+      # is re-emitted from the JSON we read in __enter__.
+      _encode_counts['encoded'] = _encode_counts['reused'] = 0
+      encode_start = time.perf_counter()
+      global _committing
+      _committing = True
+      try:
+        state = self.game.encode()
+      finally:
+        _committing = False
+      encode_time = time.perf_counter() - encode_start
+      state = codec.dumps_bytes(state)
+      self.commit_stats = {
+        'encoded'     : _encode_counts['encoded'],
+        'reused'      : _encode_counts['reused'],
+        'encode_time' : encode_time,
+        'bytes'       : len(state)
+      }
+      codec.write_state(self.toybox, state)
+      if profile is not None:
+        profile.update(state_commits=1, bytes_written=len(state), 
+                       encoded=self.commit_stats['encoded'], reused=self.commit_stats['reused'])
 
+    self.active = False
     self.config = None
+    if profile is not None:
+      profile['exit_time'] = time.perf_counter() - start
+      # The profiler may have been removed inside the with block
+      if Intervention.profiler is not None:
+        Intervention.profiler.record(type(self).__name__, count=1, **profile)
+      self.profile = None
 
 
   def set_partial_config(self, fname): 
@@ -133,18 +426,88 @@ class Intervention(ABC):
 
 
 if __name__ == "__main__":
-  with Toybox('amidar') as tb:
-    state = tb.to_state_json()
-    config = tb.config_to_json()
-    
-    with Intervention(tb, 'amidar') as intervention:
-      intervention.config['enemies'] = []
+  # This file runs as __main__, so use the classes that the game modules share
+  from toybox.interventions.base import Intervention, InterventionProfiler
+  from toybox.interventions.space_invaders import SpaceInvadersIntervention
+
+  with Toybox('space_invaders') as tb:
+    # the config is only fetched when used; each intervention gets its own copy
+    with SpaceInvadersIntervention(tb) as intervention:
+      jitter = intervention.get_jitter()
+      intervention.config['jitter'] = 0.0
+    with SpaceInvadersIntervention(tb) as intervention:
+      assert intervention.get_jitter() == jitter, 'uncommitted edits are dropped'
+    fetches = Intervention.config_fetches
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.game.lives = 2
+    assert Intervention.config_fetches == fetches
+    with SpaceInvadersIntervention(tb) as intervention:
+      assert intervention.get_jitter() == jitter
+      assert intervention.get_jitter() == jitter
+    assert Intervention.config_fetches == fetches + 1
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.set_jitter(jitter / 2)
+    with SpaceInvadersIntervention(tb) as intervention:
+      assert intervention.get_jitter() == jitter / 2
+    assert intervention.config is None
 
-      new_state = intervention.state
-      new_config = intervention.config
+    # changes made outside interventions are seen: set_seed, and new_game advancing the config's random state
+    for change in [lambda: tb.set_seed(1234), tb.new_game]:
+      change()
+      with SpaceInvadersIntervention(tb) as intervention:
+        assert intervention.config == tb.config_to_json()
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.set_jitter(jitter)
 
-    assert len(config['enemies']) == 5
-    assert len(new_config['enemies']) == 0
-    assert len(tb.config_to_json()['enemies']) == 0
+    # encode hands out copies: editing the JSON of an unmodified object changes neither 
+    # the object nor the state committed for it, and clones are independent of their original
+    ship = tb.to_state_json()['ship']
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.game.ship.encode()['x'] = 12345
+      assert intervention.game.ship.x == ship['x']
+      clone = type(intervention.game.ship).decode(intervention, intervention.game.ship.encode(), type(intervention.game.ship))
+      clone.x = 0
+      intervention.game.lives = 2
+    assert tb.to_state_json()['ship'] == ship
 
+    # profiling sums each phase per intervention class, and can be reported through baselines.logger
+    Intervention.profiler = InterventionProfiler()
+    with SpaceInvadersIntervention(tb) as intervention:
+      pass
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.game.lives = 3
+    # the phases cover the with block without gaps: on a clock that ticks once per reading, 
+    # they sum to the number of ticks between the first reading and the last
+    import toybox.interventions.base as base
+    class Clock(object):
+      ticks = 0
+      def perf_counter(self):
+        self.ticks += 1
+        return self.ticks
+    clock, real_time, profiler = Clock(), base.time, Intervention.profiler
+    base.time, Intervention.profiler = clock, InterventionProfiler()
+    try:
+      with SpaceInvadersIntervention(tb) as intervention:
+        intervention.game.lives = 3
+      phases = Intervention.profiler.totals['SpaceInvadersIntervention']
+    finally:
+      base.time, Intervention.profiler = real_time, profiler
+    assert phases['enter_time'] + phases['body_time'] + phases['exit_time'] == clock.ticks - 1
+    with SpaceInvadersIntervention(tb) as intervention:
+      intervention.set_jitter(jitter)
+    totals = Intervention.profiler.totals['SpaceInvadersIntervention']
+    Intervention.profiler = None
+    assert totals['count'] == 3 and totals['state_commits'] == 1 and totals['config_commits'] == 1
+    assert totals['bytes_read'] > 0 and totals['bytes_written'] > 0
+    assert totals['reused'] > 0 and min(totals['enter_time'], totals['body_time'], totals['exit_time']) > 0
+    with SpaceInvadersIntervention(tb) as intervention:
+      assert intervention.profile is None
 
+    class KVs(object):
+      kvs = {}
+      def logkv(self, key, value): self.kvs[key] = value
+    logger = KVs()
+    profiler = InterventionProfiler()
+    profiler.totals['SpaceInvadersIntervention'] = totals
+    profiler.logkvs(logger)
+    assert logger.kvs['interventions/SpaceInvadersIntervention/count'] == 3
@@ -1,6 +1,8 @@
 from toybox.interventions.base import *
+from toybox.interventions.base import _encode_counts
 from toybox.interventions.core import * 
 import json
+import numpy as np
 """An API for interventions on Breakout."""
 
 class Breakout(Game):
@@ -20,7 +22,7 @@ class Breakout(Game):
         self.paddle = Paddle.decode(intervention, paddle, Paddle)
         self.reset = reset
         self.ball_radius = ball_radius
-        self.bricks = BrickCollection.decode(intervention, bricks, BrickCollection)
+        self.bricks = Lazy.decode(intervention, bricks, BrickCollection)
         self.balls = BallCollection.decode(intervention, balls, BallCollection)
         self.paddle_speed = paddle_speed
         self.paddle_width = paddle_width
@@ -38,31 +40,210 @@ class Paddle(BaseMixin):
 
 
 class BrickCollection(Collection):
+    # The per-brick fields that queries and edits range over (alive, row, col, points, depth) 
+    # are stored as one array per field, so that column and row operations are vectorized. 
+    # Brick objects are views onto those arrays, built the first time they are needed.
+
+    columns = ['alive', 'row', 'col', 'points', 'depth']
+    immutable_fields = Collection.immutable_fields + columns + ['sources', 'source_columns', 'views']
 
     def __init__(self, intervention, bricks):
-        super().__init__(intervention, bricks, Brick)
+        self.intervention = intervention
+        self.elt_clz = Brick
+        self.sources = list(bricks)
+        self.views = [None] * len(bricks)
+        for name in BrickCollection.columns:
+            dtype = bool if name == 'alive' else int
+            column = np.array([brick[name] for brick in bricks], dtype=dtype)
+            # Edits go through set_field, so that they are committed
+            column.flags.writeable = False
+            self.__setattr__(name, column)
+        self.source_columns = { name : getattr(self, name).copy() for name in BrickCollection.columns }
+
+    def view(self, i):
+        """Returns the Brick object for the ith brick."""
+        if self.views[i] is None:
+            brick = Brick(self.intervention, bricks=self, index=i, **self.sources[i])
+            self.adopt(brick)
+            self.views[i] = brick
+        return self.views[i]
+
+    @property
+    def coll(self):
+        return [self.view(i) for i in range(len(self.views))]
+
+    def __getitem__(self, key): 
+        if isinstance(key, slice):
+            return [self.view(i) for i in range(len(self.views))[key]]
+        return self.view(range(len(self.views))[key])
+
+    def __len__(self): return len(self.views)
+
+    def set_field(self, name, where, value):
+        """Sets the named column (e.g., alive) for the bricks selected by where: an index, a slice, or a boolean mask."""
+        assert name in BrickCollection.columns, 'Not a brick column: %s' % name
+        column = getattr(self, name)
+        column.flags.writeable = True
+        column[where] = value
+        column.flags.writeable = False
+        self.mark_dirty()
+
+    def restructure(self, bricks):
+        """Rebuilds the columns after bricks have been added, removed or reordered."""
+        sources = []
+        columns = { name : [] for name in BrickCollection.columns }
+        source_columns = { name : [] for name in BrickCollection.columns }
+        for brick in bricks:
+            # Bricks that stay in this collection keep their source, so they can still be re-emitted
+            kept = brick.bricks is self
+            sources.append(self.sources[brick.index] if kept else None)
+            for name in BrickCollection.columns: 
+                columns[name].append(getattr(brick, name))
+                source_columns[name].append(self.source_columns[name][brick.index] if kept else columns[name][-1])
+        # Copy every brick's values out while its index still refers to the old columns
+        for brick in bricks:
+            brick.unbind()
+        # Restructuring is recorded by the mark_dirty below, so bypass dirty tracking here.
+        for name in BrickCollection.columns:
+            dtype = getattr(self, name).dtype
+            column = np.array(columns[name], dtype=dtype)
+            column.flags.writeable = False
+            self.__dict__[name] = column
+            source_columns[name] = np.array(source_columns[name], dtype=dtype)
+        self.__dict__['source_columns'] = source_columns
+        self.__dict__['sources'] = sources
+        self.__dict__['views'] = list(bricks)
+        for i, brick in enumerate(bricks):
+            brick.bind(self, i)
+            self.adopt(brick)
+        self.mark_dirty()
+
+    def append(self, obj):
+        assert isinstance(obj, Brick), '%s must be of type %s' % (obj, Brick)
+        self.restructure(self.coll + [obj])
+
+    def extend(self, obj):
+        self.restructure(self.coll + list(obj))
+
+    def insert(self, i, x):
+        bricks = self.coll
+        bricks.insert(i, x)
+        self.restructure(bricks)
+
+    def remove(self, obj):
+        bricks = self.coll
+        bricks.remove(obj)
+        obj.unbind()
+        self.restructure(bricks)
+
+    def __delitem__(self, key):
+        bricks = self.coll
+        removed = bricks[key] if isinstance(key, slice) else [bricks[key]]
+        del bricks[key]
+        for brick in removed: brick.unbind()
+        self.restructure(bricks)
+
+    def pop(self, i=-1):
+        bricks = self.coll
+        brick = bricks.pop(i)
+        brick.unbind()
+        self.restructure(bricks)
+        return brick
+
+    def clear(self):
+        for brick in self.views:
+            if brick is not None: brick.unbind()
+        self.restructure([])
+
+    def sort(self, key=None, reverse=False):
+        self.restructure(sorted(self.coll, key=key, reverse=reverse))
+
+    def reverse(self):
+        self.restructure(self.coll[::-1])
 
     def decode(intervention, bricks, clz):
         return BrickCollection(intervention, bricks)
 
+    def encode(self):
+        # Bricks that were not touched are re-emitted as they were read; bricks whose 
+        # columns changed are patched; bricks with other changes are re-encoded.
+        changed = np.zeros(len(self.views), dtype=bool)
+        for name in BrickCollection.columns:
+            changed |= getattr(self, name) != self.source_columns[name]
+        retval = []
+        for i, (brick, source) in enumerate(zip(self.views, self.sources)):
+            if source is None or (brick is not None and brick._dirty):
+                retval.append(self.view(i).encode())
+            elif changed[i]:
+                patched = dict(source)
+                for name in BrickCollection.columns:
+                    patched[name] = getattr(self, name)[i].item()
+                retval.append(patched)
+                _encode_counts['encoded'] += 1
+            else:
+                retval.append(source)
+                _encode_counts['reused'] += 1
+        return retval
+
+
+def _column(name):
+    """Property for a brick field that lives in the BrickCollection's arrays while the brick is on the board."""
+    def get(self):
+        if self.bricks is None: return self.values[name]
+        return getattr(self.bricks, name)[self.index].item()
+    def set(self, value):
+        if self.bricks is None: self.values[name] = value
+        else: self.bricks.set_field(name, self.index, value)
+    return property(get, set)
 
 
 class Brick(BaseMixin):
 
     expected_keys = ['destructible', 'depth', 'color', 'alive', 'points', 'size', 'position', 'row', 'col']
-    immutable_fields = ['intervention']
+    immutable_fields = ['intervention', 'bricks', 'index', 'values']
+    __slots__ = ('intervention', 'bricks', 'index', 'values', 'destructible', 'color', 'size', 'position')
+
+    alive  = _column('alive')
+    row    = _column('row')
+    col    = _column('col')
+    points = _column('points')
+    depth  = _column('depth')
       
-    def __init__(self, intervention, destructible, depth, color, alive, points, size, position, row, col):
+    def __init__(self, intervention, destructible, depth, color, alive, points, size, position, row, col, bricks=None, index=None):
         self.intervention = intervention
+        # Bricks on the board are views onto their BrickCollection's columns; 
+        # free-standing bricks hold their own values.
+        self.bind(bricks, index)
+        object.__setattr__(self, 'values', None if bricks is not None else 
+          { 'alive' : alive, 'row' : row, 'col' : col, 'points' : points, 'depth' : depth })
         self.destructible = destructible
-        self.depth = depth
         self.color = Color.decode(intervention, color, Color)
-        self.alive = alive
-        self.points = points
         self.size = Vec2D.decode(intervention, size, Vec2D)
         self.position = Vec2D.decode(intervention, position, Vec2D)
-        self.row = row
-        self.col = col
+
+    def bind(self, bricks, index):
+        # A back-reference: the collection contains the brick, not the other way around.
+        object.__setattr__(self, 'bricks', bricks)
+        object.__setattr__(self, 'index', index)
+
+    def unbind(self):
+        """Detaches the brick from its collection, copying its column values into the brick."""
+        if self.bricks is None: return
+        object.__setattr__(self, 'values', { name : getattr(self, name) for name in BrickCollection.columns })
+        self.bind(None, None)
+
+    def encode(self):
+        return {
+            'destructible' : self.destructible,
+            'depth'        : self.depth,
+            'color'        : self.color.encode(),
+            'alive'        : self.alive,
+            'points'       : self.points,
+            'size'         : self.size.encode(),
+            'position'     : self.position.encode(),
+            'row'          : self.row,
+            'col'          : self.col
+        }
 
 class BallCollection(Collection):
 
@@ -83,12 +264,12 @@ class Ball(BaseMixin):
 
 class BreakoutIntervention(Intervention):
 
-    def __init__(self, tb, game_name='breakout'):
+    def __init__(self, tb, game_name='breakout', lazy=False):
         # check that the simulation in tb matches the game name.
-        Intervention.__init__(self, tb, game_name, Breakout)
+        Intervention.__init__(self, tb, game_name, Breakout, lazy=lazy)
 
     def num_bricks_remaining(self):
-        return sum([int(brick.alive) for brick in self.game.bricks])
+        return int(self.game.bricks.alive.sum())
 
     def num_bricks(self):
         return len(self.game.bricks)
@@ -146,18 +327,19 @@ class BreakoutIntervention(Intervention):
 
     def get_column(self, i):
         """Returns the ith column of bricks."""
-        bricks = []
-        for brick in self.game.bricks:
-            if brick.col == i:
-                bricks.append(brick)
-        return bricks
+        bricks = self.game.bricks
+        return [bricks[j] for j in np.nonzero(bricks.col == i)[0]]
+
+    def channel_mask(self):
+        """Returns a boolean array over the columns that is True for each channel."""
+        bricks = self.game.bricks
+        ncols = self.num_columns()
+        present = np.bincount(bricks.col, minlength=ncols)[:ncols]
+        alive = np.bincount(bricks.col, weights=bricks.alive, minlength=ncols)[:ncols]
+        return (present > 0) & (alive == 0)
     
     def channel_count(self):
-        count = 0
-        for i in range(self.num_columns()):
-            channel = self.get_column(i)
-            if self.is_channel(channel): count += 1
-        return count
+        return int(self.channel_mask().sum())
 
     def get_ball_position(self):
         """Returns a list of positions, if there is more than one ball, and a single Vec2D object otherwise.:"""
@@ -188,28 +370,35 @@ class BreakoutIntervention(Intervention):
 
     def add_channel(self, i):
         """Turns the ith column into a channel"""
-        for brick in self.game.bricks:
-            if brick.col == i and brick.alive:
-                brick.alive = False
+        bricks = self.game.bricks
+        bricks.set_field('alive', bricks.col == i, False)
 
     def fill_column(self, i): 
         """Fills the ith column, so that all bricks are now alive."""
-        for brick in self.game.bricks:
-            if brick.col == i and not brick.alive:
-                brick.alive = True
+        bricks = self.game.bricks
+        bricks.set_field('alive', bricks.col == i, True)
+
+    def clear_row(self, i):
+        """Removes all bricks in the ith row."""
+        bricks = self.game.bricks
+        bricks.set_field('alive', bricks.row == i, False)
+
+    def fill_row(self, i):
+        """Fills the ith row, so that all bricks are now alive."""
+        bricks = self.game.bricks
+        bricks.set_field('alive', bricks.row == i, True)
 
     def find_channel(self):
         """Returns the first channel found."""
-        for i in range(self.num_columns()):
-            col = self.get_column(i)
-            if self.is_channel(col):
-                return i, col
-        return -1, None
+        channels = np.nonzero(self.channel_mask())[0]
+        if len(channels) == 0:
+            return -1, None
+        i = int(channels[0])
+        return i, self.get_column(i)
 
     def clear_board(self):
         """Clears the board of all bricks"""
-        for brick in self.game.bricks:
-            brick.alive = False
+        self.game.bricks.set_field('alive', slice(None), False)
 
 
 if __name__ == "__main__":
@@ -242,7 +431,19 @@ if __name__ == "__main__":
     with BreakoutIntervention(tb) as intervention:
         intervention.game.lives = 1
         assert intervention.dirty_state
-    
+
+    # fields cannot be added, nor immutable fields replaced, after decoding
+    with BreakoutIntervention(tb) as intervention:
+        try:
+            intervention.game.paddle.acceleration = 1
+            assert False, 'should not be able to add a field'
+        except AttributeError: pass
+        try:
+            intervention.game.bricks = None
+            assert False, 'should not be able to replace the bricks'
+        except AttributeError: pass
+        assert not intervention.dirty_state
+
     # remove and assert that the brick is gone
     with BreakoutIntervention(tb) as intervention:
         nbricks = intervention.num_bricks_remaining()
@@ -250,6 +451,8 @@ if __name__ == "__main__":
         nbricks_post = intervention.num_bricks_remaining()
 
         assert nbricks - 1 == nbricks_post
+    # the other bricks were re-emitted from the JSON we read
+    assert intervention.commit_stats['reused'] >= intervention.num_bricks() - 1
 
     # reset and assert that the brick is present
     with BreakoutIntervention(tb) as intervention:
@@ -329,4 +532,82 @@ if __name__ == "__main__":
 
         pos.x = pos.x + 10
         pos_post = intervention.get_paddle_position()
-        assert pos.x == pos_post.x
\ No newline at end of file
+        assert pos.x == pos_post.x
+    # a lazy intervention decodes the bricks only when they are used
+    with BreakoutIntervention(tb, lazy=True) as intervention:
+        nbricks = intervention.num_bricks_remaining()
+        intervention.game.bricks[0].alive = False
+        assert intervention.dirty_state
+    with BreakoutIntervention(tb, lazy=True) as intervention:
+        intervention.game.lives = 3
+        assert intervention.game.bricks.value is None
+    with BreakoutIntervention(tb) as intervention:
+        assert intervention.num_bricks_remaining() == nbricks - 1
+        assert intervention.game.lives == 3
+        intervention.game.bricks[0].alive = True
+
+    # row and column edits write the brick columns in bulk, and only the edited bricks are re-emitted
+    with BreakoutIntervention(tb) as intervention:
+        nbricks = intervention.num_bricks_remaining()
+        ncols = intervention.num_columns()
+        intervention.clear_row(0)
+        assert intervention.num_bricks_remaining() == nbricks - ncols
+        assert not any([brick.alive for brick in intervention.game.bricks if brick.row == 0])
+    assert intervention.commit_stats['reused'] >= intervention.num_bricks() - ncols
+    with BreakoutIntervention(tb) as intervention:
+        assert intervention.num_bricks_remaining() == nbricks - intervention.num_columns()
+        intervention.fill_row(0)
+    with BreakoutIntervention(tb) as intervention:
+        assert intervention.num_bricks_remaining() == nbricks
+        assert intervention.channel_count() == 0
+        assert intervention.find_channel() == (-1, None)
+
+    # removing a brick from the board keeps its values, and the board still commits
+    with BreakoutIntervention(tb) as intervention:
+        bricks = intervention.game.bricks
+        brick = bricks.pop()
+        assert len(bricks) == nbricks - 1
+        brick.alive = False
+        bricks.append(brick)
+        assert bricks[-1] is brick and not bricks[-1].alive
+    with BreakoutIntervention(tb) as intervention:
+        assert intervention.num_bricks_remaining() == nbricks - 1
+        intervention.game.bricks[-1].alive = True
+
+    # bricks can be removed from anywhere in the board
+    expected = tb.to_state_json()['bricks']
+    with BreakoutIntervention(tb) as intervention:
+        bricks = intervention.game.bricks
+        first = bricks.pop(0)
+        assert (first.row, first.col) == (expected[0]['row'], expected[0]['col'])
+        bricks.remove(bricks[10])
+        del bricks[20]
+        del bricks[30:32]
+        assert len(bricks) == nbricks - 5
+        bricks[0].alive = False
+    remaining = expected[1:11] + expected[12:22] + expected[23:33] + expected[35:]
+    remaining[0] = dict(remaining[0], alive=False)
+    assert tb.to_state_json()['bricks'] == remaining
+    tb.write_state_json(dict(tb.to_state_json(), bricks=expected))
+
+    # keys are validated, except in simulator JSON of a game whose classes were already checked against it
+    import toybox.interventions.base as base
+    assert Breakout in Intervention.validated
+    paddle = dict(tb.to_state_json()['paddle'], spin=0)
+    for strict in [False, True]:
+        previous = set_strict(strict)
+        base._trusted = True
+        try:
+            Paddle.decode(intervention, paddle, Paddle)
+            assert False, 'unexpected keys should not decode'
+        except ValueError: assert strict
+        except TypeError: assert not strict
+        finally:
+            base._trusted = False
+            set_strict(previous)
+    try:
+        Paddle.decode(intervention, paddle, Paddle)
+        assert False, 'untrusted JSON is always validated'
+    except ValueError: pass
+    with BreakoutIntervention(tb, lazy=True) as intervention:
+        assert intervention.num_bricks_remaining() == nbricks
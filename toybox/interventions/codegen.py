@@ -0,0 +1,263 @@
+from ctoybox import Toybox
+import keyword
+import os
+import numpy as np
+""" Generates intervention classes from the state and config JSON of a game's simulator.
+
+The schemas are read from a live Toybox: its config, and the states of a short, seeded random
+rollout, merged so that optional objects and lists that start out empty are modeled when any
+sampled state has them.
+
+The generated classes are slot-based BaseMixin subclasses with straight-line decode and encode
+functions, and validate their keys against a precomputed set. Objects become classes, lists of
+objects become Collections, and everything else (scalars, lists of scalars, maps, enum variants)
+is kept as plain JSON, as in the hand-written modules.
+
+Usage: python -m toybox.interventions.codegen gridworld [more games...]"""
+
+generated_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated')
+
+# Key sets that are already modeled by toybox.interventions.core
+core_classes = {
+  frozenset(['x', 'y'])           : 'Vec2D',
+  frozenset(['r', 'g', 'b', 'a']) : 'Color'
+}
+
+
+def camel(name):
+  return ''.join([part[:1].upper() + part[1:] for part in name.split('_')])
+
+def singular(name):
+  if name.endswith('ies'): return name[:-3] + 'y'
+  if name.endswith('s') and not name.endswith('ss'): return name[:-1]
+  return name + '_elt'
+
+def is_struct(obj):
+  """Objects with field names become classes; maps (e.g., keyed by tile character) and
+  externally tagged enum variants (a single capitalized key) stay plain JSON."""
+  if not isinstance(obj, dict) or not obj: return False
+  if len(obj) == 1 and list(obj.keys())[0][:1].isupper(): return False
+  return all([k.isidentifier() and not keyword.iskeyword(k) and k != 'intervention' for k in obj.keys()])
+
+def merge(samples):
+  """One JSON value that has every field seen in samples (values of the same field in different states)."""
+  present = [sample for sample in samples if sample is not None]
+  if not present: return None
+  dicts = [sample for sample in present if isinstance(sample, dict)]
+  if len(dicts) == len(present) and all([d.keys() == dicts[0].keys() for d in dicts]) and is_struct(dicts[0]):
+    return { key : merge([d[key] for d in dicts]) for key in dicts[0] }
+  lists = [sample for sample in present if isinstance(sample, list) and sample]
+  if lists and len(lists) == len([sample for sample in present if isinstance(sample, list)]):
+    elts = [elt for sample in lists for elt in sample]
+    if is_struct_list(elts):
+      return [merge(elts)]
+    return lists[0]
+  return present[0]
+
+def is_struct_list(obj):
+  return isinstance(obj, list) and len(obj) > 0 and is_struct(obj[0]) \
+    and all([isinstance(elt, dict) and elt.keys() == obj[0].keys() for elt in obj])
+
+
+class ClassSpec(object):
+
+  def __init__(self, name, fields, collection=None):
+    # fields : list of (key, class name or None for plain JSON)
+    self.name = name
+    self.fields = fields
+    # name of the element class, if this is a Collection
+    self.collection = collection
+
+  def signature(self):
+    return (self.collection, tuple(self.fields))
+
+
+class Generator(object):
+  """Walks a sample JSON blob, collecting one ClassSpec per distinct object shape."""
+
+  def __init__(self):
+    self.specs = []
+    self.names = {}
+    self.collections = set()
+
+  def add(self, spec, parent):
+    if spec.name in self.names:
+      existing = self.names[spec.name]
+      if existing.signature() == spec.signature(): return existing.name
+      spec.name = parent + spec.name
+      return self.add(spec, parent)
+    self.names[spec.name] = spec
+    self.specs.append(spec)
+    return spec.name
+
+  def struct(self, name, obj, parent=''):
+    """Returns the name of the class for obj, generating it (and its children) if needed."""
+    core = core_classes.get(frozenset(obj.keys()))
+    if core: return core
+    fields = []
+    for key in sorted(obj.keys()):
+      fields.append((key, self.field(key, obj[key], name)))
+    return self.add(ClassSpec(name, fields), parent)
+
+  def field(self, key, value, parent):
+    if is_struct(value):
+      return self.struct(camel(key), value, parent)
+    if is_struct_list(value):
+      elt = self.struct(camel(singular(key)), value[0], parent)
+      collection = self.add(ClassSpec(elt + 'Collection', [], collection=elt), parent)
+      self.collections.add(collection)
+      return collection
+    return None
+
+  def emit_class(self, spec):
+    lines = []
+    if spec.collection:
+      lines += [
+        'class %s(Collection):' % spec.name,
+        '',
+        '  def __init__(self, intervention, coll):',
+        '    super().__init__(intervention, coll, %s)' % spec.collection,
+        '']
+      return lines
+    keys = [key for key, _ in spec.fields]
+    lines += [
+      'class %s(BaseMixin):' % spec.name,
+      '',
+      '  expected_keys = %s' % keys,
+      # collections are edited in place, never replaced
+      '  immutable_fields = %s' % (['intervention'] + [key for key, clz in spec.fields if clz in self.collections]),
+      '  __slots__ = %s' % (tuple(['intervention'] + keys),),
+      '  key_set = frozenset(expected_keys)',
+      '',
+      '  def __init__(self, intervention, %s):' % ', '.join(['%s=None' % key for key in keys]),
+      '    self.intervention = intervention']
+    for key, clz in spec.fields:
+      if clz is None:
+        lines.append('    self.%s = %s' % (key, key))
+      else:
+        lines.append('    self.%s = None if %s is None else %s.decode(intervention, %s, %s)' % (key, key, clz, key, clz))
+    lines += [
+      '',
+      '  def decode(intervention, obj, clz):',
+      '    if obj.keys() != %s.key_set:' % spec.name,
+      '      raise ValueError("Keys (%%s) do not match %s (%%s); has the specification changed?" %% (' % spec.name,
+      '        sorted(obj.keys()), sorted(%s.key_set)))' % spec.name,
+      '    return clz(intervention, %s)' % ', '.join(["obj['%s']" % key for key in keys]),
+      '',
+      '  def encode(self):',
+      '    return {']
+    entries = []
+    for key, clz in spec.fields:
+      if clz is None:
+        entries.append("      '%s' : self.%s" % (key, key))
+      else:
+        entries.append("      '%s' : None if self.%s is None else self.%s.encode()" % (key, key, key))
+    lines += [',\n'.join(entries), '    }', '']
+    return lines
+
+  def emit(self, game):
+    lines = [
+      'from toybox.interventions.base import *',
+      'from toybox.interventions.core import *',
+      '"""Generated by toybox.interventions.codegen from the %s simulator; do not edit by hand."""' % game,
+      '', '']
+    for spec in self.specs:
+      lines += self.emit_class(spec) + ['']
+    return '\n'.join(lines)
+
+
+def generate(game, state, config):
+  """Returns the source of a module modeling the state and config JSON of game."""
+  generator = Generator()
+  name = camel(game)
+  generator.struct(name, state)
+  generator.struct(name + 'Config', config)
+  source = generator.emit(game)
+  source += '\n'.join([
+    '',
+    'class %sIntervention(Intervention):' % name,
+    '',
+    '  def __init__(self, tb, game_name=\'%s\', lazy=False):' % game,
+    '    # check that the simulation in tb matches the game name.',
+    '    Intervention.__init__(self, tb, game_name, %s, lazy=lazy)' % name,
+    ''])
+  return source
+
+
+def sample(game, ticks=2000, seed=0):
+  """The merged states of a seeded random rollout of game, and its config, from a live Toybox."""
+  rng = np.random.RandomState(seed)
+  with Toybox(game) as tb:
+    tb.set_seed(seed)
+    tb.new_game()
+    config = tb.config_to_json()
+    actions = tb.get_legal_action_set()
+    states = [tb.to_state_json()]
+    for _ in range(ticks):
+      if tb.game_over(): tb.new_game()
+      tb.apply_ale_action(actions[rng.randint(len(actions))])
+      states.append(tb.to_state_json())
+  return merge(states), config
+
+
+def write_module(game):
+  state, config = sample(game)
+  fname = os.path.join(generated_dir, '%s.py' % game)
+  with open(fname, 'w') as outfile:
+    outfile.write(generate(game, state, config))
+  return fname
+
+
+if __name__ == "__main__":
+  import argparse
+  import types
+
+  parser = argparse.ArgumentParser(description='generate intervention classes from default JSON')
+  parser.add_argument('games', nargs='*', default=[])
+  args = parser.parse_args()
+
+  for game in args.games:
+    print('wrote', write_module(game))
+
+  # every game's live state and config round-trip through its generated classes, and commit
+  for game in ['amidar', 'breakout', 'gridworld', 'space_invaders']:
+    state, config = sample(game, ticks=500)
+    module = types.ModuleType('generated_' + game)
+    exec(compile(generate(game, state, config), '<%s>' % game, 'exec'), module.__dict__)
+    root = getattr(module, camel(game))
+    config_root = getattr(module, camel(game) + 'Config')
+    clz = getattr(module, camel(game) + 'Intervention')
+
+    with Toybox(game) as tb:
+      actions = tb.get_legal_action_set()
+      for i in range(50): tb.apply_ale_action(actions[i % len(actions)])
+      live = tb.to_state_json()
+      with clz(tb) as intervention:
+        game_obj = intervention.game
+        assert game_obj.encode() == live
+        assert config_root.decode(intervention, intervention.config, config_root).encode() == tb.config_to_json()
+        # edits are tracked like in the hand-written classes, and committed
+        name = [key for key, value in live.items() if isinstance(value, int) and not isinstance(value, bool)]
+        obj = game_obj if name else getattr(game_obj, 'frame')
+        name = name[0] if name else 'score'
+        setattr(obj, name, getattr(obj, name) + 1)
+        assert intervention.dirty_state
+        try:
+          obj.not_a_field = 1
+          assert False, 'should not be able to add a field'
+        except AttributeError: pass
+      committed = tb.to_state_json()
+      assert (committed if obj is game_obj else committed['frame'])[name] == getattr(obj, name)
+      try:
+        root.decode(intervention, dict(live, not_a_field=1), root)
+        assert False, 'should reject unexpected keys'
+      except ValueError: pass
+
+  # the committed gridworld module is up to date, and works on the simulator
+  state, config = sample('gridworld')
+  with open(os.path.join(generated_dir, 'gridworld.py')) as f:
+    assert f.read() == generate('gridworld', state, config), 'regenerate with: python -m toybox.interventions.codegen gridworld'
+  from toybox.interventions.generated.gridworld import GridworldIntervention
+  with Toybox('gridworld') as tb:
+    with GridworldIntervention(tb) as intervention:
+      assert intervention.game.encode() == tb.to_state_json()
@@ -1,4 +1,7 @@
 from toybox.interventions.base import * 
+from contextlib import contextmanager
+import numbers
+import numpy as np
 
 class Game(BaseMixin):
   """Base class for games. Supertype that contains common elements."""
@@ -41,16 +44,21 @@ class Vec2D(BaseMixin):
 
   expected_keys = ['y', 'x']
   immutable_fields = []
+  __slots__ = ('intervention', 'x', 'y')
 
   def __init__(self, intervention, x, y):
     self.intervention = intervention
     self.x = x
     self.y = y
 
+  def encode(self):
+    return {'x' : self.x, 'y' : self.y}
+
 class Color(BaseMixin):
 
   expected_keys = ['r', 'g', 'b', 'a']
   immutable_fields = []
+  __slots__ = ('intervention', 'r', 'g', 'b', 'a')
   
   def __init__(self, intervention, r, g, b, a):
     self.intervention = intervention
@@ -59,6 +67,9 @@ class Color(BaseMixin):
     self.b = b 
     self.a = a   
 
+  def encode(self):
+    return {'r' : self.r, 'g' : self.g, 'b' : self.b, 'a' : self.a}
+
 
 class Collection(BaseMixin):
 
@@ -69,6 +80,7 @@ class Collection(BaseMixin):
     self.intervention = intervention
     self.elt_clz = elt_clz
     self.coll = [elt_clz.decode(intervention, elt, elt_clz) for elt in coll]
+    for elt in self.coll: self.adopt(elt)
 
   def __iter__(self): return self.coll.__iter__()
 
@@ -76,32 +88,39 @@ class Collection(BaseMixin):
 
   def __len__(self): return self.coll.__len__()
 
+  # Since these don't trigger the superclass' __setattr__, we need to call mark_dirty manually
+
   def append(self, obj):
     assert isinstance(obj, self.elt_clz), '%s must be of type %s' % (obj, self.elt_clz)
     self.coll.append(obj)
-    # Since this doesn't trigger the superclass' __setattr__, we need to     sdirty_state manuall
-    self.intervention.dirty_state = True
+    self.adopt(obj)
+    self.mark_dirty()
 
   def extend(self, obj):
     self.coll.extend(obj)
-    self.intervention.dirty_state = True
+    for elt in obj: self.adopt(elt)
+    self.mark_dirty()
 
   def insert(self, i, x):
     self.coll.insert(i, x)
-    self.intervention.dirty_state = True
+    self.adopt(x)
+    self.mark_dirty()
 
   def remove(self, obj):
     self.coll.remove(obj)
-    # Since this doesn't trigger the superclass' __setattr__, we need to setdirty_state manuall
-    self.intervention.dirty_state = True
+    self.mark_dirty()
+
+  def __delitem__(self, key):
+    self.coll.__delitem__(key)
+    self.mark_dirty()
 
   def pop(self, i=-1):
-    self.intervention.dirty_state = True
+    self.mark_dirty()
     return self.coll.pop(i)
 
   def clear(self):
     self.coll.clear()
-    self.intervention.dirty_state = True
+    self.mark_dirty()
 
   def index(self, x, *args):
     return self.coll.index(x, *args)
@@ -110,11 +129,11 @@ class Collection(BaseMixin):
     return self.coll.count(x)
 
   def sort(self, key=None, reverse=False):
-    self.intervention.dirty_state = True
+    self.mark_dirty()
     self.coll.sort(key=key, reverse=reverse)
 
   def reverse(self):
-    self.intervention.dirty_state = True
+    self.mark_dirty()
     self.coll.reverse()
 
   def copy(self):
@@ -128,15 +147,70 @@ class Collection(BaseMixin):
 
 
 class SpriteData(BaseMixin):
+  """A sprite (e.g., a Space Invaders shield) whose pixels are an (h, w, 4) uint8 array of r, g, b, a.
+  
+  The array is read-only; edit it through erase, stamp or edit, which record the change."""
   
   expected_keys = ['x', 'y', 'data']
   immutable_fields = ['intervention', 'data']
+  channels = ['r', 'g', 'b', 'a']
 
   def __init__(self, intervention, x=None, y=None, data=None):
     self.intervention = intervention
     self.x = x
     self.y = y
-    self.data = ColorCollectionCollection.decode(intervention, data, None)
+    pixels = [[[c['r'], c['g'], c['b'], c['a']] for c in row] for row in data]
+    self.data = np.array(pixels, dtype=np.uint8).reshape(len(pixels), len(pixels[0]) if pixels else 0, 4)
+    self.data.flags.writeable = False
+
+  @contextmanager
+  def edit(self, rows=slice(None), cols=slice(None)):
+    """Yields a writeable array of the selected pixels; the sprite is marked dirty on exit.
+
+    rows and cols are ints, slices, or integer or boolean index arrays; arrays select every 
+    (row, col) pair, like np.ix_. Slices and ints yield a view; the pixels that arrays select 
+    are copied out, and written back on exit."""
+    self.data.flags.writeable = True
+    try:
+      if all([isinstance(i, (slice, numbers.Integral)) for i in (rows, cols)]):
+        yield self.data[rows, cols]
+      else:
+        key = np.ix_(*[np.arange(n)[i] if isinstance(i, slice) else np.atleast_1d(i) 
+                       for i, n in zip((rows, cols), self.data.shape)])
+        pixels = self.data[key]
+        yield pixels
+        self.data[key] = pixels
+    finally:
+      self.data.flags.writeable = False
+      self.mark_dirty()
+
+  def erase(self, rows=slice(None), cols=slice(None)):
+    """Clears the selected pixels, e.g., to knock a hole through a shield."""
+    with self.edit(rows, cols) as pixels:
+      pixels[...] = 0
+
+  def stamp(self, pattern, row=0, col=0):
+    """Applies pattern with its top left corner at (row, col). 
+    
+    A 2D boolean pattern clears the pixels where it is True (damage); an (h, w, 4) pattern is copied in."""
+    pattern = np.asarray(pattern)
+    h, w = pattern.shape[:2]
+    with self.edit(slice(row, row + h), slice(col, col + w)) as pixels:
+      if pattern.ndim == 2:
+        pixels[pattern] = 0
+      else:
+        pixels[...] = pattern
+
+  def num_visible(self):
+    """Returns the number of pixels that are not fully transparent."""
+    return int(np.count_nonzero(self.data[:, :, 3]))
+
+  def encode(self):
+    return {
+      'x'    : self.x,
+      'y'    : self.y,
+      'data' : [[dict(zip(SpriteData.channels, pixel)) for pixel in row] for row in self.data.tolist()]
+    }
 
 
 class ColorCollectionCollection(BaseMixin):
@@ -149,6 +223,7 @@ class ColorCollectionCollection(BaseMixin):
     self.coll = []
     for coll in sprites:
       self.coll.append([Color.decode(intervention, datum, Color) for datum in coll])
+      for color in self.coll[-1]: self.adopt(color)
 
   def decode(intervention, coll, clz):
     return ColorCollectionCollection(intervention, coll)
@@ -0,0 +1,171 @@
+from toybox.interventions.base import *
+from toybox.interventions.core import *
+"""Generated by toybox.interventions.codegen from the gridworld simulator; do not edit by hand."""
+
+
+class Config(BaseMixin):
+
+  expected_keys = ['diagonal_support', 'grid', 'player_color', 'player_start', 'reward_becomes', 'tiles']
+  immutable_fields = ['intervention']
+  __slots__ = ('intervention', 'diagonal_support', 'grid', 'player_color', 'player_start', 'reward_becomes', 'tiles')
+  key_set = frozenset(expected_keys)
+
+  def __init__(self, intervention, diagonal_support=None, grid=None, player_color=None, player_start=None, reward_becomes=None, tiles=None):
+    self.intervention = intervention
+    self.diagonal_support = diagonal_support
+    self.grid = grid
+    self.player_color = None if player_color is None else Color.decode(intervention, player_color, Color)
+    self.player_start = player_start
+    self.reward_becomes = reward_becomes
+    self.tiles = tiles
+
+  def decode(intervention, obj, clz):
+    if obj.keys() != Config.key_set:
+      raise ValueError("Keys (%s) do not match Config (%s); has the specification changed?" % (
+        sorted(obj.keys()), sorted(Config.key_set)))
+    return clz(intervention, obj['diagonal_support'], obj['grid'], obj['player_color'], obj['player_start'], obj['reward_becomes'], obj['tiles'])
+
+  def encode(self):
+    return {
+      'diagonal_support' : self.diagonal_support,
+      'grid' : self.grid,
+      'player_color' : None if self.player_color is None else self.player_color.encode(),
+      'player_start' : self.player_start,
+      'reward_becomes' : self.reward_becomes,
+      'tiles' : self.tiles
+    }
+
+
+class Tile(BaseMixin):
+
+  expected_keys = ['color', 'reward', 'terminal', 'walkable']
+  immutable_fields = ['intervention']
+  __slots__ = ('intervention', 'color', 'reward', 'terminal', 'walkable')
+  key_set = frozenset(expected_keys)
+
+  def __init__(self, intervention, color=None, reward=None, terminal=None, walkable=None):
+    self.intervention = intervention
+    self.color = None if color is None else Color.decode(intervention, color, Color)
+    self.reward = reward
+    self.terminal = terminal
+    self.walkable = walkable
+
+  def decode(intervention, obj, clz):
+    if obj.keys() != Tile.key_set:
+      raise ValueError("Keys (%s) do not match Tile (%s); has the specification changed?" % (
+        sorted(obj.keys()), sorted(Tile.key_set)))
+    return clz(intervention, obj['color'], obj['reward'], obj['terminal'], obj['walkable'])
+
+  def encode(self):
+    return {
+      'color' : None if self.color is None else self.color.encode(),
+      'reward' : self.reward,
+      'terminal' : self.terminal,
+      'walkable' : self.walkable
+    }
+
+
+class TileCollection(Collection):
+
+  def __init__(self, intervention, coll):
+    super().__init__(intervention, coll, Tile)
+
+
+class Frame(BaseMixin):
+
+  expected_keys = ['game_over', 'grid', 'player', 'reward_becomes', 'score', 'step', 'tiles']
+  immutable_fields = ['intervention', 'tiles']
+  __slots__ = ('intervention', 'game_over', 'grid', 'player', 'reward_becomes', 'score', 'step', 'tiles')
+  key_set = frozenset(expected_keys)
+
+  def __init__(self, intervention, game_over=None, grid=None, player=None, reward_becomes=None, score=None, step=None, tiles=None):
+    self.intervention = intervention
+    self.game_over = game_over
+    self.grid = grid
+    self.player = player
+    self.reward_becomes = reward_becomes
+    self.score = score
+    self.step = step
+    self.tiles = None if tiles is None else TileCollection.decode(intervention, tiles, TileCollection)
+
+  def decode(intervention, obj, clz):
+    if obj.keys() != Frame.key_set:
+      raise ValueError("Keys (%s) do not match Frame (%s); has the specification changed?" % (
+        sorted(obj.keys()), sorted(Frame.key_set)))
+    return clz(intervention, obj['game_over'], obj['grid'], obj['player'], obj['reward_becomes'], obj['score'], obj['step'], obj['tiles'])
+
+  def encode(self):
+    return {
+      'game_over' : self.game_over,
+      'grid' : self.grid,
+      'player' : self.player,
+      'reward_becomes' : self.reward_becomes,
+      'score' : self.score,
+      'step' : self.step,
+      'tiles' : None if self.tiles is None else self.tiles.encode()
+    }
+
+
+class Gridworld(BaseMixin):
+
+  expected_keys = ['config', 'frame']
+  immutable_fields = ['intervention']
+  __slots__ = ('intervention', 'config', 'frame')
+  key_set = frozenset(expected_keys)
+
+  def __init__(self, intervention, config=None, frame=None):
+    self.intervention = intervention
+    self.config = None if config is None else Config.decode(intervention, config, Config)
+    self.frame = None if frame is None else Frame.decode(intervention, frame, Frame)
+
+  def decode(intervention, obj, clz):
+    if obj.keys() != Gridworld.key_set:
+      raise ValueError("Keys (%s) do not match Gridworld (%s); has the specification changed?" % (
+        sorted(obj.keys()), sorted(Gridworld.key_set)))
+    return clz(intervention, obj['config'], obj['frame'])
+
+  def encode(self):
+    return {
+      'config' : None if self.config is None else self.config.encode(),
+      'frame' : None if self.frame is None else self.frame.encode()
+    }
+
+
+class GridworldConfig(BaseMixin):
+
+  expected_keys = ['diagonal_support', 'grid', 'player_color', 'player_start', 'reward_becomes', 'tiles']
+  immutable_fields = ['intervention']
+  __slots__ = ('intervention', 'diagonal_support', 'grid', 'player_color', 'player_start', 'reward_becomes', 'tiles')
+  key_set = frozenset(expected_keys)
+
+  def __init__(self, intervention, diagonal_support=None, grid=None, player_color=None, player_start=None, reward_becomes=None, tiles=None):
+    self.intervention = intervention
+    self.diagonal_support = diagonal_support
+    self.grid = grid
+    self.player_color = None if player_color is None else Color.decode(intervention, player_color, Color)
+    self.player_start = player_start
+    self.reward_becomes = reward_becomes
+    self.tiles = tiles
+
+  def decode(intervention, obj, clz):
+    if obj.keys() != GridworldConfig.key_set:
+      raise ValueError("Keys (%s) do not match GridworldConfig (%s); has the specification changed?" % (
+        sorted(obj.keys()), sorted(GridworldConfig.key_set)))
+    return clz(intervention, obj['diagonal_support'], obj['grid'], obj['player_color'], obj['player_start'], obj['reward_becomes'], obj['tiles'])
+
+  def encode(self):
+    return {
+      'diagonal_support' : self.diagonal_support,
+      'grid' : self.grid,
+      'player_color' : None if self.player_color is None else self.player_color.encode(),
+      'player_start' : self.player_start,
+      'reward_becomes' : self.reward_becomes,
+      'tiles' : self.tiles
+    }
+
+
+class GridworldIntervention(Intervention):
+
+  def __init__(self, tb, game_name='gridworld', lazy=False):
+    # check that the simulation in tb matches the game name.
+    Intervention.__init__(self, tb, game_name, Gridworld, lazy=lazy)
@@ -16,8 +16,8 @@ class SpaceInvaders(Game):
         super().__init__(intervention, score, lives, rand, level)
         self.ship               =               Player.decode(intervention, ship,             Player)
         self.ship_laser         =                Laser.decode(intervention, ship_laser,       Laser) if ship_laser else None
-        self.shields            = SpriteDataCollection.decode(intervention, shields,          SpriteDataCollection)
-        self.enemies            =      EnemyCollection.decode(intervention, enemies,          EnemyCollection)
+        self.shields            =                 Lazy.decode(intervention, shields,          SpriteDataCollection)
+        self.enemies            =                 Lazy.decode(intervention, enemies,          EnemyCollection)
         self.enemies_movement  = EnemiesMovementState.decode(intervention, enemies_movement, EnemiesMovementState)
         self.enemy_lasers       =      LaserCollection.decode(intervention, enemy_lasers,     LaserCollection)
         self.ufo                =                  Ufo.decode(intervention, ufo,              Ufo)
@@ -142,9 +142,9 @@ class EnemiesMovementState(BaseMixin):
 
 class SpaceInvadersIntervention(Intervention):
 
-    def __init__(self, tb, game_name='space_invaders'):
+    def __init__(self, tb, game_name='space_invaders', lazy=False):
         # check that the simulation in tb matches the game name.
-        Intervention.__init__(self, tb, game_name, SpaceInvaders)
+        Intervention.__init__(self, tb, game_name, SpaceInvaders, lazy=lazy)
 
     def get_jitter(self): 
         return self.config['jitter']
@@ -183,3 +183,46 @@ if __name__ == "__main__":
     with SpaceInvadersIntervention(tb) as intervention:
         intervention.game.lives = 1 
         assert intervention.dirty_state
+
+    # shields are pixel arrays; edits are committed and everything else is re-emitted as read
+    with SpaceInvadersIntervention(tb) as intervention:
+        shield = intervention.game.shields[0]
+        assert shield.data.dtype == np.uint8 and shield.data.shape[2] == 4
+        assert shield.encode() == state['shields'][0]
+        visible = shield.num_visible()
+        h, w = shield.data.shape[:2]
+        try:
+            shield.data[0, 0] = 0
+            assert False, 'shield pixels should only change through edits'
+        except ValueError: pass
+        assert not intervention.dirty_state
+        shield.erase(slice(0, h // 2), slice(0, w // 2))
+        assert intervention.dirty_state
+    with SpaceInvadersIntervention(tb) as intervention:
+        shields = intervention.game.shields
+        assert shields[0].num_visible() < visible
+        assert not shields[0].data[:h // 2, :w // 2].any()
+        assert shields[1].num_visible() == visible
+        damage = np.zeros((h, w), dtype=bool)
+        damage[:, ::2] = True
+        shields[1].stamp(damage)
+        shields[2].stamp(shields[2].data[:2, :2].copy() * 0, row=h - 2, col=w - 2)
+    with SpaceInvadersIntervention(tb) as intervention:
+        shields = intervention.game.shields
+        assert not shields[1].data[:, ::2].any()
+        assert shields[1].data[:, 1::2].any()
+        assert not shields[2].data[h - 2:, w - 2:].any()
+
+    # index arrays select every (row, col) pair, and the edit is written back
+    with SpaceInvadersIntervention(tb) as intervention:
+        shield = intervention.game.shields[2]
+        original = shield.data.copy()
+        shield.erase([0, 2], np.array([1, 3]))
+        shield.erase(np.arange(h) == h - 1, slice(0, 2))
+    with SpaceInvadersIntervention(tb) as intervention:
+        shield = intervention.game.shields[2]
+        erased = np.zeros((h, w), dtype=bool)
+        erased[np.ix_([0, 2], [1, 3])] = True
+        erased[h - 1, :2] = True
+        assert original[erased].any() and not shield.data[erased].any()
+        assert (shield.data[~erased] == original[~erased]).all()
@@ -0,0 +1,223 @@
+""" Counterfactual rollouts: from one base state, apply each of many interventions and roll a policy forward.
+
+Branches are fanned out over a process pool. Each worker holds its own Toybox and restores the
+base config and state (as raw JSON bytes) before every branch; results stream back as branches finish.
+
+Interventions and policies are sent to the workers, so they must be picklable: module-level
+functions, functools.partial objects, or instances of module-level classes."""
+
+from toybox import codec
+from ctoybox import Toybox
+from collections import namedtuple
+import importlib
+import multiprocessing
+import numpy as np
+
+
+# score, lives and level of the final state; state is its JSON bytes, if requested
+RolloutResult = namedtuple('RolloutResult', ['index', 'score', 'lives', 'level', 'ticks', 'game_over', 'state'])
+
+
+def intervention_class(game_name):
+  """Returns the Intervention subclass for the game, e.g., BreakoutIntervention for 'breakout'."""
+  module = importlib.import_module('toybox.interventions.%s' % game_name)
+  name = ''.join([part.capitalize() for part in game_name.split('_')]) + 'Intervention'
+  return getattr(module, name)
+
+
+class NoopPolicy(object):
+  """Always takes the first legal action."""
+
+  def __call__(self, tb):
+    return tb.get_legal_action_set()[0]
+
+
+class RandomPolicy(object):
+  """Takes uniformly random legal actions; reseeded before each branch, so branches are reproducible."""
+
+  def __init__(self, seed=0):
+    self.seed = seed
+    self.rng = None
+
+  def reset(self, index):
+    self.rng = np.random.RandomState([self.seed, index])
+
+  def __call__(self, tb):
+    actions = tb.get_legal_action_set()
+    return actions[self.rng.randint(len(actions))]
+
+
+class RolloutWorker(object):
+  """Runs branches from a base config and state on its own Toybox."""
+
+  def __init__(self, game_name, base, config, policy, keep_states=False):
+    self.toybox = Toybox(game_name)
+    self.clz = intervention_class(game_name)
+    self.base = base
+    self.config = config
+    self.policy = policy
+    self.keep_states = keep_states
+
+  def run(self, task):
+    index, intervention, ticks = task
+    tb = self.toybox
+    # Branches may edit the config, so it is restored too; the state is replaced next, so 
+    # there is no new game to start
+    codec.write_config(tb, self.config, new_game=False)
+    codec.write_state(tb, self.base)
+    if intervention is not None:
+      with self.clz(tb) as iv:
+        intervention(iv)
+    if hasattr(self.policy, 'reset'):
+      self.policy.reset(index)
+    tick = 0
+    while tick < ticks and not tb.game_over():
+      tb.apply_ale_action(self.policy(tb))
+      tick += 1
+    state = codec.state_bytes(tb) if self.keep_states else None
+    return RolloutResult(index, tb.get_score(), tb.get_lives(), tb.get_level(), tick, tb.game_over(), state)
+
+
+# The RolloutWorker of a pool process
+_worker = None
+
+def _init_worker(game_name, base, config, policy, keep_states):
+  global _worker
+  _worker = RolloutWorker(game_name, base, config, policy, keep_states)
+
+def _run(task):
+  return _worker.run(task)
+
+
+class RolloutEngine(object):
+  """Fans out intervention branches from a base state over a process pool.
+
+  >>> engine = RolloutEngine('breakout', RandomPolicy(seed=1))
+  >>> for result in engine.rollouts(tb, [partial(add_channel, i) for i in range(18)], ticks=500):
+  ...   print(result.index, result.score)
+  """
+
+  def __init__(self, game_name, policy=None, processes=None, keep_states=False, chunksize=1):
+    """
+    Parameters
+    ---
+    game_name : str
+    policy : callable
+      Maps a Toybox to the ALE action to take; NoopPolicy by default
+    processes : int
+      Number of worker processes; None uses every core, and 0 runs the branches in this process
+    keep_states : bool
+      Whether results carry the final state, as JSON bytes
+    """
+    self.game_name = game_name
+    self.policy = policy or NoopPolicy()
+    self.processes = processes
+    self.keep_states = keep_states
+    self.chunksize = chunksize
+
+  def rollouts(self, base, interventions, ticks, config=None):
+    """Yields a RolloutResult per intervention, in the order the branches finish.
+
+    Parameters
+    ---
+    base : Toybox, dict, str or bytes
+      The state every branch starts from; a Toybox's config and state are snapshotted when 
+      this is called
+    interventions : list
+      Callables that take an entered Intervention (e.g., lambda iv: iv.add_channel(3), if
+      processes=0) and mutate it; None runs the policy from the unmodified base state
+    ticks : int
+      Maximum number of actions per branch; a branch also stops when the game is over
+    config : dict, str or bytes
+      The config every branch starts from; by default, the base Toybox's, or the game's 
+      default config if base is JSON
+    """
+    if isinstance(base, Toybox):
+      assert base.game_name == self.game_name
+      if config is None:
+        config = codec.config_bytes(base)
+      base = codec.state_bytes(base)
+    elif isinstance(base, dict):
+      base = codec.dumps_bytes(base)
+    if config is None:
+      with Toybox(self.game_name) as tb:
+        config = codec.config_bytes(tb)
+    elif isinstance(config, dict):
+      config = codec.dumps_bytes(config)
+    tasks = [(i, intervention, ticks) for i, intervention in enumerate(interventions)]
+
+    if self.processes == 0:
+      worker = RolloutWorker(self.game_name, base, config, self.policy, self.keep_states)
+      for task in tasks:
+        yield worker.run(task)
+      return
+
+    initargs = (self.game_name, base, config, self.policy, self.keep_states)
+    with multiprocessing.Pool(self.processes, _init_worker, initargs) as pool:
+      for result in pool.imap_unordered(_run, tasks, self.chunksize):
+        yield result
+
+  def run(self, base, interventions, ticks, config=None):
+    """Like rollouts, but returns every result, ordered like the interventions."""
+    return sorted(self.rollouts(base, interventions, ticks, config), key=lambda result: result.index)
+
+
+def _clear_board(iv): iv.clear_board()
+
+def _add_channel(i, iv): iv.add_channel(i)
+
+def _edit_config(start_lives, iv):
+  # Checks that the branch starts from the base config, then edits it for this branch only
+  assert iv.config['start_lives'] == start_lives
+  iv.config['start_lives'] = 1
+  iv.dirty_config = True
+
+
+if __name__ == "__main__":
+  from functools import partial
+  import time
+
+  with Toybox('breakout') as tb:
+    for _ in range(10): tb.apply_ale_action(tb.get_legal_action_set()[0])
+    base = codec.state_bytes(tb)
+    interventions = [None, _clear_board] + [partial(_add_channel, i) for i in range(6)]
+
+    serial = RolloutEngine('breakout', RandomPolicy(seed=3), processes=0, keep_states=True).run(tb, interventions, ticks=200)
+    assert [r.index for r in serial] == list(range(len(interventions)))
+    # the base toybox is not touched
+    assert codec.state_bytes(tb) == base
+
+    parallel = RolloutEngine('breakout', RandomPolicy(seed=3), processes=2, keep_states=True).run(base, interventions, ticks=200)
+    # branches are reproducible, wherever they run
+    assert [(r.score, r.lives, r.ticks) for r in serial] == [(r.score, r.lives, r.ticks) for r in parallel]
+    assert [codec.loads(r.state)['score'] for r in parallel] == [r.score for r in parallel]
+
+    # the intervention was applied in its branch
+    cleared = codec.loads(serial[1].state)
+    assert not any([brick['alive'] for brick in cleared['bricks']])
+
+    # one branch, with no intervention, rolls forward like the base toybox does
+    policy = RandomPolicy(seed=3)
+    policy.reset(0)
+    for tick in range(200):
+      if tb.game_over(): break
+      tb.apply_ale_action(policy(tb))
+    assert codec.loads(codec.state_bytes(tb)) == codec.loads(serial[0].state)
+
+    # branches start from the base config, even after an earlier branch edited theirs
+    config = tb.config_to_json()
+    config['start_lives'] = 7
+    codec.write_config(tb, config)
+    for _ in range(10): tb.apply_ale_action(tb.get_legal_action_set()[0])
+    edits = [partial(_edit_config, 7)] * 4
+    for engine in [RolloutEngine('breakout', processes=0), RolloutEngine('breakout', processes=1)]:
+      assert len(engine.run(tb, edits, ticks=10)) == 4
+      assert len(engine.run(codec.state_bytes(tb), edits, ticks=10, config=config)) == 4
+    assert codec.config_json(tb)['start_lives'] == 7
+
+    start = time.time()
+    RolloutEngine('breakout', RandomPolicy(), processes=0).run(base, [None] * 16, ticks=500)
+    serial_time = time.time() - start
+    start = time.time()
+    RolloutEngine('breakout', RandomPolicy()).run(base, [None] * 16, ticks=500)
+    print('16 branches x 500 ticks: %.2fs serial, %.2fs on %d processes' % (serial_time, time.time() - start, multiprocessing.cpu_count()))
@@ -1,6 +1,16 @@
 import toybox.testing.behavior as behavior
 import toybox.testing.envs.gym as gym
 import toybox.testing.models.openai_baselines as oai
+from toybox.testing.statebank import StateBank
+import os
+
+
+def open_state_bank(game_name):
+  # Set TOYBOX_STATE_BANK to a directory to reuse intervened start states across runs
+  bank_dir = os.environ.get('TOYBOX_STATE_BANK')
+  if not bank_dir: return None
+  os.makedirs(bank_dir, exist_ok=True)
+  return StateBank(os.path.join(bank_dir, game_name + '.tbx'), game_name)
 
 
 class ToyboxTestBase(behavior.BehavioralFixture):
@@ -8,6 +18,9 @@ class ToyboxTestBase(behavior.BehavioralFixture):
     @classmethod
     def tearDownEnv(cls):
       gym.tearDownToyboxGym(cls)
+      if cls.state_bank is not None:
+        cls.state_bank.close()
+        cls.state_bank = None
 
     def takeAction(self, model):
       oai.takeAction(self, model)
@@ -38,6 +51,7 @@ class AmidarToyboxTestBase(ToyboxTestBase):
     def setUpEnv(cls):
       seed = 0xdeadbeef
       gym.setUpToyboxGym(cls, 'AmidarToyboxNoFrameskip-v4', seed)
+      cls.state_bank = open_state_bank('amidar')
 
 class BreakoutToyboxTestBase(ToyboxTestBase):
     
@@ -45,10 +59,12 @@ class BreakoutToyboxTestBase(ToyboxTestBase):
     def setUpEnv(cls):
         seed = 8675309
         gym.setUpToyboxGym(cls, 'BreakoutToyboxNoFrameskip-v4', seed)
+        cls.state_bank = open_state_bank('breakout')
 
 class SpaceInvadersToyboxTestBase(ToyboxTestBase):
 
     @classmethod
     def setUpEnv(cls):
       seed = 42
-      gym.setUpToyboxGym(cls, 'SpaceInvadersToyboxNoFrameskip-v4', seed)
\ No newline at end of file
+      gym.setUpToyboxGym(cls, 'SpaceInvadersToyboxNoFrameskip-v4', seed)
+      cls.state_bank = open_state_bank('space_invaders')
\ No newline at end of file
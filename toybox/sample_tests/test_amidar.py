@@ -13,7 +13,9 @@ from toybox.sample_tests.base import AmidarToyboxTestBase
 
 
 def generate_random_dir(intervention):
-    return ami.Direction(intervention, ami.Direction.directions[random.randint(0, 3)])
+    # Drawn from the same generator as the placements, so a seeded scenario is reproducible
+    directions = ami.Direction.directions
+    return ami.Direction(intervention, directions[intervention.placement_rng().integers(len(directions))])
 
 
 class EnemyRemovalTest(AmidarToyboxTestBase):
@@ -25,9 +27,7 @@ class EnemyRemovalTest(AmidarToyboxTestBase):
     def onTrialEnd(self):
       self.assertIsNotNone(self.final_state)
       game = ami.Amidar.decode(self, self.final_state, ami.Amidar)
-      painted = sum([
-          sum([int(tile.tag == ami.Tile.Painted) for tile in row])\
-               for row in game.board.tiles]) 
+      painted = game.board.tiles.tag_count(ami.Tile.Painted)
       print('painted:', painted, 'score', game.score)
       self.assertGreaterEqual(painted, 10)
       return {'painted': painted, 'score' : game.score}
@@ -70,9 +70,7 @@ class OneEnemyTargetTest(AmidarToyboxTestBase):
     def onTrialEnd(self):
       self.assertIsNotNone(self.final_state)
       game = ami.Amidar.decode(self, self.final_state, ami.Amidar)
-      painted = sum([
-          sum([int(tile.tag == ami.Tile.Painted) for tile in row])\
-               for row in game.board.tiles]) 
+      painted = game.board.tiles.tag_count(ami.Tile.Painted)
       print('painted:', painted, 'score', game.score)
       self.assertGreaterEqual(painted, 10)
       return {'painted': painted, 'score' : game.score}
@@ -120,9 +118,7 @@ class GangUpNoJumpRandomTest(AmidarToyboxTestBase):
     def onTrialEnd(self):
       self.assertIsNotNone(self.final_state)
       game = ami.Amidar.decode(self, self.final_state, ami.Amidar)
-      painted = sum([
-          sum([int(tile.tag == ami.Tile.Painted) for tile in row])\
-               for row in game.board.tiles]) 
+      painted = game.board.tiles.tag_count(ami.Tile.Painted)
       print('painted:', painted, 'score', game.score)
       self.assertGreaterEqual(painted, 10)
       return {'painted': painted, 'score' : game.score}
@@ -140,23 +136,11 @@ class GangUpNoJumpRandomTest(AmidarToyboxTestBase):
         sample_enemy = game.enemies[0] 
         game.enemies.clear()
 
-        player_pos = intervention.worldpoint_to_tilepoint(game.player.position)
-
-        min_distance = 2
-
-        def is_min_distance(t, e):
-            t = intervention.tile_to_tilepoint(t)
-            e = intervention.worldpoint_to_tilepoint(e.position)
-            return abs(t.tx - player_pos.tx) > 2 and \
-                   abs(t.ty - player_pos.ty) > 2 and \
-                   abs(t.tx - e.tx) > 2 and \
-                   abs(t.ty - e.ty) > 2
-
         while num_enemies > 0:
           print('num_enemies:', num_enemies)
           num_enemies -= 1
-          start_tile = intervention.get_random_tile(lambda t: all([is_min_distance(t, e) for e in game.enemies]))
-          start = intervention.tile_to_tilepoint(start_tile)
+          # more than two steps along the track from the player and every enemy placed so far
+          start = intervention.random_placement(min_player_distance=3, min_enemy_distance=3, metric='graph')
           # Set the starting position to be close to the player's 
           # start position. I picked an arbitrary max distance (20)
           start_dir = generate_random_dir(intervention)
@@ -189,9 +173,7 @@ class GangUpNoJumpTargetTest(AmidarToyboxTestBase):
     def onTrialEnd(self):
       self.assertIsNotNone(self.final_state)
       game = ami.Amidar.decode(self, self.final_state, ami.Amidar)
-      painted = sum([
-          sum([int(tile.tag == ami.Tile.Painted) for tile in row])\
-               for row in game.board.tiles]) 
+      painted = game.board.tiles.tag_count(ami.Tile.Painted)
       print('painted:', painted, 'score', game.score)
       self.assertGreaterEqual(painted, 10)
       return {'painted': painted, 'score' : game.score}
@@ -210,11 +192,7 @@ class GangUpNoJumpTargetTest(AmidarToyboxTestBase):
           assert enemy.ai.protocol == ami.MovementAI.EnemyLookupAI
           # Set the starting position to be close to the player's 
           # start position. I picked an arbitrary max distance (20)
-          player_tile = intervention.worldpoint_to_tilepoint(game.player.position)
-          start_tile = intervention.get_random_tile(lambda t: \
-              abs(intervention.tile_to_tilepoint(t).tx - player_tile.tx) < 20 and \
-              abs(intervention.tile_to_tilepoint(t).ty - player_tile.ty) < 20)
-          start = intervention.tile_to_tilepoint(start_tile)
+          start = intervention.random_placement(max_player_distance=19, metric='chebyshev')
           start_dir = generate_random_dir(intervention)
           vision_distance = 5
           dir = generate_random_dir(intervention)
@@ -15,6 +15,8 @@ path = 'models/BreakoutToyboxNoFrameskip-v4.regress.model'
 
 class PolarStarts(BreakoutToyboxTestBase):
 
+    deterministic_intervention = True
+
     def shouldIntervene(self, obj=None): return self.tick==0
 
     def onTestEnd(self): pass
@@ -48,6 +50,8 @@ class PolarStarts(BreakoutToyboxTestBase):
     
 class LastBrick(BreakoutToyboxTestBase):
 
+    deterministic_intervention = True
+
     def shouldIntervene(self, obj=None): return self.tick==0
 
     def onTestEnd(self): pass
@@ -80,6 +84,8 @@ class LastBrick(BreakoutToyboxTestBase):
 
 class EZChannel(BreakoutToyboxTestBase):
 
+    deterministic_intervention = True
+
     def shouldIntervene(self, obj=None):
         return self.tick == 0
 
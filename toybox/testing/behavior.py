@@ -1,9 +1,15 @@
+from toybox import codec
 import time
 import unittest
 from abc import ABC, abstractmethod
 
 class BehavioralFixture(unittest.TestCase, ABC):
 
+  # A toybox.testing.statebank.StateBank. When set, and intervene is a deterministic function of 
+  # the start state and obj, the state it produces is stored, and restored instead of re-running it.
+  state_bank = None
+  deterministic_intervention = False
+
   @classmethod
   def setUpClass(cls):
     cls.setUpEnv()
@@ -54,6 +60,19 @@ class BehavioralFixture(unittest.TestCase, ABC):
   def intervene(self, obj=None):
     assert False
 
+  def applyIntervention(self, obj=None):
+    if self.state_bank is None or not self.deterministic_intervention:
+      return self.intervene(obj=obj)
+    tb = self.getToybox()
+    scenario = '%s.%s.intervene' % (type(self).__module__, type(self).__qualname__)
+    key = self.state_bank.key(tb, scenario, obj)
+    if self.state_bank.restore(tb, key): return
+    # Config changes cannot be banked
+    config = codec.config_bytes(tb)
+    self.intervene(obj=obj)
+    if codec.config_bytes(tb) == config:
+      self.state_bank.add(key, tb, scenario=scenario)
+
   @abstractmethod
   def takeAction(self, model):
     assert False
@@ -77,7 +96,7 @@ class BehavioralFixture(unittest.TestCase, ABC):
         for trial in range(self.trials):
           print('Running trial %d of %s for %s...' % (trial+1, self.trials, obj))
           while not self.isDone():
-            if self.shouldIntervene(obj=obj): self.intervene(obj=obj)
+            if self.shouldIntervene(obj=obj): self.applyIntervention(obj=obj)
             #self.env.render()
             #time.sleep(1/30.)
             self.takeAction(model)
@@ -74,6 +74,8 @@ def setUpToyboxGym(testclass, env_id, seed):
   
     testclass.env = env
     testclass.turtle = get_turtle(env)
+    # Tests read the final state of every game
+    testclass.turtle.capture_final_state = True
     testclass.toybox = testclass.turtle.toybox
 
 def tearDownToyboxGym(testclass):
@@ -84,7 +86,7 @@ def stepEnv(self):
     assert len(done) == 1 and len(info) == 1, 'Running with %d environments; should only be running with one.' % len(done)
 
     if 'cached_state' in info[0]:
-        self.final_state = info[0]['cached_state']
+        self.final_state = info[0]['cached_state'].json()
 
     # There is weird setup stuff -- we don't want to update the done
     # flag until we are actually running the test.
@@ -0,0 +1,206 @@
+from toybox import codec
+from toybox.archive import StateArchive
+from toybox.rollouts import RolloutEngine
+from ctoybox import Toybox
+from functools import partial
+import hashlib
+import importlib.metadata
+import json
+""" Intervened start states for behavioral tests, materialized once and reused across trials and runs.
+
+Each state is stored in a StateArchive under a key that hashes the simulator version, the game,
+the scenario's name, its parameter and the state and config it was applied to, so that a bank
+never serves a state built from a different starting point. Only state changes are banked:
+scenarios that change the config must run every time.
+
+The simulator writes the same state as the same bytes, so the base is hashed as raw JSON,
+except in games whose JSON lists sets in arbitrary order (see unordered_games), which are
+decoded and canonicalized first."""
+
+try:
+  simulator_version = importlib.metadata.version('ctoybox')
+except importlib.metadata.PackageNotFoundError:
+  simulator_version = 'unknown'
+
+
+# Games whose states serialize sets (e.g., Amidar's junctions) in an order that varies between runs
+unordered_games = frozenset(['amidar'])
+
+def scenario_name(scenario):
+  return '%s.%s' % (scenario.__module__, getattr(scenario, '__qualname__', type(scenario).__name__))
+
+def param_key(param):
+  """A stable string for a scenario parameter; game objects (e.g., a Brick) are keyed by their JSON."""
+  if hasattr(param, 'encode') and not isinstance(param, str):
+    param = param.encode()
+  return json.dumps(param, sort_keys=True, default=str)
+
+
+class StateBank(object):
+  """
+  >>> bank = StateBank('breakout_channels.tbx', 'breakout')
+  >>> bank.materialize(tb, add_channel, range(18), processes=4)
+  >>> bank.restore(tb, bank.key(tb, add_channel, 3))
+  """
+
+  def __init__(self, path, game_name):
+    self.game_name = game_name
+    self.archive = StateArchive(path, 'a')
+    # key -> position in the archive
+    self.positions = {}
+    for i in range(len(self.archive)):
+      self.positions[self.archive.metadata(i)['key']] = i
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self): return len(self.positions)
+
+  def __contains__(self, key): return key in self.positions
+
+  def __enter__(self): return self
+
+  def __exit__(self, exc_type, exc_value, traceback): self.close()
+
+  def base_digest(self, tb):
+    # Hash of the state and config that a scenario would be applied to
+    digest = hashlib.sha1()
+    for blob in [codec.state_bytes(tb), codec.config_bytes(tb)]:
+      if self.game_name in unordered_games:
+        blob = json.dumps(codec.canonical(codec.loads(blob)), sort_keys=True).encode('utf-8')
+      digest.update(blob)
+      digest.update(b'\0')
+    return digest.hexdigest()
+
+  def key(self, tb, scenario, param, base=None):
+    """The key of scenario(param, ...) applied to the current state of tb.
+
+    scenario may be a callable or a name; base is a precomputed base_digest(tb)."""
+    if not isinstance(scenario, str):
+      scenario = scenario_name(scenario)
+    base = base or self.base_digest(tb)
+    parts = [simulator_version, self.game_name, scenario, param_key(param), base]
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+  def add(self, key, tb, **meta):
+    """Stores the current state of tb under key."""
+    if key not in self.positions:
+      self.positions[key] = self.archive.append(tb, key=key, **meta)
+
+  def restore(self, tb, key):
+    """Replaces the state of tb with the banked state, if there is one. Returns whether there was."""
+    i = self.positions.get(key)
+    if i is None:
+      self.misses += 1
+      return False
+    self.hits += 1
+    self.archive.restore(tb, i)
+    return True
+
+  def materialize(self, tb, scenario, params, processes=0):
+    """Banks scenario(param, intervention) applied to the current state of tb, for every param not already banked.
+
+    scenario takes a parameter and an entered Intervention, like the interventions of a RolloutEngine; to run
+    in worker processes (processes != 0), it must be picklable. tb is not changed. Returns the keys, in order.
+
+    Scenarios run on fresh Toyboxes, so tb must have the game's default config."""
+    with Toybox(self.game_name) as fresh:
+      if codec.config_json(fresh) != codec.config_json(tb):
+        raise ValueError('materialize needs the default %s config; use add for other configs' % self.game_name)
+    base = self.base_digest(tb)
+    keys = [self.key(tb, scenario, param, base=base) for param in params]
+    missing = [i for i, key in enumerate(keys) if key not in self.positions]
+    self.hits += len(keys) - len(missing)
+    self.misses += len(missing)
+    if missing:
+      engine = RolloutEngine(self.game_name, processes=processes, keep_states=True)
+      interventions = [partial(scenario, params[i]) for i in missing]
+      for result in engine.rollouts(tb, interventions, ticks=0):
+        i = missing[result.index]
+        self.positions[keys[i]] = self.archive.append(result.state, game=self.game_name, key=keys[i],
+          scenario=scenario_name(scenario), param=param_key(params[i]))
+    return keys
+
+  def stats(self):
+    return {'states' : len(self.positions), 'hits' : self.hits, 'misses' : self.misses}
+
+  def close(self):
+    self.archive.close()
+
+
+def _add_channel(col, intervention): intervention.add_channel(col)
+
+
+if __name__ == "__main__":
+  import os
+  import tempfile
+  from toybox.interventions.breakout import BreakoutIntervention
+
+  with tempfile.TemporaryDirectory() as tmp, Toybox('breakout') as tb:
+    path = os.path.join(tmp, 'bank.tbx')
+    base = codec.state_bytes(tb)
+    with StateBank(path, 'breakout') as bank:
+      keys = bank.materialize(tb, _add_channel, list(range(4)), processes=2)
+      assert len(bank) == 4 and bank.stats()['misses'] == 4
+      assert codec.state_bytes(tb) == base
+
+      # banked states match running the scenario
+      for col, key in enumerate(keys):
+        assert bank.restore(tb, key)
+        with BreakoutIntervention(tb) as intervention:
+          assert intervention.channel_count() == 1
+          assert intervention.find_channel()[0] == col
+        codec.write_state(tb, base)
+
+      # keys depend on the base state
+      actions = tb.get_legal_action_set()
+      for i in range(20): tb.apply_ale_action(actions[i % len(actions)])
+      assert bank.key(tb, _add_channel, 0) != keys[0]
+      codec.write_state(tb, base)
+      assert bank.key(tb, _add_channel, 0) == keys[0]
+
+    # a second run finds everything in the bank
+    with StateBank(path, 'breakout') as bank:
+      assert bank.materialize(tb, _add_channel, list(range(4))) == keys
+      assert bank.stats() == {'states' : 4, 'hits' : 4, 'misses' : 0}
+      key = bank.key(tb, 'clear_board', None)
+      assert not bank.restore(tb, key)
+      with BreakoutIntervention(tb) as intervention:
+        intervention.clear_board()
+      bank.add(key, tb)
+    with StateBank(path, 'breakout') as bank:
+      codec.write_state(tb, base)
+      assert bank.restore(tb, key)
+      with BreakoutIntervention(tb) as intervention:
+        assert intervention.num_bricks_remaining() == 0
+
+    # amidar states are keyed by their content, whatever order the simulator lists junctions in
+    with Toybox('amidar') as amidar, StateBank(os.path.join(tmp, 'amidar.tbx'), 'amidar') as bank:
+      key = bank.key(amidar, 'noop', None)
+      amidar.write_state_json(amidar.to_state_json())
+      assert bank.key(amidar, 'noop', None) == key
+
+    # a hit (key and restore) is cheaper than running the intervention it replaces
+    import time
+    def add_channel():
+      with BreakoutIntervention(tb) as intervention:
+        intervention.add_channel(3)
+    with StateBank(path, 'breakout') as bank:
+      n = 300
+      codec.write_state(tb, base)
+      key = bank.key(tb, _add_channel, 3)
+      start = time.time()
+      for _ in range(n):
+        codec.write_state(tb, base)
+        add_channel()
+      run_time = time.time() - start
+      start = time.time()
+      for _ in range(n):
+        codec.write_state(tb, base)
+        assert bank.restore(tb, bank.key(tb, _add_channel, 3))
+      bank_time = time.time() - start
+      start = time.time()
+      for _ in range(n): codec.write_state(tb, base)
+      reset_time = time.time() - start
+      run_time, bank_time = (run_time - reset_time) / n, (bank_time - reset_time) / n
+      print('add_channel: %.2fms to run, %.2fms from the bank' % (run_time * 1e3, bank_time * 1e3))
+      assert bank_time < run_time